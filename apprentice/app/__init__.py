@@ -1,10 +1,15 @@
+from concurrent.futures import ThreadPoolExecutor
+
 from config import config
-from elasticsearch import Elasticsearch
 from flask import Flask
 from flask_bootstrap import Bootstrap
 from flask_login import LoginManager
 from flask_sqlalchemy import SQLAlchemy
 
+from .backends import create_search_backend
+from .cache import TTLCache
+from .outbound import OutboundClient
+
 # Flask extensions
 login_manager = LoginManager()
 login_manager.session_protection = "strong"
@@ -31,9 +36,34 @@ def create_app(config_name):
     db.init_app(app)
 
     # Custom init
-    app.elasticsearch = Elasticsearch(
-        [app.config["ELASTICSEARCH_URL"]], retry_on_timeout=True
+    app.elasticsearch = create_search_backend(app.config)
+    app.http_client = OutboundClient(
+        connect_timeout=app.config["OUTBOUND_CONNECT_TIMEOUT"],
+        read_timeout=app.config["OUTBOUND_READ_TIMEOUT"],
+        total_timeout=app.config["OUTBOUND_TOTAL_TIMEOUT"],
+        pool_hosts=app.config["OUTBOUND_POOL_HOSTS"],
+        pool_size=app.config["OUTBOUND_POOL_SIZE"],
+    )
+    app.image_cache = TTLCache(
+        maxsize=app.config["IMAGE_CACHE_SIZE"], ttl=app.config["IMAGE_CACHE_TTL"]
+    )
+    app.recipe_cache = TTLCache(
+        maxsize=app.config["RECIPE_CACHE_SIZE"], ttl=app.config["RECIPE_CACHE_TTL"]
+    )
+    app.search_cache = TTLCache(
+        maxsize=app.config["SEARCH_CACHE_SIZE"], ttl=app.config["SEARCH_CACHE_TTL"]
+    )
+    app.fridge_cache = TTLCache(
+        maxsize=app.config["FRIDGE_CACHE_SIZE"], ttl=app.config["FRIDGE_CACHE_TTL"]
+    )
+    app.ingredient_cache = TTLCache(
+        maxsize=app.config["INGREDIENT_CACHE_SIZE"],
+        ttl=app.config["INGREDIENT_CACHE_TTL"],
+    )
+    app.executor = ThreadPoolExecutor(
+        max_workers=app.config["EXECUTOR_WORKERS"], thread_name_prefix="apprentice"
     )
+    app.autocomplete_index = None  # built lazily, see app/autocomplete.py
 
     # Register application blueprints (routing etc.)
     from .auth import auth as auth_blueprint
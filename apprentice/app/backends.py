@@ -0,0 +1,1070 @@
+import hashlib
+import heapq
+import json
+import math
+import re
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from fnmatch import fnmatch
+from functools import total_ordering
+
+from elasticsearch import Elasticsearch
+from elasticsearch.exceptions import NotFoundError, RequestError, TransportError
+
+# The standard analyzer, near enough: lowercased runs of letters and digits
+TOKEN_RE = re.compile(r"\w+(?:'\w+)*")
+
+# The simple analyzer (completion fields): lowercased runs of letters
+LETTERS_RE = re.compile(r"[^\W\d_]+")
+
+# BM25 parameters, as Elasticsearch's defaults
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# The most terms a fuzzy or prefix query expands to, as Elasticsearch's default
+MAX_EXPANSIONS = 50
+
+# How many hits Elasticsearch counts exactly, unless track_total_hits says
+TRACK_TOTAL_HITS = 10000
+
+# The top-level search body keys MemoryBackend understands
+SEARCH_KEYS = {
+    "_source", "aggregations", "aggs", "from", "query", "search_after", "size",
+    "sort", "suggest", "timeout", "track_total_hits",
+}  # fmt: skip
+
+# Documents are read-only, so they're all at their first version
+VERSION = {"_version": 1, "_seq_no": 0, "_primary_term": 1}
+
+NUMERIC_TYPES = {"byte", "short", "integer", "long"}
+FLOAT_TYPES = {"float", "double", "half_float", "scaled_float"}
+
+# The Painless scripts Recipe and the fridge send, as Python functions. Scripts
+# can't run in-process, so any new script needs adding here too.
+# minimum_should_match scripts, as {source: function(num_terms)}
+MINIMUM_SHOULD_MATCH_SCRIPTS = {
+    "params.num_terms": lambda num_terms: num_terms,
+}
+# script_score scripts, as {source: function(score, document source)}. This one
+# should be identical to COVERAGE_SCRIPT in app/fridge.py
+SCORE_SCRIPTS = {
+    "_score / Math.max(doc['ingredientNames'].size(), 1)": lambda score, source: (
+        score / max(len(as_list(source.get("ingredientNames"))), 1)
+    ),
+}
+
+# The set bit positions of every byte value, for iterating over bitsets
+_BYTE_BITS = [tuple(b for b in range(8) if value >> b & 1) for value in range(256)]
+
+
+def as_list(value):
+    """Return a document field's value(s) as a list (fields can hold either)."""
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+def to_bitset(docnums):
+    """Pack document numbers into a bitset (an int with those bits set)."""
+    docnums = list(docnums)
+    if not docnums:
+        return 0
+    buffer = bytearray(max(docnums) // 8 + 1)
+    for docnum in docnums:
+        buffer[docnum >> 3] |= 1 << (docnum & 7)
+    return int.from_bytes(buffer, "little")
+
+
+def iter_bitset(bits):
+    """Yield the document numbers in a bitset, in ascending order."""
+    for i, byte in enumerate(bits.to_bytes((bits.bit_length() + 7) // 8, "little")):
+        if byte:
+            for bit in _BYTE_BITS[byte]:
+                yield i * 8 + bit
+
+
+def count_bitset(bits):
+    """Return the number of documents in a bitset."""
+    return bin(bits).count("1")
+
+
+def edit_distance(a, b, limit):
+    """Return the edit distance between two strings, counting a transposition
+    of adjacent characters as one edit (as fuzzy queries do).
+
+    Gives up early, returning limit + 1, once the distance must exceed limit.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    before, previous = None, list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i] + [0] * len(b)
+        for j, char_b in enumerate(b, 1):
+            current[j] = min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (char_a != char_b),
+            )
+            if i > 1 and j > 1 and char_a == b[j - 2] and a[i - 2] == char_b:
+                current[j] = min(current[j], before[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        before, previous = previous, current
+    return previous[-1]
+
+
+def auto_fuzziness(term, fuzziness="AUTO"):
+    """Return the edits allowed for a term by a fuzziness setting (e.g. AUTO)."""
+    if str(fuzziness).upper() == "AUTO":
+        return 0 if len(term) < 3 else 1 if len(term) < 6 else 2
+    return int(fuzziness)
+
+
+def analyze(text):
+    """Split text into terms, as the standard analyzer does."""
+    return TOKEN_RE.findall(str(text).lower())
+
+
+def bad_request(reason):
+    """Return the error Elasticsearch would raise for a request it can't run."""
+    error = {"type": "parsing_exception", "reason": reason}
+    return RequestError(400, error["type"], {"error": error, "status": 400})
+
+
+def project(source, includes=None, excludes=None):
+    """Filter a document source to the included (and not excluded) fields."""
+    return {
+        field: value
+        for field, value in source.items()
+        if (includes is None or any(fnmatch(field, p) for p in includes))
+        and not any(fnmatch(field, p) for p in excludes or ())
+    }
+
+
+def source_filter(spec):
+    """Parse a _source spec (bool, field(s) or includes/excludes) into
+    (includes, excludes), or None if no source should be returned."""
+    if spec is False:
+        return None
+    if spec is None or spec is True:
+        return None, None
+    if isinstance(spec, dict):
+        includes = spec.get("includes", spec.get("include"))
+        excludes = spec.get("excludes", spec.get("exclude"))
+        return (
+            None if includes is None else as_list(includes),
+            as_list(excludes),
+        )
+    if isinstance(spec, str):
+        spec = spec.split(",")
+    return list(spec), None
+
+
+def single_field(body):
+    """Split a leaf query body like {"name": "dip"} or {"name": {"value": "dip",
+    ...}} into its field name and options (with the value under "value")."""
+    fields = [key for key in body if key != "boost"]
+    if len(fields) != 1:
+        raise bad_request(f"Expected one field, not {fields}")
+    field = fields[0]
+    options = body[field]
+    if not isinstance(options, dict):
+        options = {"value": options}
+    elif "query" in options:
+        options = dict(options, value=options["query"])
+    return field, options
+
+
+@total_ordering
+class _Descending:
+    """Wraps a sort value so it sorts in descending order."""
+
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+
+class _TextIndex:
+    """An inverted index over an analyzed text field, for BM25 scoring.
+
+    Attributes:
+        postings: {term: {docnum: term frequency}}
+        lengths: The number of terms in the field of each document.
+        terms: The indexed terms, sorted, for prefix and fuzzy expansion.
+    """
+
+    def __init__(self, size):
+        self.postings = {}
+        self.lengths = array("I", [0]) * size
+        self.terms = []
+        self.average_length = 1.0
+        self.documents = 1
+
+    def add(self, docnum, values):
+        for value in values:
+            terms = analyze(value)
+            self.lengths[docnum] += len(terms)
+            for term in terms:
+                postings = self.postings.setdefault(term, {})
+                postings[docnum] = postings.get(docnum, 0) + 1
+
+    def finish(self, documents):
+        """Precompute what scoring needs once every document is added."""
+        self.terms = sorted(self.postings)
+        counted = [length for length in self.lengths if length]
+        self.average_length = sum(counted) / len(counted) if counted else 1.0
+        self.documents = max(len(counted), 1)
+
+    def bm25(self, term, boost=1.0):
+        """Return the BM25 scores of the documents containing a term."""
+        postings = self.postings.get(term, {})
+        idf = math.log(
+            1 + (self.documents - len(postings) + 0.5) / (len(postings) + 0.5)
+        )
+        scores = {}
+        for docnum, frequency in postings.items():
+            norm = 1 - BM25_B + BM25_B * self.lengths[docnum] / self.average_length
+            scores[docnum] = (
+                boost * idf * frequency * (BM25_K1 + 1) / (frequency + BM25_K1 * norm)
+            )
+        return scores
+
+    def prefixed(self, prefix, limit=MAX_EXPANSIONS):
+        """Return the (first limit) indexed terms starting with a prefix."""
+        start = bisect_left(self.terms, prefix)
+        matches = []
+        for term in self.terms[start:]:
+            if not term.startswith(prefix) or len(matches) >= limit:
+                break
+            matches.append(term)
+        return matches
+
+    def similar(self, term, max_edits, prefix_length=0, limit=MAX_EXPANSIONS):
+        """Return the (limit closest) indexed terms within max_edits of a term,
+        as a list of (term, edits)."""
+        prefix = term[:prefix_length]
+        candidates = (
+            self.prefixed(prefix, limit=len(self.terms)) if prefix else self.terms
+        )
+        matches = []
+        for candidate in candidates:
+            edits = edit_distance(term, candidate, max_edits)
+            if edits <= max_edits:
+                matches.append((edits, -len(self.postings[candidate]), candidate))
+        return [(candidate, edits) for edits, _, candidate in sorted(matches)[:limit]]
+
+
+class _KeywordIndex:
+    """A keyword field, as a bitset of documents per value, and the values of
+    each document (doc values) for aggregating and sorting."""
+
+    def __init__(self, size):
+        self.docnums = {}
+        self.bitsets = {}
+        self.doc_values = [()] * size
+
+    def add(self, docnum, values):
+        values = tuple(str(v) for v in values)
+        self.doc_values[docnum] = values
+        for value in set(values):
+            self.docnums.setdefault(value, []).append(docnum)
+
+    def finish(self, documents):
+        self.bitsets = {value: to_bitset(d) for value, d in self.docnums.items()}
+        self.terms = sorted(self.bitsets)
+        del self.docnums
+
+
+class _NumericIndex:
+    """A numeric field, as a column of values by document, and the documents
+    sorted by value (for range filters by binary search)."""
+
+    def __init__(self, size, typecode):
+        self.column = array(typecode, [0]) * size
+        self.present = 0
+        self.entries = []
+
+    def add(self, docnum, values):
+        if values:
+            # Multi-valued numeric fields aren't used, so keep the first value
+            self.column[docnum] = values[0]
+            self.entries.append((values[0], docnum))
+
+    def finish(self, documents):
+        self.entries.sort()
+        self.sorted_values = [value for value, _ in self.entries]
+        self.sorted_docnums = [docnum for _, docnum in self.entries]
+        self.present = to_bitset(self.sorted_docnums)
+        del self.entries
+
+    def value(self, docnum):
+        return self.column[docnum] if self.present >> docnum & 1 else None
+
+    def range(self, bounds):
+        """Return the bitset of documents with values within range bounds."""
+        start, stop = 0, len(self.sorted_values)
+        for op, bound in bounds.items():
+            if op == "gte":
+                start = max(start, bisect_left(self.sorted_values, bound))
+            elif op == "gt":
+                start = max(start, bisect_right(self.sorted_values, bound))
+            elif op == "lte":
+                stop = min(stop, bisect_right(self.sorted_values, bound))
+            elif op == "lt":
+                stop = min(stop, bisect_left(self.sorted_values, bound))
+            elif op not in ("boost", "format"):
+                raise bad_request(f"Unsupported range option {op!r}")
+        return to_bitset(self.sorted_docnums[start:stop]) if start < stop else 0
+
+
+class _CompletionIndex:
+    """A completion field, as its inputs sorted for prefix lookups."""
+
+    def __init__(self, size):
+        self.entries = []
+
+    def add(self, docnum, values):
+        for value in values:
+            inputs, weight = value, 1
+            if isinstance(value, dict):
+                inputs, weight = value["input"], value.get("weight", 1)
+            for text in as_list(inputs):
+                self.entries.append((self.normalize(text), -weight, text, docnum))
+
+    def finish(self, documents):
+        self.entries.sort()
+        self.keys = [entry[0] for entry in self.entries]
+
+    @staticmethod
+    def normalize(text):
+        return " ".join(LETTERS_RE.findall(text.lower()))
+
+    def complete(self, prefix):
+        """Yield (weight, text, docnum) for the inputs starting with a prefix."""
+        prefix = self.normalize(prefix)
+        for key, weight, text, docnum in self.entries[bisect_left(self.keys, prefix) :]:
+            if not key.startswith(prefix):
+                break
+            yield -weight, text, docnum
+
+
+class _Indices:
+    """The (read-only) indices API of a MemoryBackend."""
+
+    def __init__(self, backend):
+        self._backend = backend
+
+    def get_mapping(self, index=None, **params):
+        self._backend._check_index(index)
+        mappings = {"properties": self._backend.mapping}
+        if self._backend.generation is not None:
+            mappings["_meta"] = {"generation": self._backend.generation}
+        return {self._backend.index: {"mappings": mappings}}
+
+    def exists(self, index, **params):
+        try:
+            self._backend._check_index(index)
+        except NotFoundError:
+            return False
+        return True
+
+
+class MemoryBackend:
+    """An in-process stand-in for the Elasticsearch client, holding one
+    read-only index in memory.
+
+    It implements the client methods Recipe and the fridge use (search,
+    msearch, get, mget and indices.get_mapping), for the query, aggregation
+    and suggester shapes they send, so tests and small deployments can run
+    without a cluster (see SEARCH_BACKEND in config.py). Anything else raises
+    a RequestError, like Elasticsearch rejecting a malformed request.
+
+    Fields are indexed by their mapping type:
+        - text fields: an inverted index of terms, for BM25 scoring
+        - keyword fields (e.g. tags.keyword): a bitset of documents per value
+        - numeric fields: a column of values, plus the documents sorted by
+          value, so range filters are a binary search
+        - completion fields: the inputs sorted, so completions are a range
+    Filters evaluate to bitsets (ints), so combining them is a few integer
+    operations however many documents match. Scores follow Elasticsearch's
+    closely but not exactly (e.g. fuzzy queries), so only rely on orderings
+    where the difference is clear.
+
+    Usage:
+
+        >>> backend = MemoryBackend.from_file("recipes.json", mapping)
+        >>> backend.search(index="recipes", body={"query": {"match": {"name": "dip"}}})
+
+    Args:
+        documents: An iterable of documents as dicts of {"_id", "_source"}
+        mapping: The index mapping's properties, as in recipe-mapping.json
+        index: The name of the index
+        generation: The index generation marker (see Recipe.get_index_generation)
+    """
+
+    def __init__(self, documents, mapping, index="recipes", generation=None):
+        self.mapping = mapping
+        self.index = index
+        self.generation = generation
+        self.indices = _Indices(self)
+
+        self.ids = []
+        self.sources = []
+        for document in documents:
+            self.ids.append(str(document["_id"]))
+            self.sources.append(document["_source"])
+        self.docnums = {doc_id: docnum for docnum, doc_id in enumerate(self.ids)}
+        self.all = (1 << len(self.ids)) - 1
+
+        self.fields = {}
+        for field, options in self._mapped_fields(mapping):
+            index_type = {
+                "text": _TextIndex,
+                "keyword": _KeywordIndex,
+                "completion": _CompletionIndex,
+            }.get(options["type"])
+            if options["type"] in NUMERIC_TYPES:
+                self.fields[field] = _NumericIndex(len(self.ids), "q")
+            elif options["type"] in FLOAT_TYPES:
+                self.fields[field] = _NumericIndex(len(self.ids), "d")
+            elif index_type is not None:
+                self.fields[field] = index_type(len(self.ids))
+
+        for docnum, source in enumerate(self.sources):
+            for field, field_index in self.fields.items():
+                values = as_list(source.get(field.split(".")[0]))
+                if values:
+                    field_index.add(docnum, values)
+        for field_index in self.fields.values():
+            field_index.finish(self.sources)
+
+    @classmethod
+    def from_file(cls, path, mapping, index="recipes"):
+        """Load a MemoryBackend from a JSON lines file of {"_id", "_source"}
+        documents (e.g. an export of the recipes index). The generation marker
+        is a hash of the file, so caches keyed by it see reloads."""
+        digest = hashlib.sha1()
+        documents = []
+        with open(path, "rb") as f:
+            for line in f:
+                digest.update(line)
+                if line.strip():
+                    documents.append(json.loads(line))
+        return cls(documents, mapping, index=index, generation=digest.hexdigest())
+
+    @staticmethod
+    def _mapped_fields(properties, prefix=""):
+        """Yield (field name, options) for every field and subfield (e.g.
+        name.keyword) of a mapping's properties."""
+        for name, options in properties.items():
+            yield prefix + name, options
+            for subfield, suboptions in options.get("fields", {}).items():
+                yield f"{prefix}{name}.{subfield}", suboptions
+
+    def _check_index(self, index):
+        names = index if isinstance(index, (list, tuple)) else str(index).split(",")
+        for name in names:
+            if index is not None and name not in ("_all", "*", self.index):
+                raise NotFoundError(404, "index_not_found_exception", {"index": name})
+
+    def _field(self, field, *types):
+        """Return the index of a field, if it's one of the given index types."""
+        field_index = self.fields.get(field)
+        if not isinstance(field_index, types):
+            raise bad_request(f"Field {field!r} doesn't support this query")
+        return field_index
+
+    # CLIENT API
+
+    def search(self, body=None, index=None, **params):
+        """Run a search, as Elasticsearch.search"""
+        started = time.perf_counter()
+        self._check_index(index)
+        body = body or {}
+        unknown = set(body) - SEARCH_KEYS
+        if unknown:
+            raise bad_request(f"Unsupported search options {sorted(unknown)}")
+
+        bits, scores = self._run(body.get("query", {"match_all": {}}), scoring=True)
+        start, size = body.get("from", 0), body.get("size", 10)
+        sort = self._sort_fields(body.get("sort"))
+
+        hits = []
+        if size:
+            key = self._sort_key(sort, scores)
+            candidates = iter_bitset(bits)
+            if "search_after" in body:
+                after = self._after_key(sort, body["search_after"])
+                candidates = (d for d in candidates if key(d) > after)
+            includes = source_filter(body.get("_source"))
+            for docnum in heapq.nsmallest(start + size, candidates, key=key)[start:]:
+                hit = self._hit(docnum, includes, _score=scores[docnum])
+                if body.get("sort"):
+                    hit["sort"] = [self._sort_value(f, docnum, scores) for f, _ in sort]
+                hits.append(hit)
+
+        response = {
+            "timed_out": False,
+            "_shards": {"total": 1, "successful": 1, "skipped": 0, "failed": 0},
+            "hits": {
+                "max_score": max((h["_score"] for h in hits), default=None),
+                "hits": hits,
+            },
+        }
+        track = body.get("track_total_hits", TRACK_TOTAL_HITS)
+        if track is not False:
+            total = count_bitset(bits)
+            if track is not True and total > track:
+                response["hits"]["total"] = {"value": track, "relation": "gte"}
+            else:
+                response["hits"]["total"] = {"value": total, "relation": "eq"}
+        aggs = body.get("aggs", body.get("aggregations"))
+        if aggs:
+            response["aggregations"] = {
+                name: self._aggregate(agg, bits) for name, agg in aggs.items()
+            }
+        if body.get("suggest"):
+            response["suggest"] = {
+                name: self._suggest(
+                    suggester, includes=source_filter(body.get("_source"))
+                )
+                for name, suggester in body["suggest"].items()
+            }
+        response["took"] = int((time.perf_counter() - started) * 1000)
+        return response
+
+    def msearch(self, body, index=None, **params):
+        """Run several searches, as Elasticsearch.msearch"""
+        if isinstance(body, str):
+            body = [json.loads(line) for line in body.splitlines() if line.strip()]
+
+        responses = []
+        for header, search in zip(body[::2], body[1::2]):
+            try:
+                response = self.search(search, index=header.get("index", index))
+                responses.append(dict(response, status=200))
+            except TransportError as e:
+                info = e.info if isinstance(e.info, dict) else {}
+                error = info.get("error", {"type": e.error, "reason": str(e.info)})
+                responses.append({"error": error, "status": e.status_code})
+        return {
+            "took": sum(r.get("took", 0) for r in responses),
+            "responses": responses,
+        }
+
+    def get(self, index, id, **params):
+        """Get a document by its ID, as Elasticsearch.get"""
+        self._check_index(index)
+        docnum = self.docnums.get(str(id))
+        if docnum is None:
+            raise NotFoundError(
+                404, "not_found", {"_index": self.index, "_id": id, "found": False}
+            )
+        return self._hit(
+            docnum, self._params_source_filter(params), **VERSION, found=True
+        )
+
+    def mget(self, body, index=None, **params):
+        """Get several documents by their IDs, as Elasticsearch.mget"""
+        self._check_index(index)
+        includes = self._params_source_filter(params)
+        ids = body.get("ids") or [doc["_id"] for doc in body.get("docs", [])]
+
+        docs = []
+        for doc_id in ids:
+            docnum = self.docnums.get(str(doc_id))
+            if docnum is None:
+                docs.append({"_index": self.index, "_id": doc_id, "found": False})
+            else:
+                docs.append(self._hit(docnum, includes, **VERSION, found=True))
+        return {"docs": docs}
+
+    # QUERIES
+
+    def _run(self, query, scoring):
+        """Evaluate a query.
+
+        Args:
+            query: A query dict, e.g. {"match": {"name": "dip"}}
+            scoring: Whether the scores are needed (query context), or only
+                which documents match (filter context)
+
+        Returns:
+            A tuple of (bitset of the matching documents, dict of {docnum:
+            score} if scoring else None)
+        """
+        if len(query) != 1:
+            raise bad_request(f"Expected one query type, not {sorted(query)}")
+        ((kind, body),) = query.items()
+
+        text_query = getattr(self, f"_{kind}_query", None)
+        if text_query is not None:
+            scores = text_query(body)
+            return to_bitset(scores), scores if scoring else None
+
+        boost = body.get("boost", 1.0) if isinstance(body, dict) else 1.0
+        if kind == "bool":
+            return self._bool(body, scoring)
+        if kind == "function_score":
+            return self._function_score(body, scoring)
+        if kind == "constant_score":
+            bits = self._run(body["filter"], scoring=False)[0]
+        elif kind == "match_all":
+            bits = self.all
+        elif kind == "match_none":
+            bits = 0
+        elif kind in ("term", "terms", "terms_set"):
+            bits = self._terms(kind, body) & self.all
+        elif kind == "range":
+            field, bounds = single_field(body)
+            bits = self._field(field, _NumericIndex).range(bounds)
+        elif kind == "ids":
+            docnums = (self.docnums.get(str(i)) for i in body["values"])
+            bits = to_bitset(d for d in docnums if d is not None)
+        else:
+            raise bad_request(f"Unsupported query type {kind!r}")
+
+        return bits, dict.fromkeys(iter_bitset(bits), boost) if scoring else None
+
+    def _bool(self, body, scoring):
+        clauses = {
+            occur: as_list(body.get(occur))
+            for occur in ("must", "filter", "should", "must_not")
+        }
+        bits, scored = self.all, []
+        for query in clauses["must"]:
+            must_bits, must_scores = self._run(query, scoring)
+            bits &= must_bits
+            scored.append(must_scores)
+        for query in clauses["filter"]:
+            bits &= self._run(query, scoring=False)[0]
+        for query in clauses["must_not"]:
+            bits &= ~self._run(query, scoring=False)[0]
+
+        if clauses["should"]:
+            should = [self._run(query, scoring) for query in clauses["should"]]
+            scored.extend(scores for _, scores in should)
+            default = 0 if clauses["must"] or clauses["filter"] else 1
+            minimum = body.get("minimum_should_match", default)
+            if isinstance(minimum, str):
+                minimum = (
+                    len(should) * int(minimum[:-1]) // 100
+                    if minimum.endswith("%")
+                    else int(minimum)
+                )
+            bits &= self._at_least(minimum, [should_bits for should_bits, _ in should])
+
+        if not scoring:
+            return bits, None
+        scores = dict.fromkeys(iter_bitset(bits), 0.0)
+        for clause_scores in scored:
+            for docnum, score in clause_scores.items():
+                if docnum in scores:
+                    scores[docnum] += score
+        return bits, scores
+
+    def _function_score(self, body, scoring):
+        bits, scores = self._run(body.get("query", {"match_all": {}}), scoring)
+        if not scoring:
+            return bits, None
+
+        functions = as_list(body.get("functions"))
+        if "script_score" in body:
+            functions.append({"script_score": body["script_score"]})
+        if len(functions) != 1 or set(functions[0]) != {"script_score"}:
+            raise bad_request("Only function_score with one script_score is supported")
+        script = functions[0]["script_score"]["script"]
+        source = script["source"] if isinstance(script, dict) else script
+        if source not in SCORE_SCRIPTS:
+            raise bad_request(f"Unsupported script {source!r}")
+        function = SCORE_SCRIPTS[source]
+
+        boost_mode = body.get("boost_mode", "multiply")
+        combine = {
+            "replace": lambda score, value: value,
+            "multiply": lambda score, value: score * value,
+            "sum": lambda score, value: score + value,
+        }.get(boost_mode)
+        if combine is None:
+            raise bad_request(f"Unsupported boost_mode {boost_mode!r}")
+        return bits, {
+            docnum: combine(score, function(score, self.sources[docnum]))
+            for docnum, score in scores.items()
+        }
+
+    def _terms(self, kind, body):
+        if kind == "terms_set":
+            field, options = single_field(body)
+            terms = options["terms"]
+            script = options.get("minimum_should_match_script", {}).get("source")
+            if script not in MINIMUM_SHOULD_MATCH_SCRIPTS:
+                raise bad_request(f"Unsupported script {script!r}")
+            minimum = MINIMUM_SHOULD_MATCH_SCRIPTS[script](len(terms))
+        elif kind == "terms":
+            field, options = single_field(body)
+            terms, minimum = options["value"], 1
+        else:
+            field, options = single_field(body)
+            terms, minimum = [options["value"]], 1
+
+        field_index = self.fields.get(field)
+        if isinstance(field_index, _KeywordIndex):
+            bitsets = [field_index.bitsets.get(str(term), 0) for term in terms]
+        elif isinstance(field_index, _TextIndex):
+            bitsets = [to_bitset(field_index.postings.get(t, ())) for t in terms]
+        else:
+            raise bad_request(f"Field {field!r} doesn't support {kind} queries")
+        return self._at_least(minimum, bitsets)
+
+    def _at_least(self, minimum, bitsets):
+        """Return the bitset of documents in at least minimum of some bitsets."""
+        if minimum <= 0:
+            return self.all
+        if minimum > len(bitsets):
+            return 0
+        if minimum == 1:
+            bits = 0
+            for bitset in bitsets:
+                bits |= bitset
+            return bits
+        if minimum == len(bitsets):
+            bits = self.all
+            for bitset in bitsets:
+                bits &= bitset
+            return bits
+        counts = Counter(d for bitset in bitsets for d in iter_bitset(bitset))
+        return to_bitset(d for d, count in counts.items() if count >= minimum)
+
+    # Text queries, which return {docnum: score} of the matching documents
+
+    def _match_query(self, body):
+        field, options = single_field(body)
+        text_index = self._field(field, _TextIndex)
+        terms = analyze(options["value"])
+        scores = {}
+        for term in terms:
+            for docnum, score in text_index.bm25(
+                term, options.get("boost", 1.0)
+            ).items():
+                scores[docnum] = scores.get(docnum, 0.0) + score
+        if options.get("operator", "or").lower() == "and":
+            for term in terms:
+                scores = {
+                    d: s
+                    for d, s in scores.items()
+                    if d in text_index.postings.get(term, ())
+                }
+        return scores
+
+    def _match_phrase_query(self, body, prefix=False):
+        field, options = single_field(body)
+        text_index = self._field(field, _TextIndex)
+        terms = analyze(options["value"])
+        if not terms:
+            return {}
+
+        last = [terms[-1]]
+        if prefix:
+            last = text_index.prefixed(
+                terms[-1], options.get("max_expansions", MAX_EXPANSIONS)
+            )
+        candidates = None
+        for term in terms[:-1]:
+            docnums = set(text_index.postings.get(term, ()))
+            candidates = docnums if candidates is None else candidates & docnums
+        last_docnums = set()
+        for term in last:
+            last_docnums.update(text_index.postings.get(term, ()))
+        candidates = last_docnums if candidates is None else candidates & last_docnums
+
+        scores = {}
+        for docnum in candidates:
+            values = as_list(self.sources[docnum].get(field))
+            if any(self._has_phrase(analyze(v), terms[:-1], last) for v in values):
+                scores[docnum] = sum(
+                    text_index.bm25(term).get(docnum, 0.0) for term in terms[:-1]
+                ) + max(text_index.bm25(term).get(docnum, 0.0) for term in last)
+        return scores
+
+    def _match_phrase_prefix_query(self, body):
+        return self._match_phrase_query(body, prefix=True)
+
+    @staticmethod
+    def _has_phrase(tokens, leading, last):
+        """Whether tokens hold the leading terms in order, then one of last."""
+        for i in range(len(tokens) - len(leading)):
+            if (
+                tokens[i : i + len(leading)] == leading
+                and tokens[i + len(leading)] in last
+            ):
+                return True
+        return False
+
+    def _prefix_query(self, body):
+        field, options = single_field(body)
+        field_index = self._field(field, _TextIndex, _KeywordIndex)
+        boost = options.get("boost", 1.0)
+        if isinstance(field_index, _KeywordIndex):
+            bits = 0
+            for value in field_index.terms[
+                bisect_left(field_index.terms, options["value"]) :
+            ]:
+                if not value.startswith(options["value"]):
+                    break
+                bits |= field_index.bitsets[value]
+            return dict.fromkeys(iter_bitset(bits), boost)
+        docnums = set()
+        for term in field_index.prefixed(options["value"]):
+            docnums.update(field_index.postings[term])
+        return dict.fromkeys(sorted(docnums), boost)
+
+    def _fuzzy_query(self, body):
+        field, options = single_field(body)
+        text_index = self._field(field, _TextIndex)
+        value = str(options["value"])
+        expansions = text_index.similar(
+            value,
+            auto_fuzziness(value, options.get("fuzziness", "AUTO")),
+            prefix_length=options.get("prefix_length", 0),
+            limit=options.get("max_expansions", MAX_EXPANSIONS),
+        )
+        scores = {}
+        for term, edits in expansions:
+            similarity = 1 - edits / max(min(len(term), len(value)), 1)
+            for docnum, score in text_index.bm25(term, similarity).items():
+                scores[docnum] = max(scores.get(docnum, 0.0), score)
+        return scores
+
+    # SORTING
+
+    @staticmethod
+    def _sort_fields(sort):
+        """Normalize a sort spec into a list of (field, order). Without one,
+        hits are sorted by descending score, then index order."""
+        if not sort:
+            return [("_score", "desc"), ("_doc", "asc")]
+        fields = []
+        for spec in as_list(sort):
+            if isinstance(spec, str):
+                field, order = spec, None
+            else:
+                ((field, order),) = spec.items()
+                if isinstance(order, dict):
+                    order = order.get("order")
+            fields.append((field, order or ("desc" if field == "_score" else "asc")))
+        return fields
+
+    def _sort_value(self, field, docnum, scores):
+        if field == "_score":
+            return scores[docnum]
+        if field == "_id":
+            return self.ids[docnum]
+        if field == "_doc":
+            return docnum
+        field_index = self.fields.get(field)
+        if isinstance(field_index, _NumericIndex):
+            return field_index.value(docnum)
+        if isinstance(field_index, _KeywordIndex):
+            values = field_index.doc_values[docnum]
+            return min(values) if values else None
+        raise bad_request(f"Can't sort on field {field!r}")
+
+    @staticmethod
+    def _sort_part(value, order):
+        """Make a sort value comparable in order, with missing values last."""
+        if value is None:
+            return (1, 0)
+        if order == "desc":
+            return (
+                0,
+                -value if isinstance(value, (int, float)) else _Descending(value),
+            )
+        return (0, value)
+
+    def _sort_key(self, sort, scores):
+        def key(docnum):
+            return tuple(
+                self._sort_part(self._sort_value(field, docnum, scores), order)
+                for field, order in sort
+            )
+
+        return key
+
+    def _after_key(self, sort, after):
+        if len(after) != len(sort):
+            raise bad_request("search_after must have a value for each sort field")
+        return tuple(
+            self._sort_part(value, order) for value, (_, order) in zip(after, sort)
+        )
+
+    # RESULTS
+
+    def _hit(self, docnum, includes=(None, None), **extra):
+        """Return a document as a hit, with its source filtered by includes
+        (see source_filter) and any extra keys (e.g. _score)."""
+        hit = {"_index": self.index, "_type": "_doc", "_id": self.ids[docnum]}
+        hit.update(extra)
+        if includes is not None:
+            hit["_source"] = project(self.sources[docnum], *includes)
+        return hit
+
+    @staticmethod
+    def _params_source_filter(params):
+        """Parse the _source request params of get/mget into a source filter."""
+        if "_source" in params and params["_source"] in (False, "false"):
+            return None
+        includes = params.get("_source_includes", params.get("_source"))
+        excludes = params.get("_source_excludes")
+        if isinstance(includes, str):
+            includes = None if includes == "true" else includes.split(",")
+        if isinstance(excludes, str):
+            excludes = excludes.split(",")
+        return includes, excludes
+
+    def _aggregate(self, agg, bits):
+        kinds = [kind for kind in agg if kind != "meta"]
+        if len(kinds) != 1:
+            raise bad_request(f"Unsupported aggregation {sorted(agg)}")
+        kind, options = kinds[0], agg[kinds[0]]
+
+        if kind == "terms":
+            field_index = self._field(options["field"], _KeywordIndex)
+            if len(field_index.bitsets) <= 64:
+                # Few values (e.g. tags), so count with their bitsets
+                counts = {
+                    value: count_bitset(bits & bitset)
+                    for value, bitset in field_index.bitsets.items()
+                }
+            else:
+                counts = Counter(
+                    value
+                    for docnum in iter_bitset(bits)
+                    for value in set(field_index.doc_values[docnum])
+                )
+            ranked = sorted(
+                ((value, count) for value, count in counts.items() if count),
+                key=lambda item: (-item[1], item[0]),
+            )
+            size = options.get("size", 10)
+            return {
+                "doc_count_error_upper_bound": 0,
+                "sum_other_doc_count": sum(count for _, count in ranked[size:]),
+                "buckets": [
+                    {"key": value, "doc_count": count} for value, count in ranked[:size]
+                ],
+            }
+
+        if kind == "histogram":
+            field_index = self._field(options["field"], _NumericIndex)
+            interval = options["interval"]
+            counts = Counter(
+                math.floor(field_index.column[docnum] / interval) * interval
+                for docnum in iter_bitset(bits & field_index.present)
+            )
+            if not counts:
+                return {"buckets": []}
+            # Like Elasticsearch, fill in the empty buckets between the ends
+            first = min(counts)
+            keys = [
+                first + i * interval
+                for i in range(round((max(counts) - first) / interval) + 1)
+            ]
+            minimum = options.get("min_doc_count", 0)
+            return {
+                "buckets": [
+                    {"key": float(key), "doc_count": counts.get(key, 0)}
+                    for key in keys
+                    if counts.get(key, 0) >= minimum
+                ]
+            }
+
+        raise bad_request(f"Unsupported aggregation type {kind!r}")
+
+    def _suggest(self, suggester, includes):
+        text = suggester.get("prefix", suggester.get("text", ""))
+        entry = {"text": text, "offset": 0, "length": len(text), "options": []}
+
+        if "completion" in suggester:
+            options = suggester["completion"]
+            completion_index = self._field(options["field"], _CompletionIndex)
+            size, seen = options.get("size", 5), set()
+            completions = sorted(
+                completion_index.complete(text), key=lambda c: (-c[0], c[1], c[2])
+            )
+            for weight, option_text, docnum in completions:
+                if len(entry["options"]) >= size:
+                    break
+                if options.get("skip_duplicates") and option_text in seen:
+                    continue
+                seen.add(option_text)
+                entry["options"].append(
+                    self._hit(docnum, includes, text=option_text, _score=float(weight))
+                )
+            return [entry]
+
+        if "phrase" in suggester:
+            options = suggester["phrase"]
+            text_index = self._field(options["field"], _TextIndex)
+            terms = analyze(text)
+            corrected = [self._correct(text_index, term) for term in terms]
+            if corrected != terms:
+                entry["options"].append({"text": " ".join(corrected), "score": 1.0})
+            return [entry]
+
+        raise bad_request(f"Unsupported suggester {sorted(suggester)}")
+
+    @staticmethod
+    def _correct(text_index, term, min_word_length=4, prefix_length=1):
+        """Return the more popular spelling of a term, like the phrase
+        suggester's direct generator in "popular" mode, or the term itself."""
+        if len(term) < min_word_length:
+            return term
+        frequency = len(text_index.postings.get(term, ()))
+        candidates = [
+            (edits, -len(text_index.postings[candidate]), candidate)
+            for candidate, edits in text_index.similar(
+                term, 2, prefix_length=prefix_length, limit=len(text_index.terms)
+            )
+            if len(text_index.postings[candidate]) > frequency
+        ]
+        return min(candidates)[2] if candidates else term
+
+
+def create_search_backend(config):
+    """Create the search backend chosen by SEARCH_BACKEND in config.py.
+
+    Args:
+        config: The app config
+
+    Returns:
+        An Elasticsearch client ("elasticsearch"), or a MemoryBackend over the
+        recipes in SEARCH_DATA ("memory")
+
+    Raises:
+        ValueError: If SEARCH_BACKEND isn't one of those, or is "memory"
+            without a SEARCH_DATA file.
+    """
+    backend = config["SEARCH_BACKEND"]
+    if backend == "elasticsearch":
+        return Elasticsearch([config["ELASTICSEARCH_URL"]], retry_on_timeout=True)
+    if backend == "memory":
+        if not config.get("SEARCH_DATA"):
+            raise ValueError('SEARCH_BACKEND "memory" needs SEARCH_DATA to be set')
+
+        from .search import Recipe
+
+        return MemoryBackend.from_file(
+            config["SEARCH_DATA"],
+            Recipe._doc_type.mapping.to_dict()["properties"],
+            index=Recipe._index._name,
+        )
+    raise ValueError(f"Unknown SEARCH_BACKEND {backend!r}")
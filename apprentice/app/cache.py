@@ -0,0 +1,111 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """A thread-safe, size-bounded LRU cache whose entries expire after a TTL.
+
+    Every entry carries its own expiry time, so callers can store results with
+    different lifetimes in the same cache (e.g. a long TTL for successful
+    lookups and a short TTL for failed ones).
+
+    Usage:
+
+        >>> cache = TTLCache(maxsize=2, ttl=60)
+        >>> cache.set("a", 1)
+        >>> cache.set("b", None, ttl=5)  # e.g. a negative result
+        >>> cache.get("a")
+        1
+        >>> cache.get("c", default="missing")
+        'missing'
+
+    Args:
+        maxsize: The maximum number of entries held before the least recently
+            used one is evicted.
+        ttl: The default number of seconds an entry stays valid.
+        timer: A callable returning the current time in seconds (for testing).
+
+    Attributes:
+        hits: The number of lookups that found a valid entry.
+        misses: The number of lookups that found nothing (or an expired entry).
+    """
+
+    def __init__(self, maxsize=1024, ttl=300, timer=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._timer = timer
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            return entry is not None and entry[1] > self._timer()
+
+    def get(self, key, default=None):
+        """Return the value stored under key, or default if absent or expired.
+
+        Args:
+            key: A hashable cache key.
+            default: The value to return on a miss.
+
+        Returns:
+            The cached value, or default.
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > self._timer():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl=None):
+        """Store a value, evicting the least recently used entry if full.
+
+        Args:
+            key: A hashable cache key.
+            value: The value to store (None is a valid value).
+            ttl: The number of seconds this entry stays valid, defaults to
+                the cache-wide TTL.
+        """
+        if self.maxsize <= 0:
+            return
+        expires_at = self._timer() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        """Remove the entry stored under key, if any."""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        """Remove every entry (the hit/miss counters are kept)."""
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        """Return a dict summarizing the cache's size and hit/miss counters."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,55 @@
+import time
+
+from flask import copy_current_request_context, current_app, has_request_context
+
+
+def submit(fn, *args, **kwargs):
+    """Run a function on the app's shared thread pool (app.executor).
+
+    The function runs with a copy of the current request context (or just the
+    app context, outside of requests), so it can use current_app, url_for etc.
+
+    Usage:
+
+        >>> future = submit(recipe.get_image_url, use_google=True)
+        >>> result_by(future, time.monotonic() + 1.5, default=DEFAULT_IMAGE)
+
+    Returns:
+        A concurrent.futures.Future of the function's result
+    """
+    if has_request_context():
+        fn = copy_current_request_context(fn)
+    else:
+        app = current_app._get_current_object()
+        fn = _with_app_context(app, fn)
+    return current_app.executor.submit(fn, *args, **kwargs)
+
+
+def _with_app_context(app, fn):
+    def run(*args, **kwargs):
+        with app.app_context():
+            return fn(*args, **kwargs)
+
+    return run
+
+
+def result_by(future, deadline, default=None):
+    """Return the result of a future if it's ready by a deadline, else a default.
+
+    A function which misses its deadline keeps running in the background (so
+    e.g. a slow image resolution still ends up in the image cache for the next
+    page view), but nothing waits for it.
+
+    Args:
+        future: A concurrent.futures.Future, e.g. from submit.
+        deadline: The time.monotonic() time to stop waiting at.
+        default: What to return if the future misses the deadline or fails.
+
+    Returns:
+        The future's result, or default
+    """
+    try:
+        return future.result(timeout=max(deadline - time.monotonic(), 0))
+    except Exception:
+        # A concurrent.futures.TimeoutError, or e.g. Elasticsearch is down
+        return default
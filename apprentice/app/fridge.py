@@ -0,0 +1,169 @@
+from collections import namedtuple
+
+from elasticsearch_dsl import Q
+from flask import current_app
+
+from . import db
+from .ingredients import ingredient_names
+from .models import FridgeItem
+from .search import SORT_ORDER, Recipe, RecipeRow
+
+# A recipe matched against a fridge: its listing row, the fraction of its
+# ingredients that are in the fridge, and the (normalized) ingredients that aren't
+FridgeMatch = namedtuple("FridgeMatch", ["recipe", "coverage", "missing"])
+
+# A page of matches for a fridge. timed_out is True if Elasticsearch ran out of
+# its latency budget, in which case the matches are the best it found in time.
+FridgeMatches = namedtuple("FridgeMatches", ["matches", "total", "timed_out"])
+
+# Each ingredient in the fridge is a constant_score clause worth 1, so a
+# recipe's _score is how many of its ingredients are in the fridge, and this
+# turns it into the fraction of its ingredients that are
+COVERAGE_SCRIPT = "_score / Math.max(doc['ingredientNames'].size(), 1)"
+
+
+def get_inventory(user_id):
+    """Return the set of ingredient names in a user's fridge.
+
+    The set is cached per user (see FRIDGE_CACHE_TTL), and the cache entry is
+    dropped whenever the fridge changes.
+
+    Args:
+        user_id: The id of the User whose fridge to look in.
+
+    Returns:
+        A frozenset of normalized ingredient names.
+    """
+    cache = current_app.fridge_cache
+    inventory = cache.get(user_id)
+    if inventory is None:
+        names = db.session.query(FridgeItem.name).filter_by(user_id=user_id)
+        inventory = frozenset(name for name, in names)
+        cache.set(user_id, inventory)
+    return inventory
+
+
+def add_to_fridge(user_id, text):
+    """Add ingredients to a user's fridge, normalizing their names.
+
+    Args:
+        user_id: The id of the User whose fridge to add to.
+        text: Comma-separated ingredients, e.g. "2 eggs, Olive Oil".
+
+    Returns:
+        A list of the names added, leaving out any already in the fridge.
+
+    Raises:
+        ValueError: If the fridge would hold more than FRIDGE_MAX_ITEMS items.
+    """
+    inventory = get_inventory(user_id)
+    names = [
+        name
+        for name in ingredient_names(text.split(","))
+        if name not in inventory and len(name) <= FridgeItem.name.type.length
+    ]
+
+    limit = current_app.config["FRIDGE_MAX_ITEMS"]
+    if len(inventory) + len(names) > limit:
+        raise ValueError(f"Your fridge can only hold {limit} items")
+
+    for name in names:
+        db.session.add(FridgeItem(user_id=user_id, name=name))
+    db.session.commit()
+    current_app.fridge_cache.delete(user_id)
+    return names
+
+
+def remove_from_fridge(user_id, item_id):
+    """Remove an item from a user's fridge.
+
+    Args:
+        user_id: The id of the User whose fridge to remove from.
+        item_id: The id of the FridgeItem to remove.
+
+    Returns:
+        True if the item was in the user's fridge, else False.
+    """
+    removed = FridgeItem.query.filter_by(id=item_id, user_id=user_id).delete()
+    db.session.commit()
+    current_app.fridge_cache.delete(user_id)
+    return bool(removed)
+
+
+def get_fridge_search(inventory, page=0, per_page=20):
+    """Return a search for the recipes which use the ingredients in a fridge,
+    ranked by the fraction of their ingredients that are in it.
+
+    Every recipe with at least one of the ingredients matches. The shards
+    stop looking after half of FRIDGE_SEARCH_BUDGET and return the best
+    matches found so far, and the whole request is abandoned after
+    FRIDGE_SEARCH_BUDGET, so big fridges can't hold up the page.
+
+    Args:
+        inventory: A set of normalized ingredient names.
+        page: The page of results to get
+        per_page: The size of each page of results to get
+
+    Returns:
+        An elasticsearch_dsl.Search object
+    """
+    budget = current_app.config["FRIDGE_SEARCH_BUDGET"]
+    have = [
+        Q("constant_score", filter=Q("term", ingredientNames=name), boost=1)
+        for name in sorted(inventory)
+    ]
+    query = Q(
+        "function_score",
+        query=Q("bool", should=have, minimum_should_match=1),
+        script_score={"script": {"source": COVERAGE_SCRIPT}},
+        boost_mode="replace",
+    )
+
+    search = Recipe.search()[page * per_page : (page + 1) * per_page].query(query)
+    search = search.sort(*SORT_ORDER)
+    search = search.source(Recipe.LISTING_FIELDS + ["ingredientNames"])
+    search = search.extra(timeout=f"{int(budget * 500)}ms")
+    return search.params(request_timeout=budget)
+
+
+def match_recipes(user_id, page=0, per_page=20):
+    """Find the recipes a user can (nearly) cook with what's in their fridge.
+
+    Complete results are cached in the search cache by the fridge's contents
+    and the index generation, so users with the same fridge share them.
+
+    Args:
+        user_id: The id of the User whose fridge to match against.
+        page: The page of results to get
+        per_page: The size of each page of results to get
+
+    Returns:
+        FridgeMatches of (list of FridgeMatch, total number of matching
+        recipes, whether the search timed out)
+    """
+    inventory = get_inventory(user_id)
+    if not inventory:
+        return FridgeMatches([], 0, False)
+
+    cache = current_app.search_cache
+    key = ("fridge", Recipe.get_index_generation(), inventory, page, per_page)
+    results = cache.get(key)
+    if results is None:
+        search = get_fridge_search(inventory, page=page, per_page=per_page)
+        response = search.execute().to_dict()
+
+        matches = []
+        for hit in response["hits"]["hits"]:
+            names = hit["_source"].get("ingredientNames", [])
+            missing = [name for name in names if name not in inventory]
+            matches.append(FridgeMatch(RecipeRow.from_hit(hit), hit["_score"], missing))
+
+        results = FridgeMatches(
+            matches,
+            response["hits"]["total"]["value"],
+            response.get("timed_out", False),
+        )
+        if not results.timed_out:
+            cache.set(key, results)
+
+    return results
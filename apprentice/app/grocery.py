@@ -0,0 +1,309 @@
+import re
+from collections import OrderedDict, namedtuple
+
+from flask import current_app
+
+from . import db
+from .ingredients import ingredient_name, singularize
+from .models import GroceryListRecipe
+from .search import Recipe
+
+# An ingredient line parsed into its normalized name (see app/ingredients.py)
+# and quantity. Volumes are in ml and weights in g, so they can be summed;
+# other units (e.g. "clove") are kept as is, and unit is None for a plain count
+# (e.g. "2 eggs"). amount is None if the line gives no quantity.
+ParsedIngredient = namedtuple("ParsedIngredient", ["name", "amount", "unit"])
+
+# A recipe's name and parsed ingredients, as cached per recipe
+ParsedRecipe = namedtuple("ParsedRecipe", ["id", "name", "ingredients"])
+
+# An item on a merged grocery list: its name, its summed quantities as display
+# strings (one per kind of unit, e.g. ["1 1/2 cups", "2 cans"]), and the names
+# of the recipes which need it
+GroceryItem = namedtuple("GroceryItem", ["name", "quantities", "recipes"])
+
+# Units which can be converted and summed, as {unit: (base unit, size in it)}
+UNIT_SIZES = {
+    "teaspoon": ("ml", 4.929),
+    "tsp": ("ml", 4.929),
+    "tablespoon": ("ml", 14.787),
+    "tbsp": ("ml", 14.787),
+    "tbs": ("ml", 14.787),
+    "cup": ("ml", 236.588),
+    "pint": ("ml", 473.176),
+    "quart": ("ml", 946.353),
+    "gallon": ("ml", 3785.41),
+    "ml": ("ml", 1),
+    "milliliter": ("ml", 1),
+    "l": ("ml", 1000),
+    "liter": ("ml", 1000),
+    "litre": ("ml", 1000),
+    "g": ("g", 1),
+    "gram": ("g", 1),
+    "kg": ("g", 1000),
+    "kilogram": ("g", 1000),
+    "oz": ("g", 28.35),
+    "ounce": ("g", 28.35),
+    "lb": ("g", 453.592),
+    "lbs": ("g", 453.592),
+    "pound": ("g", 453.592),
+}
+
+# Units which are counted rather than converted (e.g. "2 cloves garlic")
+COUNT_UNITS = {
+    "bag", "bottle", "box", "bunch", "can", "clove", "container", "dash",
+    "envelope", "handful", "head", "jar", "package", "packet", "pinch", "sprig",
+    "slice", "stick",
+}  # fmt: skip
+
+# How summed volumes and weights are displayed: the first unit the amount is at
+# least the given number of
+DISPLAY_UNITS = {
+    "ml": [("cup", 236.588, 0.25), ("tbsp", 14.787, 1), ("tsp", 4.929, 0)],
+    "g": [("lb", 453.592, 1), ("oz", 28.35, 0)],
+}
+
+# How far (relatively) a displayed fraction can be from the amount. Amounts
+# given in cups, spoons, ounces etc. add up to (near enough) exact fractions,
+# but e.g. 500 g is 1.1 lb, so it's displayed as is instead
+DISPLAY_PRECISION = 0.001
+
+# The fractions amounts are displayed with, as (value, text)
+DISPLAY_FRACTIONS = [
+    (0, ""), (1 / 8, "1/8"), (1 / 4, "1/4"), (1 / 3, "1/3"), (1 / 2, "1/2"),
+    (2 / 3, "2/3"), (3 / 4, "3/4"), (1, ""),
+]  # fmt: skip
+
+FRACTIONS = {"¼": "1/4", "½": "1/2", "¾": "3/4", "⅓": "1/3", "⅔": "2/3", "⅛": "1/8"}
+NUMBER = r"\d+\s+\d+/\d+|\d+/\d+|\d*\.\d+|\d+"  # e.g. "1 1/2", "1/2", ".5", "2"
+QUANTITY_RE = re.compile(
+    rf"^(?P<amount>{NUMBER})(?:\s*(?:-|to)\s*(?:{NUMBER}))?\s*(?P<rest>.*)$"
+)
+
+
+def parse_number(text):
+    """Parse a number like "2", "1.5", "1/2" or "1 1/2" into a float."""
+    total = 0.0
+    for part in text.split():
+        if "/" in part:
+            numerator, denominator = part.split("/")
+            total += int(numerator) / int(denominator) if int(denominator) else 0
+        else:
+            total += float(part)
+    return total
+
+
+def parse_ingredient(line):
+    """Parse an ingredient line into its name and quantity.
+
+    Usage:
+
+        >>> parse_ingredient("1 1/2 cups all-purpose flour")
+        ParsedIngredient(name='flour', amount=354.882, unit='ml')
+        >>> parse_ingredient("2 cloves garlic, minced")
+        ParsedIngredient(name='garlic', amount=2.0, unit='clove')
+
+    Args:
+        line: An ingredient line from a recipe.
+
+    Returns:
+        A ParsedIngredient. A range (e.g. "2-3 eggs") counts as its lower end.
+    """
+    for fraction, text in FRACTIONS.items():
+        line = line.replace(fraction, f" {text}")
+    line = line.strip()
+    name = ingredient_name(line)
+
+    match = QUANTITY_RE.match(line)
+    if not match:
+        return ParsedIngredient(name, None, None)
+
+    amount = parse_number(match.group("amount"))
+    rest = re.sub(r"\([^)]*\)", " ", match.group("rest")).split()
+    unit = singularize(rest[0].lower().rstrip(".")) if rest else None
+    if unit in UNIT_SIZES:
+        base, size = UNIT_SIZES[unit]
+        return ParsedIngredient(name, round(amount * size, 3), base)
+    if unit in COUNT_UNITS:
+        return ParsedIngredient(name, amount, unit)
+    return ParsedIngredient(name, amount, None)
+
+
+def round_amount(amount):
+    """Round an amount to a whole number plus one of DISPLAY_FRACTIONS.
+
+    A nonzero amount is never rounded down to 0, but up to the smallest fraction.
+
+    Returns:
+        A tuple of (rounded amount, display string), e.g. (1.5, "1 1/2")
+    """
+    whole = int(amount)
+    value, text = min(DISPLAY_FRACTIONS, key=lambda f: abs(amount - whole - f[0]))
+    if value == 1:
+        whole += 1
+    elif not whole and not value and amount > 0:
+        value, text = DISPLAY_FRACTIONS[1]
+    text = " ".join(part for part in (str(whole) if whole else "", text) if part)
+    return whole + value, text or "0"
+
+
+def format_amount(amount):
+    """Format an amount as a whole number plus a common fraction, e.g. "1 1/2"."""
+    return round_amount(amount)[1]
+
+
+def format_metric(amount, unit):
+    """Format an amount in ml or g to 3 significant figures, e.g. "1.25 kg"."""
+    if amount >= 1000:
+        amount, unit = amount / 1000, {"ml": "l", "g": "kg"}[unit]
+    return f"{amount:.3g} {unit}"
+
+
+def format_quantity(amount, unit):
+    """Format a summed quantity for display, e.g. (354.9, "ml") -> "1 1/2 cups".
+
+    Volumes and weights which don't come out as a common fraction of a cup,
+    spoon, pound or ounce are displayed in ml/l or g/kg, e.g. (500, "g") ->
+    "500 g" rather than "1 lb".
+    """
+    if unit in DISPLAY_UNITS:
+        for name, size, minimum in DISPLAY_UNITS[unit]:
+            if amount / size >= minimum:
+                break
+        value, text = round_amount(amount / size)
+        if abs(value - amount / size) > DISPLAY_PRECISION * amount / size:
+            return format_metric(amount, unit)
+        unit = name
+    else:
+        value, text = round_amount(amount)
+
+    if unit is None:
+        return text
+    if value > 1 and unit not in ("tbsp", "tsp", "oz", "lb"):
+        unit += "es" if unit.endswith(("ch", "sh", "x")) else "s"
+    return f"{text} {unit}"
+
+
+def get_parsed_recipes(recipe_ids):
+    """Return the parsed ingredients of several recipes.
+
+    Parsed recipes are cached per recipe (see INGREDIENT_CACHE_*), and the ones
+    which aren't are fetched together in one bulk request, so rebuilding a list
+    of recently seen recipes doesn't touch Elasticsearch at all.
+
+    Args:
+        recipe_ids: A list of recipe IDs.
+
+    Returns:
+        A list of ParsedRecipe, in the order of recipe_ids, leaving out any
+        recipes which don't exist.
+    """
+    cache = current_app.ingredient_cache
+    generation = Recipe.get_index_generation()
+
+    parsed = {}
+    for recipe_id in recipe_ids:
+        recipe = cache.get((generation, recipe_id))
+        if recipe is not None:
+            parsed[recipe_id] = recipe
+
+    to_fetch = [i for i in recipe_ids if i not in parsed]
+    if to_fetch:
+        batch = Recipe.get_recipes_by_ids(to_fetch, fields=["name", "ingredients"])
+        for recipe in batch.recipes:
+            recipe = ParsedRecipe(
+                recipe.meta.id,
+                recipe.name,
+                tuple(parse_ingredient(line) for line in recipe.ingredients or []),
+            )
+            parsed[recipe.id] = recipe
+            cache.set((generation, recipe.id), recipe)
+
+    return [parsed[i] for i in recipe_ids if i in parsed]
+
+
+def merge_ingredients(recipes):
+    """Merge the ingredients of several recipes into one grocery list.
+
+    Ingredients are grouped by name. Quantities in convertible units are summed
+    (e.g. 1 cup + 4 tbsp of milk is 1 1/4 cups), and other quantities are
+    summed per unit.
+
+    Args:
+        recipes: A list of ParsedRecipe.
+
+    Returns:
+        A list of GroceryItem, sorted by name.
+    """
+    items = {}
+    for recipe in recipes:
+        for ingredient in recipe.ingredients:
+            if not ingredient.name:
+                continue
+            amounts, recipe_names = items.setdefault(
+                ingredient.name, (OrderedDict(), [])
+            )
+            if ingredient.amount is not None:
+                amounts[ingredient.unit] = (
+                    amounts.get(ingredient.unit, 0) + ingredient.amount
+                )
+            if recipe.name not in recipe_names:
+                recipe_names.append(recipe.name)
+
+    return [
+        GroceryItem(
+            name,
+            [format_quantity(amount, unit) for unit, amount in amounts.items()],
+            recipe_names,
+        )
+        for name, (amounts, recipe_names) in sorted(items.items())
+    ]
+
+
+def get_grocery_list(user_id):
+    """Return the recipes on a user's grocery list, and their merged ingredients.
+
+    Args:
+        user_id: The id of the User whose grocery list to build.
+
+    Returns:
+        A tuple of (list of ParsedRecipe, list of GroceryItem)
+    """
+    entries = GroceryListRecipe.query.filter_by(user_id=user_id)
+    recipes = get_parsed_recipes([e.recipe_id for e in entries.order_by("id")])
+    return recipes, merge_ingredients(recipes)
+
+
+def add_to_grocery_list(user_id, recipe_id):
+    """Add a recipe to a user's grocery list (if it isn't there already).
+
+    Args:
+        user_id: The id of the User whose grocery list to add to.
+        recipe_id: The ID of the recipe to add.
+
+    Raises:
+        ValueError: If the list would hold more than GROCERY_LIST_MAX_RECIPES.
+    """
+    entries = GroceryListRecipe.query.filter_by(user_id=user_id)
+    if entries.filter_by(recipe_id=recipe_id).count():
+        return
+
+    limit = current_app.config["GROCERY_LIST_MAX_RECIPES"]
+    if entries.count() >= limit:
+        raise ValueError(f"Your grocery list can only hold {limit} recipes")
+
+    db.session.add(GroceryListRecipe(user_id=user_id, recipe_id=recipe_id))
+    db.session.commit()
+
+
+def remove_from_grocery_list(user_id, recipe_id):
+    """Remove a recipe from a user's grocery list.
+
+    Returns:
+        True if the recipe was on the user's list, else False.
+    """
+    removed = GroceryListRecipe.query.filter_by(
+        user_id=user_id, recipe_id=recipe_id
+    ).delete()
+    db.session.commit()
+    return bool(removed)
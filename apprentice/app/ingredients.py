@@ -0,0 +1,88 @@
+# This module should be identical (bar type hints) to
+# recipe-db/loading-scripts/ingredients.py, so searched ingredients are normalized
+# the same way the loader indexed them
+import re
+
+WORD_RE = re.compile(r"[a-z]+(?:['-][a-z]+)*")
+NOTES_RE = re.compile(r"\([^)]*\)|,.*")  # e.g. "(15 ounce)", ", finely chopped"
+ALTERNATIVES_RE = re.compile(r"\b(?:and|or)\b")  # e.g. "salt and pepper"
+
+# Words which describe how much of an ingredient to use, or how to prepare it,
+# rather than what it is (e.g. "2 cups finely chopped fresh basil")
+UNITS = {
+    "bag", "bags", "bottle", "bottles", "box", "boxes", "bunch", "bunches",
+    "c", "can", "cans", "clove", "cloves", "container", "containers", "cup",
+    "cups", "dash", "dashes", "drop", "drops", "envelope", "envelopes", "g",
+    "gallon", "gallons", "gram", "grams", "handful", "handfuls", "jar", "jars",
+    "kg", "kilogram", "kilograms", "l", "lb", "lbs", "liter", "liters", "litre",
+    "litres", "ml", "milliliter", "milliliters", "ounce", "ounces", "oz",
+    "package", "packages", "packet", "packets", "pinch", "pinches", "pint",
+    "pints", "pkg", "pound", "pounds", "quart", "quarts", "slice", "slices",
+    "sprig", "sprigs", "stick", "sticks", "t", "tablespoon", "tablespoons",
+    "tbs", "tbsp", "tbsps", "teaspoon", "teaspoons", "tsp", "tsps",
+}  # fmt: skip
+DESCRIPTORS = {
+    "a", "about", "additional", "all-purpose", "an", "approximately", "beaten",
+    "boneless", "chilled", "chopped", "coarsely", "cold", "crushed", "cubed",
+    "diced", "divided", "drained", "extra", "extra-virgin", "finely", "fresh",
+    "freshly", "frozen", "grated", "ground", "heaping", "large", "level",
+    "lightly", "medium", "melted", "minced", "of", "optional", "packed",
+    "peeled", "plus", "roughly", "rounded", "shredded", "sifted", "skinless",
+    "sliced", "small", "softened", "taste", "thinly", "to", "warm", "whole",
+}  # fmt: skip
+IGNORED_WORDS = UNITS | DESCRIPTORS
+IRREGULAR_PLURALS = {
+    "halves": "half",
+    "leaves": "leaf",
+    "loaves": "loaf",
+    "octopi": "octopus",
+}
+
+
+def singularize(word):
+    """Returns the singular form of an (English, mostly regular) plural noun."""
+    if word in IRREGULAR_PLURALS:
+        return IRREGULAR_PLURALS[word]
+    if word.endswith("ies") and len(word) > 4:
+        return word[:-3] + "y"  # berries -> berry
+    if word.endswith(("oes", "ches", "shes", "sses", "xes")):
+        return word[:-2]  # tomatoes -> tomato, peaches -> peach
+    if word.endswith("s") and not word.endswith(("ss", "us", "is")) and len(word) > 3:
+        return word[:-1]  # eggs -> egg
+    return word
+
+
+def ingredient_name(line):
+    """Normalizes an ingredient line down to the name of the ingredient, e.g.
+    "2 cups Fresh Basil Leaves, chopped" -> "basil leaf".
+
+    Quantities, units, preparation notes (after a comma or in parentheses) and
+    descriptive words are removed, and the last word is singularized.
+
+    Args:
+        line: An ingredient line from a recipe (or a searched ingredient).
+
+    Returns:
+        The normalized ingredient name, or "" if there's nothing left.
+    """
+    line = NOTES_RE.sub(" ", line.lower())
+    words = [w for w in WORD_RE.findall(line) if w not in IGNORED_WORDS]
+    if words:
+        words[-1] = singularize(words[-1])
+    return " ".join(words)
+
+
+def ingredient_names(lines):
+    """Returns the distinct, normalized names of some ingredient lines, in order.
+    Lines listing several ingredients (e.g. "salt and pepper") give several names.
+
+    Args:
+        lines: Ingredient lines from a recipe (or searched ingredients).
+    """
+    names = []
+    for line in lines:
+        for part in ALTERNATIVES_RE.split(NOTES_RE.sub(" ", line.lower())):
+            name = ingredient_name(part)
+            if name and name not in names:
+                names.append(name)
+    return names
@@ -76,6 +76,43 @@ class AdvancedSearchForm(FlaskForm):
 
         maxFats = IntegerField("Fats", render_kw={"placeholder": "Max"})
 
+    class TimeForm(FlaskForm):
+        """Form for searching by preparation and cooking time"""
+
+        maxTotalMinutes = IntegerField(
+            "Ready in", render_kw={"placeholder": "Max minutes"}
+        )
+
     recipe = FormField(RecipeForm)
     nutrients = FormField(NutrientsForm)
+    time = FormField(TimeForm)
     submit = SubmitField("Search for results", render_kw={"class": "btn"})
+
+
+class FridgeForm(FlaskForm):
+    """Form for adding ingredients to the virtual fridge"""
+
+    items = StringField(
+        "Add to your fridge",
+        [DataRequired()],
+        render_kw={"placeholder": "Comma-separated ingredient(s), e.g. eggs, milk"},
+    )
+    submit = SubmitField("Add", render_kw={"class": "btn btn-success"})
+
+
+class FridgeRemoveForm(FlaskForm):
+    """Form for removing an ingredient from the virtual fridge"""
+
+    submit = SubmitField("Remove", render_kw={"class": "btn btn-link btn-xs"})
+
+
+class GroceryListAddForm(FlaskForm):
+    """Form for adding a recipe to the grocery list"""
+
+    submit = SubmitField("Add to grocery list", render_kw={"class": "btn btn-success"})
+
+
+class GroceryListRemoveForm(FlaskForm):
+    """Form for removing a recipe from the grocery list"""
+
+    submit = SubmitField("Remove", render_kw={"class": "btn btn-link btn-xs"})
@@ -1,9 +1,39 @@
-from flask import abort, jsonify, redirect, render_template, request, session, url_for
-from flask_login import login_required
-
-from ..search import Recipe
+import time
+
+from flask import (
+    abort,
+    current_app,
+    flash,
+    jsonify,
+    redirect,
+    render_template,
+    request,
+    session,
+    url_for,
+)
+from flask_login import current_user, login_required
+
+from ..autocomplete import suggest_names
+from ..concurrency import result_by, submit
+from ..fridge import FridgeMatches, add_to_fridge, match_recipes, remove_from_fridge
+from ..grocery import add_to_grocery_list, get_grocery_list, remove_from_grocery_list
+from ..models import FridgeItem
+from ..search import (
+    FACET_HISTOGRAMS,
+    RANGE_CRITERIA,
+    RANGE_CRITERIA_NAMES,
+    Recipe,
+    SearchPage,
+)
 from . import main
-from .forms import AdvancedSearchForm, SearchForm, Struct
+from .forms import (
+    AdvancedSearchForm,
+    FridgeForm,
+    FridgeRemoveForm,
+    GroceryListAddForm,
+    GroceryListRemoveForm,
+    SearchForm,
+)
 
 
 @main.route("/", methods=["GET", "POST"])
@@ -28,8 +58,14 @@ def index():
 
 @main.route("/search/autocomplete", methods=["GET", "POST"])
 def search_autocomplete():
-    results = Recipe.get_recipe_suggestions(request.args.get("query")).execute()
-    return jsonify([r.name for r in results])
+    """View function for the search bar's autocomplete suggestions
+
+    Args:
+        request.args: query, the text typed into the search bar so far
+    Returns:
+        A JSON list of recipe names.
+    """
+    return jsonify(suggest_names(request.args.get("query")))
 
 
 @main.route("/search", methods=["GET", "POST"])
@@ -39,7 +75,8 @@ def search(page=0):
 
     Args:
         page: page of results to return, default is 0th page
-        request.args: any of the search criteria dictionary
+        request.args: any of the search criteria dictionary, and optionally
+            cursor, an opaque cursor for the next/previous page of results
     Returns:
         The rendered template search.html.
 
@@ -65,6 +102,7 @@ def search(page=0):
                 maxProteins=form.nutrients.maxProteins.data,
                 minFats=form.nutrients.minFats.data,
                 maxFats=form.nutrients.maxFats.data,
+                maxTotalMinutes=form.time.maxTotalMinutes.data,
             )
         )
 
@@ -72,26 +110,15 @@ def search(page=0):
     if request.args.get("tags"):
         tags = request.args.get("tags").split(",")
 
-    # Populate form data from before if available
-    form.recipe.form.populate_obj(
-        Struct(
-            query=request.args.get("query"),
-            ingredients=request.args.get("ingredients"),
-            tags=tags,
-        )
-    )
-    form.nutrients.form.populate_obj(
-        Struct(
-            minCalories=request.args.get("minCalories"),
-            maxCalories=request.args.get("maxCalories"),
-            minCarbs=request.args.get("minCarbs"),
-            maxCarbs=request.args.get("maxCarbs"),
-            minProteins=request.args.get("minProteins"),
-            maxProteins=request.args.get("maxProteins"),
-            minFats=request.args.get("minFats"),
-            maxFats=request.args.get("maxFats"),
-        )
-    )
+    # Fill the form in with the search so far, so it can be refined. Numbers go
+    # in as typed (raw_data), so an invalid one is shown alongside its error
+    form.recipe.query.data = request.args.get("query")
+    form.recipe.ingredients[0].data = request.args.get("ingredients")
+    form.recipe.tags.data = tags
+    for subform in (form.nutrients, form.time):
+        for name in RANGE_CRITERIA_NAMES:
+            if name in subform.form and request.args.get(name):
+                subform[name].raw_data = [request.args.get(name)]
 
     # Populate recipes
     criteria = {
@@ -106,32 +133,55 @@ def search(page=0):
         "maxProteins": request.args.get("maxProteins"),
         "minFats": request.args.get("minFats"),
         "maxFats": request.args.get("maxFats"),
+        "maxPrepMinutes": request.args.get("maxPrepMinutes"),
+        "maxCookMinutes": request.args.get("maxCookMinutes"),
+        "maxTotalMinutes": request.args.get("maxTotalMinutes"),
     }
 
     try:
-        recipe_search_results = Recipe.get_recipes_by_criteria(
-            page=page, per_page=per_page, **criteria
-        ).execute()
-
-        recipes = list(recipe_search_results)
-        total_results = recipe_search_results.hits.total.value
+        results = Recipe.search_recipes(
+            page=page, per_page=per_page, cursor=request.args.get("cursor"), **criteria
+        )
+    except ValueError as e:
+        # e.g. a nutrient bound which isn't a number, or a mangled cursor
+        flash(str(e))
+        results = SearchPage([], 0)
     except Exception:
-        recipes = []
-        total_results = 0
-
-    # Determine pagination
-    prev_url = url_for(".search", page=page - 1, **criteria) if page > 0 else None
+        results = SearchPage([], 0)
+
+    # Determine pagination. Next/previous pages are fetched with opaque cursors
+    # (search_after), so deep pages don't get slower or hit the result window.
+    url_criteria = dict(criteria, tags=",".join(tags))
+    prev_url = (
+        url_for(".search", cursor=results.prev_cursor, **url_criteria)
+        if results.prev_cursor
+        else None
+    )
     next_url = (
-        url_for(".search", page=page + 1, **criteria)
-        if ((page + 1) * per_page < total_results)
+        url_for(".search", cursor=results.next_cursor, **url_criteria)
+        if results.next_cursor
         else None
     )
 
+    # Nutrient facets, as (label, count, URL narrowing the search to the bucket)
+    facet_links = {}
+    for field, interval in FACET_HISTOGRAMS.items():
+        min_name, max_name = RANGE_CRITERIA[field]
+        facet_links[field] = []
+        for low, count in sorted(results.facets.get(field, {}).items()):
+            high = low + interval - 1
+            bucket_criteria = dict(url_criteria, **{min_name: low, max_name: high})
+            url = url_for(".search", **bucket_criteria)
+            facet_links[field].append((f"{low}-{high}", count, url))
+
     return render_template(
         "search.html",
         id="search",
-        recipes=recipes,
-        total_results=total_results,
+        recipes=results.recipes,
+        total_results=results.total,
+        facets=results.facets,
+        facet_links=facet_links,
+        did_you_mean=results.did_you_mean,
         form=form,
         prev_url=prev_url,
         next_url=next_url,
@@ -146,6 +196,9 @@ def recipe(recipe_id):
     1. If the OpenRecipes image URL is valid, it is used.
     2. If the OpenRecipes URL is not valid, a Google Search is carried out with the recipe name, and the first image result is used.
     3. The Google API has a quota of 100 queries per day. If this limit is reached, a default image is used (from the static folder)
+    4. If resolving the image takes longer than RECIPE_IMAGE_BUDGET, the default image is used for now (the resolution finishes in the background, and is cached for the next view)
+
+    The image and the recipes related to this one are looked up concurrently (see app/concurrency.py).
 
     Returns:
         The rendered template recipe.html for the requested recipe (by ID).
@@ -156,32 +209,145 @@ def recipe(recipe_id):
     if not recipe:
         abort(404)
 
+    # The image and the related recipes don't depend on each other, so look
+    # them up at the same time, and only wait for each until its deadline
+    started = time.monotonic()
+    image = submit(recipe.get_image_url, use_google=True)
+    related = submit(Recipe.get_related_recipes, recipe)
+    default_image = url_for("static", filename="images/default_recipe_image.jpg")
+
     return render_template(
-        "recipe.html", recipe=recipe, image_url=recipe.get_image_url(use_google=True)
+        "recipe.html",
+        recipe=recipe,
+        image_url=result_by(
+            image, started + current_app.config["RECIPE_IMAGE_BUDGET"], default_image
+        ),
+        related_recipes=result_by(
+            related, started + current_app.config["RECIPE_RELATED_BUDGET"], []
+        ),
+        grocery_form=GroceryListAddForm() if current_user.is_authenticated else None,
     )
 
 
 @main.route("/fridge", methods=["GET", "POST"])
+@main.route("/fridge/<int:page>/", methods=["GET", "POST"])
 @login_required
-def fridge():
-    """View function for fridge/ inventory feature
+def fridge(page=0):
+    """View function for the fridge/ inventory feature
 
-    Note: This feature is not implemented yet. fridge.html displays a "coming soon" page.
+    Lists the ingredients in the user's virtual fridge, and the recipes which
+    use them, best covered first (see app/fridge.py).
 
+    Args:
+        page: page of matching recipes to return, default is 0th page
     Returns:
         The rendered template for fridge.html.
+
+        On POST request (add to fridge form submission), redirects back to a GET request.
     """
-    return render_template("fridge.html", id="my-fridge")
+    per_page = 20
 
+    form = FridgeForm()
+    if form.validate_on_submit():
+        try:
+            added = add_to_fridge(current_user.id, form.items.data)
+        except ValueError as e:
+            flash(str(e))
+        else:
+            if not added:
+                flash("Those are already in your fridge!")
+        return redirect(url_for(".fridge"))
 
-@main.route("/grocerylist", methods=["GET", "POST"])
+    try:
+        results = match_recipes(current_user.id, page=page, per_page=per_page)
+    except Exception:
+        results = FridgeMatches([], 0, False)
+
+    prev_url = url_for(".fridge", page=page - 1) if page > 0 else None
+    next_url = (
+        url_for(".fridge", page=page + 1)
+        if (page + 1) * per_page < results.total
+        else None
+    )
+
+    return render_template(
+        "fridge.html",
+        id="my-fridge",
+        form=form,
+        remove_form=FridgeRemoveForm(),
+        items=current_user.fridge_items.order_by(FridgeItem.name).all(),
+        matches=results.matches,
+        total_results=results.total,
+        timed_out=results.timed_out,
+        prev_url=prev_url,
+        next_url=next_url,
+    )
+
+
+@main.route("/fridge/remove/<int:item_id>", methods=["POST"])
+@login_required
+def fridge_remove(item_id):
+    """View function for removing an item from the user's fridge
+
+    Returns:
+        A redirect back to the fridge page.
+    """
+    if FridgeRemoveForm().validate_on_submit():
+        remove_from_fridge(current_user.id, item_id)
+    return redirect(url_for(".fridge"))
+
+
+@main.route("/grocerylist")
 @login_required
 def grocerylist():
-    """View function for grocerylist feature
+    """View function for the grocery list feature
 
-    Note: This feature is not implemented yet. grocerylist.html displays a "coming soon" page.
+    Lists the recipes on the user's grocery list, and one shopping list of all
+    their ingredients, with quantities summed across recipes (see app/grocery.py).
 
     Returns:
         The rendered template for grocerylist.html
     """
-    return render_template("grocerylist.html", id="grocery-list")
+    try:
+        recipes, items = get_grocery_list(current_user.id)
+    except Exception:
+        recipes, items = [], []
+        flash("Your grocery list isn't available right now, please try again later")
+
+    return render_template(
+        "grocerylist.html",
+        id="grocery-list",
+        remove_form=GroceryListRemoveForm(),
+        recipes=recipes,
+        items=items,
+    )
+
+
+@main.route("/grocerylist/add/<recipe_id>", methods=["POST"])
+@login_required
+def grocerylist_add(recipe_id):
+    """View function for adding a recipe to the user's grocery list
+
+    Returns:
+        A redirect to the grocery list page.
+    """
+    if GroceryListAddForm().validate_on_submit():
+        try:
+            add_to_grocery_list(current_user.id, recipe_id)
+        except ValueError as e:
+            flash(str(e))
+            return redirect(url_for(".recipe", recipe_id=recipe_id))
+    return redirect(url_for(".grocerylist"))
+
+
+@main.route("/grocerylist/remove/<recipe_id>", methods=["POST"])
+@login_required
+def grocerylist_remove(recipe_id):
+    """View function for removing a recipe from the user's grocery list
+
+    Returns:
+        A redirect back to the grocery list page.
+    """
+    if GroceryListRemoveForm().validate_on_submit():
+        remove_from_grocery_list(current_user.id, recipe_id)
+    return redirect(url_for(".grocerylist"))
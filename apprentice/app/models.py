@@ -26,6 +26,8 @@ class User(UserMixin, db.Model):
         email: the user's email (up to 254 characters)
         username: the user's username (up to 64 characters)
         password_hash: the user's password stored as a hash (using Werkzeug security)
+        fridge_items: the ingredients in the user's virtual fridge (see FridgeItem)
+        grocery_recipes: the recipes on the user's grocery list (see GroceryListRecipe)
     """
 
     __tablename__ = "users"
@@ -34,6 +36,15 @@ class User(UserMixin, db.Model):
     email = db.Column(db.String(254), unique=True, index=True)
     username = db.Column(db.String(64), unique=True, index=True)
     password_hash = db.Column(db.String(128))
+    fridge_items = db.relationship(
+        "FridgeItem", backref="user", lazy="dynamic", cascade="all, delete-orphan"
+    )
+    grocery_recipes = db.relationship(
+        "GroceryListRecipe",
+        backref="user",
+        lazy="dynamic",
+        cascade="all, delete-orphan",
+    )
 
     def __repr__(self):
         return "<User %r>" % self.username
@@ -62,3 +73,44 @@ class User(UserMixin, db.Model):
             password: the password to compare to the stored hash.
         """
         return check_password_hash(self.password_hash, password)
+
+
+class FridgeItem(db.Model):
+    """An ingredient in a user's virtual fridge.
+
+    Attributes:
+        id: the item's unique id
+        user_id: the id of the user whose fridge the item is in
+        name: the ingredient's normalized name (see app/ingredients.py), which
+            matches the ingredientNames of recipes (up to 128 characters)
+    """
+
+    __tablename__ = "fridge_items"
+    __table_args__ = (db.UniqueConstraint("user_id", "name"),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), index=True)
+    name = db.Column(db.String(128))
+
+    def __repr__(self):
+        return "<FridgeItem %r>" % self.name
+
+
+class GroceryListRecipe(db.Model):
+    """A recipe on a user's grocery list.
+
+    Attributes:
+        id: the entry's unique id
+        user_id: the id of the user whose grocery list the recipe is on
+        recipe_id: the Elasticsearch ID of the recipe (up to 64 characters)
+    """
+
+    __tablename__ = "grocery_list_recipes"
+    __table_args__ = (db.UniqueConstraint("user_id", "recipe_id"),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), index=True)
+    recipe_id = db.Column(db.String(64))
+
+    def __repr__(self):
+        return "<GroceryListRecipe %r>" % self.recipe_id
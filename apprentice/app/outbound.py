@@ -0,0 +1,113 @@
+import time
+from urllib.parse import urljoin
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class OutboundTimeout(requests.Timeout):
+    """Raised when an outbound request runs out of its total time budget."""
+
+
+class OutboundClient:
+    """A pooled, keep-alive HTTP client for the app's outbound requests.
+
+    Connections are kept alive and pooled per host, every request has connect
+    and read timeouts, and each call (including any redirects it follows) has
+    to finish within a total time budget, so a slow third-party host can only
+    hold up a page for a bounded amount of time.
+
+    Usage:
+
+        >>> client = OutboundClient(total_timeout=2.0)
+        >>> client.head("https://example.com/image.jpg").status_code
+        200
+
+    Args:
+        connect_timeout: Seconds to wait for a connection to be established.
+        read_timeout: Seconds to wait between bytes from the server.
+        total_timeout: Default total seconds a call may take, redirects included.
+        pool_hosts: The number of per-host connection pools to keep.
+        pool_size: The number of connections to keep alive per host.
+        max_redirects: The maximum number of redirects a call will follow.
+        timer: A callable returning the current time in seconds (for testing).
+    """
+
+    def __init__(
+        self,
+        connect_timeout=1.0,
+        read_timeout=2.0,
+        total_timeout=3.0,
+        pool_hosts=32,
+        pool_size=10,
+        max_redirects=5,
+        timer=time.monotonic,
+    ):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.total_timeout = total_timeout
+        self.max_redirects = max_redirects
+        self._timer = timer
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_hosts, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def head(self, url, budget=None):
+        """Send a HEAD request, following redirects within the time budget.
+
+        Args:
+            url: The URL to request.
+            budget: Total seconds the call may take, defaults to total_timeout.
+
+        Returns:
+            The final requests.Response.
+
+        Raises:
+            OutboundTimeout: If the budget runs out before a final response.
+            requests.TooManyRedirects: If more than max_redirects are followed.
+            requests.RequestException: For any other request failure.
+        """
+        return self.request("HEAD", url, budget=budget)
+
+    def request(self, method, url, budget=None, **kwargs):
+        """Send a request, following redirects within the time budget.
+
+        Args:
+            method: The HTTP method to use.
+            url: The URL to request.
+            budget: Total seconds the call may take, defaults to total_timeout.
+            kwargs: Passed through to requests.Session.request.
+
+        Returns:
+            The final requests.Response.
+        """
+        deadline = self._timer() + (self.total_timeout if budget is None else budget)
+
+        for _ in range(self.max_redirects + 1):
+            remaining = deadline - self._timer()
+            if remaining <= 0:
+                raise OutboundTimeout(f"Ran out of time budget requesting {url}")
+
+            response = self.session.request(
+                method,
+                url,
+                allow_redirects=False,
+                timeout=(
+                    min(self.connect_timeout, remaining),
+                    min(self.read_timeout, remaining),
+                ),
+                **kwargs,
+            )
+            if not response.is_redirect:
+                return response
+
+            url = urljoin(response.url, response.headers["location"])
+            response.close()
+
+        raise requests.TooManyRedirects(f"Exceeded {self.max_redirects} redirects")
+
+    def close(self):
+        """Close all pooled connections."""
+        self.session.close()
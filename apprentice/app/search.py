@@ -1,15 +1,254 @@
-import requests
-from elasticsearch_dsl import Document, Keyword, Q, Short, Text
+import base64
+import json
+from collections import namedtuple
+
+from elasticsearch.exceptions import TransportError
+from elasticsearch_dsl import (
+    Completion,
+    Date,
+    Document,
+    Integer,
+    Keyword,
+    Q,
+    Short,
+    Text,
+)
 from flask import current_app, url_for
 from google_images_search import GoogleImagesSearch
 
+from .ingredients import ingredient_names
+
+# Sentinel for telling cache misses apart from cached negative (None) results
+_MISSING = object()
+
+# Key under which the index generation marker is cached in the search cache
+_GENERATION_KEY = "__generation__"
+
+# Values of Recipe.imageStatus, as written by recipe-db/loading-scripts/load.py
+IMAGE_OK = "ok"
+IMAGE_BROKEN = "broken"
+IMAGE_MISSING = "missing"
+
+# A stable sort order for search results, which search_after cursors rely on.
+# The recipeId tiebreak orders recipes with equal scores (e.g. with no query).
+# It's a keyword copy of the _id, since sorting on _id itself loads fielddata.
+SORT_ORDER = [{"_score": "desc"}, {"recipeId": "asc"}]
+REVERSE_SORT_ORDER = [{"_score": "asc"}, {"recipeId": "desc"}]
+
+# The range criteria get_recipes_by_criteria accepts, as
+# {field: (minimum criterion, maximum criterion)}, where None means no such bound
+RANGE_CRITERIA = {
+    "calories": ("minCalories", "maxCalories"),
+    "carbohydrate": ("minCarbs", "maxCarbs"),
+    "protein": ("minProteins", "maxProteins"),
+    "fat": ("minFats", "maxFats"),
+    "prepMinutes": (None, "maxPrepMinutes"),
+    "cookMinutes": (None, "maxCookMinutes"),
+    "totalMinutes": (None, "maxTotalMinutes"),
+}
+RANGE_CRITERIA_NAMES = {name for bounds in RANGE_CRITERIA.values() for name in bounds}
+RANGE_CRITERIA_NAMES.discard(None)
+
+# The nutrient facets on the search page, as {field: histogram bucket width}
+FACET_HISTOGRAMS = {"calories": 200, "carbohydrate": 15, "protein": 10, "fat": 20}
+
+# A page of search results, as returned by Recipe.search_recipes. The cursors
+# are opaque strings for fetching the next/previous pages, or None if there are
+# no such pages. facets maps each facet name to a dict of {value: count}, where
+# the values of nutrient facets are the lower bounds of their (FACET_HISTOGRAMS)
+# buckets, and did_you_mean is a spelling correction of the query (or None).
+SearchPage = namedtuple(
+    "SearchPage",
+    ["recipes", "total", "next_cursor", "prev_cursor", "facets", "did_you_mean"],
+    defaults=(None, None, {}, None),
+)
+
+# The result of Recipe.get_recipes_by_ids: the found Recipes in the requested
+# order, and the requested IDs that weren't found
+RecipeBatch = namedtuple("RecipeBatch", ["recipes", "missing"])
+
+
+def encode_cursor(page, after, reverse=False):
+    """Encode a search_after position into an opaque, URL-safe cursor string.
+
+    Args:
+        page: The page number the cursor leads to.
+        after: The sort values of the hit to search after.
+        reverse: If true, the cursor leads backwards (to a previous page).
+
+    Returns:
+        A string cursor.
+    """
+    data = json.dumps({"page": page, "after": after, "reverse": reverse})
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Decode a cursor string made by encode_cursor.
+
+    Args:
+        cursor: A string cursor.
+
+    Returns:
+        A dict of page, after and reverse.
+
+    Raises:
+        ValueError: If the cursor is malformed.
+    """
+    try:
+        padding = "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(cursor + padding))
+        return {
+            "page": int(data["page"]),
+            "after": list(data["after"]),
+            "reverse": bool(data["reverse"]),
+        }
+    except Exception as e:
+        raise ValueError(f"Invalid search cursor {cursor!r}") from e
+
+
+class RecipeRow:
+    """A lightweight, read-only search listing entry for a Recipe.
+
+    Only holds the fields needed to list a recipe (see Recipe.LISTING_FIELDS),
+    and uses __slots__ so pages of results stay small in memory and in the
+    search cache.
+
+    Attributes:
+        id: A string, the Elasticsearch ID of the recipe.
+        name: A string, the recipe title.
+        image: An optional string, the URL for an image of the recipe.
+        imageStatus: An optional string, the loader's check of the image.
+    """
+
+    __slots__ = ("id", "name", "image", "imageStatus")
+
+    def __init__(self, id, name, image=None, imageStatus=None):
+        self.id = id
+        self.name = name
+        self.image = image
+        self.imageStatus = imageStatus
+
+    def __repr__(self):
+        return "<RecipeRow %r>" % self.id
+
+    def __eq__(self, other):
+        return isinstance(other, RecipeRow) and all(
+            getattr(self, slot) == getattr(other, slot) for slot in self.__slots__
+        )
+
+    @classmethod
+    def from_hit(cls, hit):
+        """Build a RecipeRow from a raw Elasticsearch hit dict."""
+        source = hit.get("_source", {})
+        return cls(
+            hit["_id"],
+            source.get("name"),
+            image=source.get("image"),
+            imageStatus=source.get("imageStatus"),
+        )
+
+
+def parse_bound(name, value):
+    """Validate and convert a range criterion (e.g. maxCalories) to an int.
+
+    Args:
+        name: The name of the criterion, for the error message.
+        value: The given value, e.g. a string from the query args.
+
+    Returns:
+        The bound as an int (0 is a valid bound), or None if it's blank.
+
+    Raises:
+        ValueError: If the value isn't a non-negative whole number.
+    """
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return None
+    try:
+        bound = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} must be a whole number, not {value!r}") from None
+    if bound < 0:
+        raise ValueError(f"{name} must not be negative, not {value!r}")
+    return bound
+
+
+def range_filters(criteria):
+    """Compile the range criteria (see RANGE_CRITERIA) into range bounds.
+
+    Both bounds on a field go into the same range, so each field gets one
+    filter clause however many of its criteria are given.
+
+    Usage:
+
+        >>> range_filters({"minFats": "5", "maxFats": 20, "maxCalories": 0})
+        {'calories': {'lte': 0}, 'fat': {'gte': 5, 'lte': 20}}
+
+    Args:
+        criteria: A dict of criteria, as accepted by get_recipes_by_criteria.
+
+    Returns:
+        A dict of {field: {"gte": int, "lte": int}}, with only the given bounds.
+
+    Raises:
+        ValueError: If a bound isn't a non-negative whole number.
+    """
+    ranges = {}
+    for field, names in RANGE_CRITERIA.items():
+        for op, name in zip(("gte", "lte"), names):
+            bound = parse_bound(name, criteria.get(name)) if name else None
+            if bound is not None:
+                ranges.setdefault(field, {})[op] = bound
+    return ranges
+
+
+def canonical_criteria(criteria):
+    """Normalize search criteria into a hashable, order-independent form.
+
+    Falsy values are dropped (they're ignored by get_recipes_by_criteria
+    anyway), range bounds are converted to ints (0 is kept), ingredients are
+    split and normalized (see ingredient_names), and list values are
+    de-duplicated and sorted, so equivalent criteria compare equal.
+
+    Args:
+        criteria: A dict of criteria, as accepted by get_recipes_by_criteria.
+
+    Returns:
+        A sorted tuple of (name, value) pairs, with list values as tuples.
+
+    Raises:
+        ValueError: If a range bound isn't a non-negative whole number.
+    """
+    canonical = []
+    for name, value in criteria.items():
+        if name in RANGE_CRITERIA_NAMES:
+            value = parse_bound(name, value)
+            if value is not None:
+                canonical.append((name, value))
+            continue
+        if name == "ingredients" and value:
+            value = ingredient_names(
+                value.split(",") if isinstance(value, str) else value
+            )
+        if isinstance(value, (list, tuple, set)):
+            value = tuple(sorted({str(v).strip() for v in value} - {""}))
+        elif isinstance(value, str):
+            value = value.strip()
+        if value:
+            canonical.append((name, value))
+    return tuple(sorted(canonical))
+
 
 class Recipe(Document):
     """Python representation of a Recipe document in Elasticsearch.
 
     Args:
+        recipeId: A string, the recipe's (Elasticsearch) ID, for sorting on
         name: A string, the recipe title.
+        nameSuggest: A list of strings, the autocomplete inputs for the name
         ingredients: A list of strings, the ingredients of the recipe.
+        ingredientNames: A list of strings, the normalized names of the
+            ingredients (e.g. "olive oil" for "1/2 cup extra-virgin olive oil")
         url: A string, the URL from where the recipe was sourced
         source: A string, the original publisher of the recipe
 
@@ -18,7 +257,15 @@ class Recipe(Document):
         fat: An int, the fat count of the recipe. randint(0, 100)
         protein: An int, the protein count of the recipe. randint(0, 50)
 
+        prepMinutes: An optional int, the prep time in minutes
+        cookMinutes: An optional int, the cook time in minutes
+        totalMinutes: An optional int, the total time in minutes (the prep
+            plus cook time, if the recipe doesn't give a total)
+
         image: A optional string, the URL for an image of the recipe
+        imageStatus: An optional string, whether the loader found the image
+            reachable ("ok"), unreachable ("broken") or absent ("missing")
+        imageCheckedAt: An optional date, when the loader checked the image
         cookTime: An optional string, the cook time
         recipeYield: An optional string, the recipe yield
         datePublished: An optional string, the original publish date
@@ -32,15 +279,23 @@ class Recipe(Document):
     """
 
     # These fields should be identical to those in recipe-db/loading-scripts/recipe-mapping.json
+    recipeId = Keyword()
     name = Text(fields={"keyword": Keyword()})
+    nameSuggest = Completion()
     ingredients = Text(fields={"keyword": Keyword()})
+    ingredientNames = Keyword()
     url = Text(fields={"keyword": Keyword()})
     source = Text(fields={"keyword": Keyword()})
     calories = Short()
     carbohydrate = Short()
     fat = Short()
     protein = Short()
+    prepMinutes = Integer()
+    cookMinutes = Integer()
+    totalMinutes = Integer()
     image = Text(fields={"keyword": Keyword()})
+    imageStatus = Keyword()
+    imageCheckedAt = Date()
     cookTime = Text(fields={"keyword": Keyword()})
     recipeYield = Text(fields={"keyword": Keyword()})
     datePublished = Text(fields={"keyword": Keyword()})
@@ -52,13 +307,19 @@ class Recipe(Document):
     recipeInstructions = Text(fields={"keyword": Keyword()})
     tags = Text(fields={"keyword": Keyword()})
 
+    # The fields fetched for search listings (see RecipeRow)
+    LISTING_FIELDS = list(RecipeRow.__slots__[1:])
+
     # The Index inner class is where we define connection config
     class Index:
+        # An alias, which the loader atomically moves to each newly loaded
+        # versioned index (e.g. recipes-20201118120000)
         name = "recipes"
 
     @classmethod
     def _get_using(cls, using=None):
-        """Override base method for specifying our current Elasticsearch connection"""
+        """Override base method for specifying our current search backend: an
+        Elasticsearch client, or an in-process MemoryBackend (see app/backends.py)"""
         return current_app.elasticsearch
 
     def get_image_url(self, use_google=False):
@@ -67,6 +328,10 @@ class Recipe(Document):
         else it will do a Google image search, else it will return a default
         placeholder image.
 
+        Resolutions are cached per recipe (see IMAGE_CACHE_* in config.py) so
+        repeat views don't repeat the outbound requests. Failed resolutions
+        are cached for a shorter time than successful ones.
+
         Args:
             use_google: If true, will make an API call to Google images for missing
                 images, else it will skip this step (for API quota purposes).
@@ -74,15 +339,41 @@ class Recipe(Document):
         Returns:
             A string URL which can be GET requested to obtain an image
         """
-        # First try the OpenRecipes image
-        try:
-            response = requests.head(self.image, allow_redirects=True)
+        cache = current_app.image_cache
+        key = (self.meta.id, self.image, use_google)
+
+        image_url = cache.get(key, default=_MISSING)
+        if image_url is _MISSING:
+            image_url = self._resolve_image_url(use_google=use_google)
+            if image_url:
+                cache.set(key, image_url)
+            else:
+                cache.set(key, None, ttl=current_app.config["IMAGE_CACHE_NEGATIVE_TTL"])
+
+        # Else return our default image
+        return image_url or url_for(
+            "static", filename="images/default_recipe_image.jpg"
+        )
+
+    def _resolve_image_url(self, use_google=False):
+        """Do the (uncached) outbound requests behind get_image_url.
+
+        Returns:
+            A string URL for an image of this recipe, or None if none was found
+        """
+        # First try the OpenRecipes image, trusting the loader's check if it did one
+        if self.imageStatus == IMAGE_OK:
+            return self.image
+
+        if self.imageStatus not in (IMAGE_BROKEN, IMAGE_MISSING):
+            try:
+                response = current_app.http_client.head(self.image)
 
-            if response.status_code == 200:
-                return self.image
-        except Exception:
-            # e.g. timeout
-            pass
+                if response.status_code == 200:
+                    return self.image
+            except Exception:
+                # e.g. timeout, ran out of time budget
+                pass
 
         # Then try the first Google Image search result
         if use_google:
@@ -101,8 +392,7 @@ class Recipe(Document):
                 # e.g. API quota limit reached
                 pass
 
-        # Else return our default image
-        return url_for("static", filename="images/default_recipe_image.jpg")
+        return None
 
     # THESE ARE SAMPLE METHODS FOR YOU TO GET DATA FROM
 
@@ -142,19 +432,76 @@ class Recipe(Document):
     def get_recipe_by_id(cls, recipe_id):
         """Return a single Recipe object from Elasticsearch by its ID
 
+        Recipes are cached by ID (see RECIPE_CACHE_* in config.py).
+
         Args:
             recipe_id: The ID of the recipe to get.
 
         Returns:
             The Recipe object corresponding to the given ID, or None if not found
         """
-        try:
-            return cls.get(recipe_id)
-        except Exception:
-            return None
+        cache = current_app.recipe_cache
+        key = (cls.get_index_generation(), recipe_id)
+
+        recipe = cache.get(key)
+        if recipe is None:
+            try:
+                recipe = cls.get(recipe_id)
+            except Exception:
+                return None
+            cache.set(key, recipe)
+
+        return recipe
+
+    @classmethod
+    def get_recipes_by_ids(cls, ids, fields=None):
+        """Return several Recipe objects by their IDs in one round-trip (mget)
+
+        Usage:
+
+            >>> recipes, missing = Recipe.get_recipes_by_ids(["id1", "id2", "id3"])
+            >>> # e.g. if id2 doesn't exist
+            >>> [r.meta.id for r in recipes], missing
+            (['id1', 'id3'], ['id2'])
+
+        Args:
+            ids: A list of the IDs of the recipes to get.
+            fields: If given, a list of the only fields to fetch for each recipe.
+                Recipes already in the (full document) recipe cache are still
+                returned whole.
+
+        Returns:
+            A RecipeBatch of (list of the found Recipe objects in the order of
+            ids, list of the IDs which weren't found)
+        """
+        cache = current_app.recipe_cache
+        generation = cls.get_index_generation()
+
+        found = {}
+        for recipe_id in ids:
+            recipe = cache.get((generation, recipe_id))
+            if recipe is not None:
+                found[recipe_id] = recipe
+
+        to_fetch = list(dict.fromkeys(i for i in ids if i not in found))
+        if to_fetch:
+            kwargs = {} if fields is None else {"_source_includes": fields}
+            recipes = cls.mget(to_fetch, missing="none", **kwargs)
+            for recipe_id, recipe in zip(to_fetch, recipes):
+                if recipe is not None:
+                    found[recipe_id] = recipe
+                    # Only cache whole documents
+                    if fields is None:
+                        cache.set((generation, recipe_id), recipe)
+
+        return RecipeBatch(
+            [found[i] for i in ids if i in found], [i for i in ids if i not in found]
+        )
 
     @classmethod
-    def get_recipes_by_criteria(cls, page=0, per_page=10, **criteria):
+    def get_recipes_by_criteria(
+        cls, page=0, per_page=10, fields=None, cursor=None, facets=False, **criteria
+    ):
         """Advanced search wrapper for Recipes.
 
         An example set of criteria is as follows:
@@ -170,9 +517,14 @@ class Recipe(Document):
             "maxProteins": 100,
             "minFats": 0,
             "maxFats": 100,
+            "maxPrepMinutes": 15,
+            "maxCookMinutes": 30,
+            "maxTotalMinutes": 45,
         }
         Note that all of the items are optional and will be ignored if omitted or
-        if falsy values are provided (e.g. False, None, [], {}, "")
+        if falsy values are provided (e.g. False, None, [], {}, ""), except that
+        0 is a valid range bound. Range bounds may be ints or strings of ints
+        (e.g. straight from the query args).
 
         Usage::
             >>> # e.g. direct kwargs
@@ -184,20 +536,45 @@ class Recipe(Document):
         Args:
             page: The page of results to get
             per_page: The size of each page of results to get
+            fields: If given, a list of the only fields to fetch for each
+                recipe, e.g. Recipe.LISTING_FIELDS
+            cursor: If given, a decoded cursor (see decode_cursor) to page
+                with search_after instead of page/per_page offsets, which
+                stays cheap on deep pages
+            facets: If true, also aggregate the facet counts of the matching
+                recipes: a "tags" terms aggregation, and a histogram for each
+                of FACET_HISTOGRAMS
             critiera: kwargs of the below
                 query: The recipe name to (partly) match
-                ingredients: List of ingredients the recipe should contain (any)
+                ingredients: List of ingredients the recipe should contain
+                    (any), matched by normalized name, so "2 Eggs" matches "egg"
                 tags: List of tags the recipe should match
-                calories: Integer tuple range
-                carbohydrate: Integer tuple range
-                fat: Integer tuple range
-                protein: Integer tuple range
+                minCalories/maxCalories: Calorie range (inclusive)
+                minCarbs/maxCarbs: Carbohydrate range (inclusive)
+                minProteins/maxProteins: Protein range (inclusive)
+                minFats/maxFats: Fat range (inclusive)
+                maxPrepMinutes: The longest prep time, in minutes
+                maxCookMinutes: The longest cook time, in minutes
+                maxTotalMinutes: The longest total time, in minutes
 
         Returns:
             An elasticsearch_dsl.Search object, which you can get a list
             of recipes out of by doing list(search_object.execute())
+
+        Raises:
+            ValueError: If a range bound isn't a non-negative whole number.
         """
-        search = cls.search()[page * per_page : (page + 1) * per_page]
+        if cursor:
+            search = cls.search()[:per_page].extra(search_after=cursor["after"])
+            search = search.sort(
+                *(REVERSE_SORT_ORDER if cursor["reverse"] else SORT_ORDER)
+            )
+        else:
+            search = cls.search()[page * per_page : (page + 1) * per_page]
+            search = search.sort(*SORT_ORDER)
+
+        if fields is not None:
+            search = search.source(fields)
 
         if criteria.get("query"):
             search = search.query(
@@ -208,8 +585,10 @@ class Recipe(Document):
         if criteria.get("ingredients"):
             ingredients = criteria.get("ingredients")
             if isinstance(ingredients, str):
-                ingredients = [i.strip() for i in ingredients.split(",")]
-            search = search.query("terms", ingredients=ingredients)
+                ingredients = ingredients.split(",")
+            search = search.filter(
+                "terms", ingredientNames=ingredient_names(ingredients)
+            )
 
         if criteria.get("tags"):
             search = search.filter(
@@ -220,44 +599,297 @@ class Recipe(Document):
                 },
             )
 
-        if criteria.get("minCalories"):
-            search = search.filter(
-                "range", calories={"gte": criteria.get("minCalories")}
+        # Range filters (in filter context, so their bitsets get cached)
+        for field, bounds in range_filters(criteria).items():
+            search = search.filter("range", **{field: bounds})
+
+        if facets:
+            search.aggs.bucket("tags", "terms", field="tags.keyword", size=10)
+            for field, interval in FACET_HISTOGRAMS.items():
+                search.aggs.bucket(field, "histogram", field=field, interval=interval)
+
+        return search
+
+    @classmethod
+    def search_recipes(cls, page=0, per_page=10, cursor=None, **criteria):
+        """Cached, executed version of get_recipes_by_criteria.
+
+        Results are cached by the canonical form of the criteria, the page and
+        the index generation (see get_index_generation), so a reload of the
+        recipes index invalidates every cached page.
+
+        Args:
+            page: The page of results to get (ignored if cursor is given)
+            per_page: The size of each page of results to get
+            cursor: An opaque cursor string from a previous SearchPage
+            criteria: kwargs as accepted by get_recipes_by_criteria
+
+        Returns:
+            A SearchPage of (list of RecipeRow objects, total number of hits,
+            next page cursor, previous page cursor)
+
+        Raises:
+            ValueError: If the cursor is malformed.
+        """
+        cache = current_app.search_cache
+        criteria = canonical_criteria(criteria)
+        key = (cls.get_index_generation(), criteria, page, per_page, cursor)
+
+        results = cache.get(key)
+        if results is None:
+            decoded = decode_cursor(cursor) if cursor else None
+            if decoded:
+                page = decoded["page"]
+
+            criteria = {k: list(v) if isinstance(v, tuple) else v for k, v in criteria}
+            listing = cls.get_recipes_by_criteria(
+                page=page,
+                per_page=per_page,
+                fields=cls.LISTING_FIELDS,
+                cursor=decoded,
+                **criteria,
             )
+            facets = cls.get_recipe_facets(**criteria)
+            searches = [listing, facets]
+            if criteria.get("query"):
+                searches.append(cls.get_query_corrections(criteria["query"]))
+
+            # Send everything in one round-trip
+            responses = cls._execute_many(searches)
+            response = responses[0]
+            if "error" in response:
+                raise TransportError(
+                    response.get("status", 500), "search_error", response["error"]
+                )
 
-        if criteria.get("maxCalories"):
-            search = search.filter(
-                "range", calories={"lte": criteria.get("maxCalories")}
+            hits = response["hits"]["hits"]
+            if decoded and decoded["reverse"]:
+                hits.reverse()
+            total = response["hits"]["total"]["value"]
+            # Elasticsearch stops counting at 10000 hits (relation "gte"), so
+            # past that a full page is the only hint that there's another one
+            capped = response["hits"]["total"].get("relation") == "gte"
+
+            next_cursor = prev_cursor = None
+            if hits and (
+                (page + 1) * per_page < total or (capped and len(hits) == per_page)
+            ):
+                next_cursor = encode_cursor(page + 1, hits[-1]["sort"])
+            if hits and page > 0:
+                prev_cursor = encode_cursor(page - 1, hits[0]["sort"], reverse=True)
+
+            # Facets and suggestions are nice-to-haves, so don't fail on them
+            facet_counts = {}
+            for name, agg in responses[1].get("aggregations", {}).items():
+                counts = {b["key"]: b["doc_count"] for b in agg["buckets"]}
+                if name in FACET_HISTOGRAMS:
+                    # Histogram keys are floats (e.g. 200.0), and the buckets
+                    # between the lowest and highest values can be empty
+                    counts = {int(k): n for k, n in counts.items() if n}
+                facet_counts[name] = counts
+
+            did_you_mean = None
+            if len(responses) > 2:
+                suggestions = responses[2].get("suggest", {}).get("query", [])
+                options = [o["text"] for s in suggestions for o in s["options"]]
+                if options and options[0] != criteria["query"].lower():
+                    did_you_mean = options[0]
+
+            results = SearchPage(
+                [RecipeRow.from_hit(hit) for hit in hits],
+                total,
+                next_cursor,
+                prev_cursor,
+                facet_counts,
+                did_you_mean,
             )
+            cache.set(key, results)
 
-        if criteria.get("minCarbs"):
-            search = search.filter("range", calories={"gte": criteria.get("minCarbs")})
+        return results
 
-        if criteria.get("maxCarbs"):
-            search = search.filter("range", calories={"lte": criteria.get("maxCarbs")})
+    @classmethod
+    def get_recipe_facets(cls, **criteria):
+        """Return a search for the facet counts of recipes matching criteria.
 
-        if criteria.get("minProteins"):
-            search = search.filter(
-                "range", calories={"gte": criteria.get("minProteins")}
-            )
+        It only aggregates (size 0), so Elasticsearch can answer it from the
+        shard request cache whatever page of results is being listed.
 
-        if criteria.get("maxProteins"):
-            search = search.filter(
-                "range", calories={"lte": criteria.get("maxProteins")}
+        Args:
+            criteria: kwargs as accepted by get_recipes_by_criteria
+
+        Returns:
+            An elasticsearch_dsl.Search object
+        """
+        search = cls.get_recipes_by_criteria(per_page=0, facets=True, **criteria)
+        return search.extra(track_total_hits=False)
+
+    @classmethod
+    def get_query_corrections(cls, query):
+        """Return a search for a "did you mean" spelling correction of a query.
+
+        Args:
+            query: The recipe name query to correct
+
+        Returns:
+            An elasticsearch_dsl.Search object, whose "query" phrase suggestion
+            holds the correction (if any)
+        """
+        search = cls.search()[:0].extra(track_total_hits=False)
+        return search.suggest(
+            "query",
+            query,
+            phrase={
+                "field": "name",
+                "size": 1,
+                "direct_generator": [{"field": "name", "suggest_mode": "popular"}],
+            },
+        )
+
+    @classmethod
+    def _execute_many(cls, searches):
+        """Execute several searches in one round-trip (msearch), skipping
+        elasticsearch_dsl's response wrapping.
+
+        Args:
+            searches: A list of elasticsearch_dsl.Search objects
+
+        Returns:
+            A list of the raw response dicts from Elasticsearch, in order. A
+            search which failed has an "error" key instead of results.
+        """
+        body = []
+        for search in searches:
+            header = {"index": cls._index._name}
+            if search.to_dict().get("size") == 0:
+                header["request_cache"] = True
+            body.extend([header, search.to_dict()])
+        return cls._get_using().msearch(body=body)["responses"]
+
+    @classmethod
+    def get_index_generation(cls):
+        """Return the generation marker of the recipes index.
+
+        The loader stores a new marker in the index mapping's _meta every time
+        it (re)loads the index. It's only looked up every
+        SEARCH_CACHE_GENERATION_TTL seconds.
+
+        Returns:
+            The generation marker, or None if the index doesn't have one
+        """
+        cache = current_app.search_cache
+        generation = cache.get(_GENERATION_KEY, default=_MISSING)
+        if generation is _MISSING:
+            try:
+                mappings = cls._get_using().indices.get_mapping(index=cls._index._name)
+                # Keyed by the concrete index name
+                mapping = next(iter(mappings.values()))["mappings"]
+                generation = mapping.get("_meta", {}).get("generation")
+            except Exception:
+                generation = None
+            cache.set(
+                _GENERATION_KEY,
+                generation,
+                ttl=current_app.config["SEARCH_CACHE_GENERATION_TTL"],
             )
+        return generation
 
-        if criteria.get("minFats"):
-            search = search.filter("range", calories={"gte": criteria.get("minFats")})
+    @classmethod
+    def get_related_recipes(cls, recipe, size=4):
+        """Return recipes which share ingredients with a recipe, those sharing
+        the most (and the rarest) first.
 
-        if criteria.get("maxFats"):
-            search = search.filter("range", calories={"lte": criteria.get("maxFats")})
+        Results are cached like search_recipes', and the request is abandoned
+        after RECIPE_RELATED_BUDGET seconds (the recipe page won't wait longer).
 
-        return search
+        Args:
+            recipe: The Recipe to find related recipes for
+            size: The maximum number of recipes to return
+
+        Returns:
+            A list of RecipeRow objects
+        """
+        names = list(recipe.ingredientNames or [])
+        if not names:
+            return []
+
+        cache = current_app.search_cache
+        key = ("related", cls.get_index_generation(), recipe.meta.id, size)
+        related = cache.get(key)
+        if related is None:
+            query = Q(
+                "bool",
+                should=[Q("term", ingredientNames=name) for name in names],
+                must_not=[Q("ids", values=[recipe.meta.id])],
+                minimum_should_match=1,
+            )
+            search = cls.search()[:size].query(query).sort(*SORT_ORDER)
+            search = search.source(cls.LISTING_FIELDS)
+            search = search.params(
+                request_timeout=current_app.config["RECIPE_RELATED_BUDGET"]
+            )
+            response = search.execute().to_dict()
+            related = [RecipeRow.from_hit(hit) for hit in response["hits"]["hits"]]
+            cache.set(key, related)
+
+        return related
 
     @classmethod
-    def get_recipe_suggestions(cls, prefix):
-        search = cls.search()
+    def get_recipe_suggestions(cls, prefix, size=10):
+        """Return a search for Recipes whose name matches a (partial) prefix.
+
+        Only the name of each recipe is fetched. Prefer get_name_suggestions
+        for autocompletion, which uses the dedicated nameSuggest field.
+
+        Args:
+            prefix: The (partial) text to match
+            size: The maximum number of recipes to return
+
+        Returns:
+            An elasticsearch_dsl.Search object
+        """
+        search = cls.search().source(["name"])[:size]
         search = search.query(
             Q("match_phrase_prefix", name=prefix) | Q("prefix", name=prefix)
         )
         return search
+
+    @classmethod
+    def get_name_suggestions(cls, prefix, size=10):
+        """Return recipe names for autocompleting a prefix, using the
+        completion suggester on the nameSuggest field.
+
+        Args:
+            prefix: The (partial) text to complete
+            size: The maximum number of names to return
+
+        Returns:
+            A list of unique recipe names
+        """
+        search = cls.search().source(["name"])[:0]
+        search = search.suggest(
+            "names",
+            prefix,
+            completion={"field": "nameSuggest", "size": size, "skip_duplicates": True},
+        )
+        response = search.execute()
+
+        names = []
+        for option in response.suggest.names[0].options:
+            if option._source.name not in names:
+                names.append(option._source.name)
+        return names
+
+    @classmethod
+    def get_popular_names(cls, size=10000):
+        """Return the most common recipe names, for building autocomplete indices.
+
+        Args:
+            size: The maximum number of names to return
+
+        Returns:
+            A list of recipe names, most common first
+        """
+        search = cls.search()[:0]
+        search.aggs.bucket("names", "terms", field="name.keyword", size=size)
+        response = search.execute()
+        return [bucket.key for bucket in response.aggregations.names.buckets]
@@ -11,6 +11,63 @@ class Config:
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     ELASTICSEARCH_URL = os.environ.get("ELASTICSEARCH_URL") or "http://localhost:9200"
 
+    # Search backend (see app/backends.py): "elasticsearch" for the cluster at
+    # ELASTICSEARCH_URL, or "memory" for an in-process index of the recipes in
+    # SEARCH_DATA (a JSON lines export of {"_id", "_source"} documents)
+    SEARCH_BACKEND = os.environ.get("SEARCH_BACKEND") or "elasticsearch"
+    SEARCH_DATA = os.environ.get("SEARCH_DATA")
+
+    # Recipe image resolution cache (see Recipe.get_image_url)
+    IMAGE_CACHE_SIZE = int(os.environ.get("IMAGE_CACHE_SIZE") or 4096)
+    IMAGE_CACHE_TTL = int(os.environ.get("IMAGE_CACHE_TTL") or 24 * 60 * 60)
+    IMAGE_CACHE_NEGATIVE_TTL = int(
+        os.environ.get("IMAGE_CACHE_NEGATIVE_TTL") or 60 * 60
+    )
+
+    # Outbound HTTP client for third-party requests (e.g. recipe image checks)
+    OUTBOUND_CONNECT_TIMEOUT = float(os.environ.get("OUTBOUND_CONNECT_TIMEOUT") or 1.0)
+    OUTBOUND_READ_TIMEOUT = float(os.environ.get("OUTBOUND_READ_TIMEOUT") or 2.0)
+    OUTBOUND_TOTAL_TIMEOUT = float(os.environ.get("OUTBOUND_TOTAL_TIMEOUT") or 3.0)
+    OUTBOUND_POOL_HOSTS = int(os.environ.get("OUTBOUND_POOL_HOSTS") or 32)
+    OUTBOUND_POOL_SIZE = int(os.environ.get("OUTBOUND_POOL_SIZE") or 10)
+
+    # Shared thread pool for running a page's independent lookups concurrently
+    # (see app/concurrency.py), and how long the recipe page waits for each of
+    # them before rendering without (e.g. with the default image)
+    EXECUTOR_WORKERS = int(os.environ.get("EXECUTOR_WORKERS") or 32)
+    RECIPE_IMAGE_BUDGET = float(os.environ.get("RECIPE_IMAGE_BUDGET") or 1.5)
+    RECIPE_RELATED_BUDGET = float(os.environ.get("RECIPE_RELATED_BUDGET") or 1.0)
+
+    # Recipe document cache (see Recipe.get_recipe_by_id/get_recipes_by_ids)
+    RECIPE_CACHE_SIZE = int(os.environ.get("RECIPE_CACHE_SIZE") or 4096)
+    RECIPE_CACHE_TTL = int(os.environ.get("RECIPE_CACHE_TTL") or 60 * 60)
+
+    # Search result cache (see Recipe.search_recipes)
+    SEARCH_CACHE_SIZE = int(os.environ.get("SEARCH_CACHE_SIZE") or 1024)
+    SEARCH_CACHE_TTL = int(os.environ.get("SEARCH_CACHE_TTL") or 5 * 60)
+    SEARCH_CACHE_GENERATION_TTL = int(
+        os.environ.get("SEARCH_CACHE_GENERATION_TTL") or 30
+    )
+
+    # Autocomplete suggestions (see app/autocomplete.py). The in-process prefix
+    # index of the most common recipe names is disabled if its size is 0
+    AUTOCOMPLETE_SIZE = int(os.environ.get("AUTOCOMPLETE_SIZE") or 10)
+    AUTOCOMPLETE_PREFIX_INDEX_SIZE = int(
+        os.environ.get("AUTOCOMPLETE_PREFIX_INDEX_SIZE") or 0
+    )
+
+    # Virtual fridge (see app/fridge.py). Matching recipes against a fridge
+    # gives up after FRIDGE_SEARCH_BUDGET seconds
+    FRIDGE_MAX_ITEMS = int(os.environ.get("FRIDGE_MAX_ITEMS") or 500)
+    FRIDGE_CACHE_SIZE = int(os.environ.get("FRIDGE_CACHE_SIZE") or 1024)
+    FRIDGE_CACHE_TTL = int(os.environ.get("FRIDGE_CACHE_TTL") or 60 * 60)
+    FRIDGE_SEARCH_BUDGET = float(os.environ.get("FRIDGE_SEARCH_BUDGET") or 1.0)
+
+    # Grocery lists (see app/grocery.py), and the cache of parsed recipe ingredients
+    GROCERY_LIST_MAX_RECIPES = int(os.environ.get("GROCERY_LIST_MAX_RECIPES") or 50)
+    INGREDIENT_CACHE_SIZE = int(os.environ.get("INGREDIENT_CACHE_SIZE") or 4096)
+    INGREDIENT_CACHE_TTL = int(os.environ.get("INGREDIENT_CACHE_TTL") or 60 * 60)
+
 
 class DevelopmentConfig(Config):
     """Config class for development"""
@@ -26,6 +83,10 @@ class TestingConfig(Config):
 
     TESTING = True
     SQLALCHEMY_DATABASE_URI = os.environ.get("TEST_DATABASE_URL") or "sqlite://"
+    SEARCH_BACKEND = os.environ.get("TEST_SEARCH_BACKEND") or "memory"
+    SEARCH_DATA = os.environ.get("TEST_SEARCH_DATA") or os.path.join(
+        basedir, "tests", "fixtures", "recipes.json"
+    )
 
 
 class ProductionConfig(Config):
@@ -0,0 +1,278 @@
+import unittest
+
+from app import create_app
+from app.backends import (
+    SCORE_SCRIPTS,
+    MemoryBackend,
+    create_search_backend,
+    edit_distance,
+    iter_bitset,
+    to_bitset,
+)
+from app.fridge import COVERAGE_SCRIPT
+from app.search import Recipe
+from elasticsearch.exceptions import NotFoundError, RequestError
+
+# A tiny index, in the shape the loader writes (see recipe-mapping.json). The
+# bigger fixture the other tests search (tests/fixtures/recipes.json) is made
+# by running the loader's process_recipe over bench.generate_recipes
+RECIPES = [
+    {
+        "_id": "a",
+        "_source": {
+            "name": "Garlic Hummus Dip",
+            "nameSuggest": ["Garlic Hummus Dip", "Hummus Dip", "Dip"],
+            "ingredients": ["2 cups chickpeas", "3 cloves garlic"],
+            "ingredientNames": ["chickpea", "garlic"],
+            "tags": ["gluten-free", "vegetarian", "vegan"],
+            "calories": 90,
+            "totalMinutes": 10,
+        },
+    },
+    {
+        "_id": "b",
+        "_source": {
+            "name": "Chicken Salad",
+            "nameSuggest": ["Chicken Salad", "Salad"],
+            "ingredients": ["1 lb chicken", "1 head lettuce", "2 cloves garlic"],
+            "ingredientNames": ["chicken", "lettuce", "garlic"],
+            "tags": ["gluten-free"],
+            "calories": 450,
+            "totalMinutes": 25,
+        },
+    },
+    {
+        "_id": "c",
+        "_source": {
+            "name": "Chicken Chicken Soup",
+            "nameSuggest": ["Chicken Chicken Soup", "Chicken Soup", "Soup"],
+            "ingredients": ["1 whole chicken", "2 carrots"],
+            "ingredientNames": ["chicken", "carrot"],
+            "calories": 300,
+        },
+    },
+    {
+        "_id": "d",
+        "_source": {
+            "name": "Egg Salad",
+            "nameSuggest": ["Egg Salad", "Salad"],
+            "ingredients": ["6 eggs"],
+            "ingredientNames": ["egg"],
+            "tags": ["gluten-free", "vegetarian"],
+            "calories": 210,
+            "totalMinutes": 15,
+        },
+    },
+]
+
+
+class MemoryBackendTestCase(unittest.TestCase):
+    def setUp(self):
+        mapping = Recipe._doc_type.mapping.to_dict()["properties"]
+        self.backend = MemoryBackend(RECIPES, mapping, generation="1")
+
+    def search(self, **body):
+        """Searches the test index, returning the IDs of the hits in order"""
+        response = self.backend.search(index="recipes", body=body)
+        return [hit["_id"] for hit in response["hits"]["hits"]]
+
+    def test_bitsets(self):
+        self.assertEqual(list(iter_bitset(to_bitset([0, 9, 3]))), [0, 3, 9])
+        self.assertEqual(to_bitset([]), 0)
+
+    def test_edit_distance(self):
+        self.assertEqual(edit_distance("chicken", "chiken", 2), 1)
+        self.assertEqual(edit_distance("salad", "salda", 2), 1)  # transposition
+        self.assertEqual(edit_distance("dip", "chicken", 2), 3)  # gives up
+
+    def test_match_scores(self):
+        """Ensures text matches are ranked by BM25, and fuzzy matches typos"""
+        self.assertEqual(self.search(query={"match": {"name": "chicken"}}), ["c", "b"])
+        self.assertEqual(self.search(query={"fuzzy": {"name": "chiken"}}), ["c", "b"])
+        self.assertEqual(self.search(query={"match": {"name": "pizza"}}), [])
+
+    def test_phrase_prefix(self):
+        query = {"match_phrase_prefix": {"name": "chicken sa"}}
+        self.assertEqual(self.search(query=query), ["b"])
+
+    def test_filters(self):
+        """Ensures terms are an any-match, terms_set with num_terms an
+        all-match, and ranges are inclusive"""
+        any_ingredient = {"terms": {"ingredientNames": ["egg", "carrot"]}}
+        all_tags = {
+            "terms_set": {
+                "tags.keyword": {
+                    "terms": ["vegetarian", "gluten-free"],
+                    "minimum_should_match_script": {"source": "params.num_terms"},
+                }
+            }
+        }
+        calories = {"range": {"calories": {"gte": 90, "lte": 300}}}
+        self.assertEqual(
+            sorted(self.search(query={"bool": {"filter": [any_ingredient]}})),
+            ["c", "d"],
+        )
+        self.assertEqual(
+            sorted(self.search(query={"bool": {"filter": [all_tags]}})), ["a", "d"]
+        )
+        self.assertEqual(
+            sorted(self.search(query={"bool": {"filter": [calories, all_tags]}})),
+            ["a", "d"],
+        )
+        # Recipes without the field don't match its ranges
+        minutes = {"range": {"totalMinutes": {"lte": 60}}}
+        self.assertNotIn("c", self.search(query={"bool": {"filter": [minutes]}}))
+
+    def test_criteria_search(self):
+        """Ensures the searches Recipe builds run as they would on Elasticsearch"""
+        with create_app("testing").app_context():
+            search = Recipe.get_recipes_by_criteria(
+                query="salad", tags=["gluten-free"], maxCalories=300, facets=True
+            )
+        response = self.backend.search(index="recipes", body=search.to_dict())
+        self.assertEqual([hit["_id"] for hit in response["hits"]["hits"]], ["d"])
+        self.assertEqual(response["hits"]["total"]["value"], 1)
+
+        aggs = response["aggregations"]
+        self.assertEqual(
+            aggs["tags"]["buckets"],
+            [
+                {"key": "gluten-free", "doc_count": 1},
+                {"key": "vegetarian", "doc_count": 1},
+            ],
+        )
+        self.assertEqual(aggs["calories"]["buckets"], [{"key": 200.0, "doc_count": 1}])
+
+    def test_histogram_fills_empty_buckets(self):
+        body = {
+            "size": 0,
+            "aggs": {"calories": {"histogram": {"field": "calories", "interval": 200}}},
+        }
+        response = self.backend.search(index="recipes", body=body)
+        buckets = response["aggregations"]["calories"]["buckets"]
+        self.assertEqual(
+            [(b["key"], b["doc_count"]) for b in buckets],
+            [(0.0, 1), (200.0, 2), (400.0, 1)],
+        )
+
+    def test_sort_and_search_after(self):
+        """Ensures hits page with search_after through the app's sort order"""
+        body = {"sort": [{"_score": "desc"}, {"_id": "asc"}], "size": 2}
+        response = self.backend.search(index="recipes", body=body)
+        hits = response["hits"]["hits"]
+        self.assertEqual([hit["_id"] for hit in hits], ["a", "b"])
+        self.assertEqual(hits[-1]["sort"], [1.0, "b"])
+
+        body["search_after"] = hits[-1]["sort"]
+        self.assertEqual(self.search(**body), ["c", "d"])
+        reverse = {"sort": [{"_score": "asc"}, {"_id": "desc"}], "size": 2}
+        self.assertEqual(self.search(search_after=[1.0, "c"], **reverse), ["b", "a"])
+
+    def test_total_hits_cap(self):
+        """Ensures hit counts stop at track_total_hits, as Elasticsearch's do"""
+        response = self.backend.search(index="recipes", body={"track_total_hits": 2})
+        self.assertEqual(response["hits"]["total"], {"value": 2, "relation": "gte"})
+        response = self.backend.search(index="recipes", body={})
+        self.assertEqual(response["hits"]["total"], {"value": 4, "relation": "eq"})
+
+    def test_source_filtering(self):
+        response = self.backend.search(
+            index="recipes", body={"_source": ["name"], "size": 1}
+        )
+        self.assertEqual(
+            response["hits"]["hits"][0]["_source"], {"name": "Garlic Hummus Dip"}
+        )
+
+    def test_fridge_coverage(self):
+        """Ensures the fridge's coverage script ranks recipes by the fraction of
+        their ingredients in the fridge"""
+        self.assertIn(COVERAGE_SCRIPT, SCORE_SCRIPTS)
+        have = [
+            {"constant_score": {"filter": {"term": {"ingredientNames": name}}}}
+            for name in ("garlic", "chickpea", "egg")
+        ]
+        query = {
+            "function_score": {
+                "query": {"bool": {"should": have, "minimum_should_match": 1}},
+                "functions": [
+                    {"script_score": {"script": {"source": COVERAGE_SCRIPT}}}
+                ],
+                "boost_mode": "replace",
+            }
+        }
+        hits = self.backend.search(index="recipes", body={"query": query})["hits"]
+        self.assertEqual(
+            [(hit["_id"], round(hit["_score"], 2)) for hit in hits["hits"]],
+            [("a", 1.0), ("d", 1.0), ("b", 0.33)],
+        )
+
+    def test_suggesters(self):
+        body = {
+            "size": 0,
+            "_source": ["name"],
+            "suggest": {
+                "names": {
+                    "text": "sal",
+                    "completion": {"field": "nameSuggest", "skip_duplicates": True},
+                },
+                "query": {"text": "chiken salda", "phrase": {"field": "name"}},
+            },
+        }
+        suggest = self.backend.search(index="recipes", body=body)["suggest"]
+        options = suggest["names"][0]["options"]
+        self.assertEqual([o["text"] for o in options], ["Salad"])
+        self.assertIn(options[0]["_source"]["name"], ("Chicken Salad", "Egg Salad"))
+        self.assertEqual(suggest["query"][0]["options"][0]["text"], "chicken salad")
+
+    def test_get_and_mget(self):
+        self.assertEqual(
+            self.backend.get(index="recipes", id="b")["_source"]["name"],
+            "Chicken Salad",
+        )
+        with self.assertRaises(NotFoundError):
+            self.backend.get(index="recipes", id="nope")
+
+        docs = self.backend.mget(
+            {"docs": [{"_id": "d"}, {"_id": "nope"}]},
+            index="recipes",
+            _source_includes=["name"],
+        )["docs"]
+        self.assertEqual(docs[0]["_source"], {"name": "Egg Salad"})
+        self.assertFalse(docs[1]["found"])
+
+    def test_unsupported_requests(self):
+        """Ensures what the backend can't run fails like a bad request would"""
+        with self.assertRaises(RequestError):
+            self.backend.search(
+                index="recipes", body={"query": {"regexp": {"name": "c.*"}}}
+            )
+        with self.assertRaises(NotFoundError):
+            self.backend.search(index="other", body={})
+
+        responses = self.backend.msearch(
+            body=[{"index": "recipes"}, {"query": {"regexp": {}}}, {}, {"size": 1}]
+        )["responses"]
+        self.assertEqual(responses[0]["status"], 400)
+        self.assertEqual(len(responses[1]["hits"]["hits"]), 1)
+
+    def test_get_mapping(self):
+        mappings = self.backend.indices.get_mapping(index="recipes")
+        self.assertEqual(mappings["recipes"]["mappings"]["_meta"], {"generation": "1"})
+
+
+class SearchBackendConfigTestCase(unittest.TestCase):
+    def test_testing_config_uses_memory_backend(self):
+        app = create_app("testing")
+        self.assertIsInstance(app.elasticsearch, MemoryBackend)
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            create_search_backend({"SEARCH_BACKEND": "solr"})
+
+    def test_memory_backend_needs_data(self):
+        with self.assertRaisesRegex(ValueError, "SEARCH_DATA"):
+            create_search_backend({"SEARCH_BACKEND": "memory", "SEARCH_DATA": None})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+import unittest
+
+from app.cache import TTLCache
+
+
+class FakeTimer:
+    """A manually advanced clock for testing expiry"""
+
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class TTLCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.timer = FakeTimer()
+        self.cache = TTLCache(maxsize=2, ttl=10, timer=self.timer)
+
+    def test_get_set(self):
+        """Ensures stored values are returned and counted as hits"""
+        self.cache.set("a", 1)
+        self.assertEqual(self.cache.get("a"), 1)
+        self.assertEqual(self.cache.get("b", default="missing"), "missing")
+        self.assertEqual(self.cache.hits, 1)
+        self.assertEqual(self.cache.misses, 1)
+
+    def test_none_is_cached(self):
+        """Ensures negative (None) results can be told apart from misses"""
+        sentinel = object()
+        self.cache.set("a", None)
+        self.assertIsNone(self.cache.get("a", default=sentinel))
+
+    def test_expiry(self):
+        """Ensures entries expire after the default or per-entry TTL"""
+        self.cache.set("a", 1)
+        self.cache.set("b", 2, ttl=1)
+        self.timer.now = 5
+        self.assertEqual(self.cache.get("a"), 1)
+        self.assertIsNone(self.cache.get("b"))
+        self.timer.now = 11
+        self.assertIsNone(self.cache.get("a"))
+        self.assertEqual(len(self.cache), 0)
+
+    def test_lru_eviction(self):
+        """Ensures the least recently used entry is evicted when full"""
+        self.cache.set("a", 1)
+        self.cache.set("b", 2)
+        self.cache.get("a")
+        self.cache.set("c", 3)
+        self.assertIn("a", self.cache)
+        self.assertNotIn("b", self.cache)
+        self.assertIn("c", self.cache)
+
+    def test_stats(self):
+        """Ensures the stats summary reflects the counters"""
+        self.cache.set("a", 1)
+        self.cache.get("a")
+        self.cache.get("b")
+        stats = self.cache.stats()
+        self.assertEqual(stats["size"], 1)
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["hit_rate"], 0.5)
@@ -0,0 +1,53 @@
+import threading
+import time
+import unittest
+from concurrent.futures import Future
+
+from app import create_app
+from app.concurrency import result_by, submit
+from flask import current_app, request
+
+
+class ConcurrencyTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app("testing")
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+    def tearDown(self):
+        self.app_context.pop()
+
+    def test_submitted_functions_run_concurrently(self):
+        """Ensures submitted functions run at the same time, by having each
+        wait for the other"""
+        both_running = threading.Barrier(2, timeout=30)
+        futures = [submit(both_running.wait) for _ in range(2)]
+        self.assertEqual(
+            sorted(result_by(f, time.monotonic() + 30, "broken") for f in futures),
+            [0, 1],
+        )
+
+    def test_submit_keeps_context(self):
+        """Ensures submitted functions see the app, and the request if any"""
+        future = submit(lambda: current_app.name)
+        self.assertEqual(result_by(future, time.monotonic() + 30), self.app.name)
+        with self.app.test_request_context("/recipe/abc"):
+            future = submit(lambda: request.path)
+        self.assertEqual(result_by(future, time.monotonic() + 30), "/recipe/abc")
+
+    def test_result_by_defaults(self):
+        """Ensures result_by falls back to the default if the function failed,
+        or isn't done by the deadline"""
+        failed = Future()
+        failed.set_exception(ConnectionError())
+        self.assertEqual(result_by(failed, time.monotonic() + 30, "failed"), "failed")
+
+        release = threading.Event()
+        late = submit(release.wait, 30)
+        self.assertEqual(result_by(late, time.monotonic(), "late"), "late")
+        release.set()
+        self.assertTrue(result_by(late, time.monotonic() + 30))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,195 @@
+import unittest
+from unittest import mock
+
+from app import create_app, db
+from app.grocery import (
+    ParsedIngredient,
+    ParsedRecipe,
+    add_to_grocery_list,
+    format_amount,
+    format_quantity,
+    get_grocery_list,
+    merge_ingredients,
+    parse_ingredient,
+    remove_from_grocery_list,
+)
+from app.models import User
+from app.search import Recipe, RecipeBatch
+
+
+def make_recipe(recipe_id, name, ingredients):
+    """Returns a Recipe as fetched for a grocery list"""
+    return Recipe(meta={"id": recipe_id}, name=name, ingredients=ingredients)
+
+
+class GroceryListTestCase(unittest.TestCase):
+    def setUp(self):
+        """Setup app context and database"""
+        self.app = create_app("testing")
+        self.app.config["WTF_CSRF_ENABLED"] = False
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.user = User(email="test@hotmail.com", username="test", password="pw")
+        db.session.add(self.user)
+        db.session.commit()
+
+    def tearDown(self):
+        """ends session and drops database"""
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def login(self, client):
+        """Logs the test user in on the given test client"""
+        return client.post(
+            "/auth/login", data=dict(email="test@hotmail.com", password="pw")
+        )
+
+    def test_parse_ingredient(self):
+        """Ensures quantities are parsed and units normalized"""
+        self.assertEqual(
+            parse_ingredient("1 1/2 cups all-purpose flour"),
+            ParsedIngredient("flour", 354.882, "ml"),
+        )
+        self.assertEqual(
+            parse_ingredient("½ cup milk"), ParsedIngredient("milk", 118.294, "ml")
+        )
+        self.assertEqual(
+            parse_ingredient("8 oz cream cheese"),
+            ParsedIngredient("cream cheese", 226.8, "g"),
+        )
+        self.assertEqual(
+            parse_ingredient("2 cloves garlic, minced"),
+            ParsedIngredient("garlic", 2, "clove"),
+        )
+        self.assertEqual(
+            parse_ingredient("1 (15 ounce) can chickpeas"),
+            ParsedIngredient("chickpea", 1, "can"),
+        )
+        self.assertEqual(parse_ingredient("2-3 eggs"), ParsedIngredient("egg", 2, None))
+        self.assertEqual(
+            parse_ingredient("Salt and pepper to taste"),
+            ParsedIngredient("salt and pepper", None, None),
+        )
+
+    def test_merge_ingredients(self):
+        """Ensures ingredients are deduplicated across recipes, and summed by unit"""
+        recipes = [
+            ParsedRecipe(
+                "1",
+                "Pancakes",
+                tuple(map(parse_ingredient, ["1 cup milk", "2 eggs", "1 lb flour"])),
+            ),
+            ParsedRecipe(
+                "2",
+                "Omelette",
+                tuple(map(parse_ingredient, ["4 tbsp milk", "3 Eggs", "salt"])),
+            ),
+        ]
+        items = {item.name: item for item in merge_ingredients(recipes)}
+        self.assertEqual(list(items), ["egg", "flour", "milk", "salt"])
+        self.assertEqual(items["milk"].quantities, ["1 1/4 cups"])
+        self.assertEqual(items["milk"].recipes, ["Pancakes", "Omelette"])
+        self.assertEqual(items["egg"].quantities, ["5"])
+        self.assertEqual(items["flour"].quantities, ["1 lb"])
+        self.assertEqual(items["salt"].quantities, [])
+
+    def quantity(self, line):
+        return format_quantity(*parse_ingredient(line)[1:])
+
+    def test_small_amounts(self):
+        """Ensures eighths are shown, and nonzero amounts never show as 0"""
+        self.assertEqual(self.quantity("⅛ teaspoon salt"), "1/8 tsp")
+        self.assertEqual(self.quantity("1/8 tsp salt"), "1/8 tsp")
+        self.assertEqual(format_amount(0.05), "1/8")
+        self.assertEqual(format_amount(1 / 3), "1/3")
+        self.assertEqual(format_amount(2.97), "3")
+
+    def test_plurals(self):
+        """Ensures units are only plural for amounts over 1"""
+        self.assertEqual(self.quantity("1/3 cup sugar"), "1/3 cup")
+        self.assertEqual(self.quantity("1 cup sugar"), "1 cup")
+        self.assertEqual(self.quantity("1 1/2 cups sugar"), "1 1/2 cups")
+        self.assertEqual(self.quantity("1/2 can beans"), "1/2 can")
+        self.assertEqual(self.quantity("2 bunches parsley"), "2 bunches")
+
+    def test_metric_amounts(self):
+        """Ensures metric amounts aren't rounded to the nearest imperial fraction"""
+        self.assertEqual(self.quantity("500 g flour"), "500 g")
+        self.assertEqual(self.quantity("250 ml water"), "250 ml")
+        self.assertEqual(self.quantity("1.25 kg potatoes"), "1.25 kg")
+        self.assertEqual(self.quantity("1.5 kg potatoes"), "1.5 kg")
+        self.assertEqual(self.quantity("1 lb beef"), "1 lb")
+        self.assertEqual(self.quantity("16 oz beef"), "1 lb")
+
+    @mock.patch.object(Recipe, "get_index_generation", return_value=None)
+    @mock.patch.object(Recipe, "get_recipes_by_ids")
+    def test_grocery_list_cache(self, get_recipes_by_ids, _):
+        """Ensures recipes are fetched in one batch, and only parsed once"""
+        get_recipes_by_ids.return_value = RecipeBatch(
+            [
+                make_recipe("1", "Pancakes", ["1 cup milk"]),
+                make_recipe("2", "Omelette", ["1/2 cup milk"]),
+            ],
+            [],
+        )
+        add_to_grocery_list(self.user.id, "1")
+        add_to_grocery_list(self.user.id, "2")
+        add_to_grocery_list(self.user.id, "1")
+        self.assertEqual(self.user.grocery_recipes.count(), 2)
+
+        recipes, items = get_grocery_list(self.user.id)
+        get_recipes_by_ids.assert_called_once_with(
+            ["1", "2"], fields=["name", "ingredients"]
+        )
+        self.assertEqual([r.name for r in recipes], ["Pancakes", "Omelette"])
+        self.assertEqual(items[0].quantities, ["1 1/2 cups"])
+
+        # Rebuilding the list is served from the cache
+        self.assertEqual(get_grocery_list(self.user.id), (recipes, items))
+        get_recipes_by_ids.assert_called_once()
+
+        self.assertTrue(remove_from_grocery_list(self.user.id, "1"))
+        self.assertFalse(remove_from_grocery_list(self.user.id, "1"))
+        recipes, items = get_grocery_list(self.user.id)
+        self.assertEqual([r.name for r in recipes], ["Omelette"])
+        get_recipes_by_ids.assert_called_once()
+
+    def test_grocery_list_limit(self):
+        """Ensures a grocery list can't hold more than GROCERY_LIST_MAX_RECIPES"""
+        self.app.config["GROCERY_LIST_MAX_RECIPES"] = 1
+        add_to_grocery_list(self.user.id, "1")
+        with self.assertRaises(ValueError):
+            add_to_grocery_list(self.user.id, "2")
+
+    def test_grocery_list_requires_login(self):
+        """Ensures the grocery list redirects anonymous users to log in"""
+        client = self.app.test_client()
+        response = client.get("/grocerylist")
+        self.assertEqual(response.status_code, 302)
+        self.assertIn("/auth/login", response.location)
+
+    @mock.patch("app.main.views.get_grocery_list")
+    def test_grocery_list_page(self, get_grocery_list):
+        """Ensures the grocery list page lists recipes and merged items"""
+        recipes = [ParsedRecipe("1", "Pancakes", (parse_ingredient("2 eggs"),))]
+        get_grocery_list.return_value = (recipes, merge_ingredients(recipes))
+
+        client = self.app.test_client()
+        self.login(client)
+        response = client.post("/grocerylist/add/1")
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.user.grocery_recipes.count(), 1)
+
+        page = client.get("/grocerylist").get_data(as_text=True)
+        self.assertIn("Pancakes", page)
+        self.assertIn("egg", page)
+
+        client.post("/grocerylist/remove/1")
+        self.assertEqual(self.user.grocery_recipes.count(), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
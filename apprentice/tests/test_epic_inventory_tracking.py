@@ -1,6 +1,16 @@
 import unittest
+from unittest import mock
 
 from app import create_app, db
+from app.fridge import (
+    add_to_fridge,
+    get_fridge_search,
+    get_inventory,
+    match_recipes,
+    remove_from_fridge,
+)
+from app.models import FridgeItem, User
+from app.search import Recipe
 from flask import current_app
 
 
@@ -8,16 +18,140 @@ class InventoryTrackingTestCase(unittest.TestCase):
     def setUp(self):
         """Setup app context and database"""
         self.app = create_app("testing")
+        self.app.config["WTF_CSRF_ENABLED"] = False
         self.app_context = self.app.app_context()
         self.app_context.push()
         db.create_all()
 
+        self.user = User(email="test@hotmail.com", username="test", password="pw")
+        db.session.add(self.user)
+        db.session.commit()
+
     def tearDown(self):
         """ends session and drops database"""
         db.session.remove()
         db.drop_all()
         self.app_context.pop()
 
+    def login(self, client):
+        """Logs the test user in on the given test client"""
+        return client.post(
+            "/auth/login", data=dict(email="test@hotmail.com", password="pw")
+        )
+
     def test_app_exists(self):
         # TODO: replace -- this is a dummy test
         self.assertFalse(current_app is None)
+
+    def test_add_to_fridge(self):
+        """Ensures ingredients are normalized and not added twice"""
+        added = add_to_fridge(self.user.id, "2 Eggs, olive oil")
+        self.assertEqual(added, ["egg", "olive oil"])
+        self.assertEqual(add_to_fridge(self.user.id, "eggs"), [])
+        self.assertEqual(self.user.fridge_items.count(), 2)
+        self.assertEqual(get_inventory(self.user.id), {"egg", "olive oil"})
+
+    def test_fridge_limit(self):
+        """Ensures a fridge can't hold more than FRIDGE_MAX_ITEMS items"""
+        self.app.config["FRIDGE_MAX_ITEMS"] = 2
+        add_to_fridge(self.user.id, "eggs, milk")
+        with self.assertRaises(ValueError):
+            add_to_fridge(self.user.id, "flour")
+
+    def test_inventory_cache(self):
+        """Ensures the inventory is cached, and refreshed when it changes"""
+        add_to_fridge(self.user.id, "eggs")
+        self.assertEqual(get_inventory(self.user.id), {"egg"})
+        db.session.add(FridgeItem(user_id=self.user.id, name="milk"))
+        db.session.commit()
+        self.assertEqual(get_inventory(self.user.id), {"egg"})
+
+        item = FridgeItem.query.filter_by(name="egg").first()
+        self.assertTrue(remove_from_fridge(self.user.id, item.id))
+        self.assertEqual(get_inventory(self.user.id), {"milk"})
+        self.assertFalse(remove_from_fridge(self.user.id, item.id))
+
+    def test_fridge_search(self):
+        """Ensures recipes are scored by ingredient coverage within a budget"""
+        self.app.config["FRIDGE_SEARCH_BUDGET"] = 0.5
+        search = get_fridge_search({"milk", "egg"}, per_page=5)
+        body = search.to_dict()
+        function_score = body["query"]["function_score"]
+        self.assertEqual(
+            function_score["query"]["bool"]["should"],
+            [
+                {
+                    "constant_score": {
+                        "filter": {"term": {"ingredientNames": n}},
+                        "boost": 1,
+                    }
+                }
+                for n in ["egg", "milk"]
+            ],
+        )
+        self.assertEqual(function_score["boost_mode"], "replace")
+        self.assertEqual(body["timeout"], "250ms")
+        self.assertEqual(body["size"], 5)
+        self.assertEqual(search._params["request_timeout"], 0.5)
+
+    @mock.patch.object(Recipe, "get_index_generation", return_value=None)
+    @mock.patch("app.fridge.get_fridge_search")
+    def test_match_recipes(self, get_fridge_search, generation):
+        """Ensures matches report their coverage and missing ingredients, and
+        are cached until the fridge changes"""
+        self.assertEqual(match_recipes(self.user.id).total, 0)
+        get_fridge_search.assert_not_called()
+
+        add_to_fridge(self.user.id, "eggs, milk")
+        execute = get_fridge_search.return_value.execute
+        execute.return_value.to_dict.return_value = {
+            "timed_out": False,
+            "hits": {
+                "total": {"value": 1},
+                "hits": [
+                    {
+                        "_id": "1",
+                        "_score": 0.5,
+                        "_source": {
+                            "name": "Pancakes",
+                            "ingredientNames": ["egg", "flour", "milk", "sugar"],
+                        },
+                    }
+                ],
+            },
+        }
+        results = match_recipes(self.user.id)
+        self.assertEqual(results.total, 1)
+        self.assertEqual(results.matches[0].recipe.name, "Pancakes")
+        self.assertEqual(results.matches[0].coverage, 0.5)
+        self.assertEqual(results.matches[0].missing, ["flour", "sugar"])
+
+        match_recipes(self.user.id)
+        self.assertEqual(execute.call_count, 1)
+        add_to_fridge(self.user.id, "flour")
+        match_recipes(self.user.id)
+        self.assertEqual(execute.call_count, 2)
+
+    def test_fridge_requires_login(self):
+        """Ensures the fridge page is only shown to logged in users"""
+        response = self.app.test_client().get("/fridge")
+        self.assertEqual(response.status_code, 302)
+
+    @mock.patch("app.main.views.match_recipes")
+    def test_fridge_page(self, match_recipes):
+        """Ensures items can be added to and removed from the fridge page"""
+        match_recipes.side_effect = Exception("no elasticsearch")
+        client = self.app.test_client()
+        self.login(client)
+
+        response = client.post(
+            "/fridge", data=dict(items="2 eggs, Milk"), follow_redirects=True
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"egg", response.data)
+        self.assertIn(b"milk", response.data)
+
+        item = FridgeItem.query.filter_by(name="milk").first()
+        response = client.post(f"/fridge/remove/{item.id}", follow_redirects=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(get_inventory(self.user.id), {"egg"})
@@ -1,4 +1,6 @@
+import threading
 import unittest
+from unittest import mock
 
 from app import create_app, db
 from app.search import Recipe
@@ -31,3 +33,66 @@ class RecipeDisplayTestCase(unittest.TestCase):
             "/recipe/this-definitely-does-not-exist-in-the-database"
         )
         self.assertEqual(response.status_code, 404)
+
+    def test_image_url_is_cached(self):
+        """Ensures repeat image resolutions don't repeat the outbound request"""
+        head = self.app.http_client.head = mock.Mock()
+        head.return_value = mock.Mock(status_code=200)
+        recipe = Recipe(meta={"id": "cached"}, image="http://example.com/a.jpg")
+        with self.app.test_request_context():
+            for _ in range(3):
+                self.assertEqual(recipe.get_image_url(), recipe.image)
+        self.assertEqual(head.call_count, 1)
+
+    def test_missing_image_is_cached(self):
+        """Ensures failed image resolutions fall back and are cached too"""
+        head = self.app.http_client.head = mock.Mock()
+        head.return_value = mock.Mock(status_code=404)
+        recipe = Recipe(meta={"id": "missing"}, image="http://example.com/b.jpg")
+        with self.app.test_request_context():
+            for _ in range(2):
+                self.assertIn("default_recipe_image", recipe.get_image_url())
+        self.assertEqual(head.call_count, 1)
+
+    def test_image_status_skips_probe(self):
+        """Ensures the loader's imageStatus is trusted instead of probing"""
+        head = self.app.http_client.head = mock.Mock()
+        ok = Recipe(meta={"id": "ok"}, image="http://a.com/a.jpg", imageStatus="ok")
+        broken = Recipe(
+            meta={"id": "broken"}, image="http://a.com/b.jpg", imageStatus="broken"
+        )
+        with self.app.test_request_context():
+            self.assertEqual(ok.get_image_url(), ok.image)
+            self.assertIn("default_recipe_image", broken.get_image_url())
+        head.assert_not_called()
+
+    def test_related_recipes(self):
+        """Ensures related recipes share an ingredient and exclude the recipe"""
+        recipe = Recipe.get_single_recipe()
+        related = Recipe.get_related_recipes(recipe, size=4)
+        self.assertTrue(related)
+        self.assertLessEqual(len(related), 4)
+        for row in related:
+            self.assertNotEqual(row.id, recipe.meta.id)
+            other = Recipe.get_recipe_by_id(row.id)
+            self.assertTrue(set(other.ingredientNames) & set(recipe.ingredientNames))
+
+    def test_slow_image_falls_back(self):
+        """Ensures an image resolution which misses its budget doesn't hold up
+        the recipe page, which shows the default image instead"""
+        self.app.config["RECIPE_IMAGE_BUDGET"] = 0.1
+        recipe = Recipe.get_single_recipe()
+        release = threading.Event()
+
+        def slow_image(self, use_google=False):
+            release.wait(30)
+            return "http://example.com/slow.jpg"
+
+        try:
+            with mock.patch.object(Recipe, "get_image_url", slow_image):
+                response = self.app.test_client().get(f"/recipe/{recipe.meta.id}")
+        finally:
+            release.set()
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"default_recipe_image", response.data)
+        self.assertNotIn(b"slow.jpg", response.data)
@@ -1,7 +1,16 @@
 import unittest
+from unittest import mock
 
 from app import create_app, db
-from app.search import Recipe
+from app.autocomplete import PrefixIndex
+from app.search import (
+    Recipe,
+    RecipeRow,
+    canonical_criteria,
+    decode_cursor,
+    encode_cursor,
+    range_filters,
+)
 
 
 class RecipeSearchTestCase(unittest.TestCase):
@@ -40,6 +49,14 @@ class RecipeSearchTestCase(unittest.TestCase):
         recipe_2 = Recipe.get_recipe_by_id(recipe_1.meta.id)
         self.assertEqual(recipe_1, recipe_2)
 
+    def test_get_recipes_by_ids(self):
+        """Asserts the functionality of getting several recipes by ID at once."""
+        recipes = Recipe.get_multi_recipe_paged(per_page=3)
+        ids = [r.meta.id for r in reversed(recipes)]
+        found, missing = Recipe.get_recipes_by_ids(ids + ["does-not-exist"])
+        self.assertEqual([r.meta.id for r in found], ids)
+        self.assertEqual(missing, ["does-not-exist"])
+
     def test_get_recipes_by_name(self):
         """Asserts the functionality of getting a recipe by name."""
         # Check that it finds stuff that exists
@@ -115,6 +132,15 @@ class RecipeSearchTestCase(unittest.TestCase):
             for result in results:
                 self.assertIn(query, result.name.lower())
 
+    def test_name_suggestions(self):
+        """Asserts that completion suggestions return capped, matching names"""
+        for query in ["chicken", "salad"]:
+            names = Recipe.get_name_suggestions(query, size=5)
+            self.assertTrue(names)
+            self.assertLessEqual(len(names), 5)
+            for name in names:
+                self.assertIn(query, name.lower())
+
 
 class RecipeSearchRenderTestCase(unittest.TestCase):
     def setUp(self):
@@ -158,3 +184,343 @@ class RecipeSearchRenderTestCase(unittest.TestCase):
         # GET the page
         response = self.app.test_client().get("/search/autocomplete?query=chicken")
         self.assertEqual(response.status_code, 200)
+
+    def test_invalid_criteria_are_explained(self):
+        """Ensures invalid criteria show an error, and stay in the form to fix"""
+        response = self.app.test_client().get("/search?query=dip&maxCalories=abc")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"maxCalories must be a whole number", response.data)
+        self.assertIn(b'name="nutrients-maxCalories"', response.data)
+        self.assertIn(b'value="abc"', response.data)
+        self.assertIn(b'value="dip"', response.data)
+
+    @mock.patch.object(Recipe, "get_index_generation")
+    @mock.patch.object(Recipe, "_execute_many")
+    def test_search_page_renders_facets(self, execute_many, generation):
+        """Ensures facet counts are shown next to the filters, with links
+        narrowing the search to each nutrient bucket"""
+        generation.return_value = None
+        execute_many.return_value = [
+            {"hits": {"hits": [], "total": {"value": 0}}},
+            {
+                "aggregations": {
+                    "tags": {"buckets": [{"key": "vegan", "doc_count": 3}]},
+                    "fat": {"buckets": [{"key": 20.0, "doc_count": 4}]},
+                }
+            },
+        ]
+        response = self.app.test_client().get("/search?maxCalories=500")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'<span class="facet-count">(3)</span>', response.data)
+        self.assertIn(b"minFats=20&amp;maxFats=39", response.data)
+        self.assertIn(b"maxCalories=500", response.data)
+
+
+class RecipeSearchCriteriaTestCase(unittest.TestCase):
+    def setUp(self):
+        """Setup app context and database"""
+        self.app = create_app("testing")
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        """Ends session and drops database"""
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_ingredients_filter(self):
+        """Ensures ingredients are normalized and filtered on (not scored)"""
+        search = Recipe.get_recipes_by_criteria(ingredients="2 Eggs, Olive Oil ")
+        self.assertEqual(
+            search.to_dict()["query"],
+            {
+                "bool": {
+                    "filter": [{"terms": {"ingredientNames": ["egg", "olive oil"]}}]
+                }
+            },
+        )
+
+    def test_time_filters(self):
+        """Ensures time criteria become range filters on the minute fields"""
+        search = Recipe.get_recipes_by_criteria(maxPrepMinutes=10, maxTotalMinutes=30)
+        self.assertEqual(
+            search.to_dict()["query"]["bool"]["filter"],
+            [
+                {"range": {"prepMinutes": {"lte": 10}}},
+                {"range": {"totalMinutes": {"lte": 30}}},
+            ],
+        )
+
+    def test_range_filters(self):
+        """Ensures each range criterion filters on its own field, with one
+        clause per field, and that 0 is a valid bound"""
+        search = Recipe.get_recipes_by_criteria(
+            minCarbs="5", maxCarbs="20", maxProteins=0, minFats=""
+        )
+        self.assertEqual(
+            search.to_dict()["query"]["bool"]["filter"],
+            [
+                {"range": {"carbohydrate": {"gte": 5, "lte": 20}}},
+                {"range": {"protein": {"lte": 0}}},
+            ],
+        )
+
+    def test_range_filters_validation(self):
+        """Ensures invalid range bounds are rejected"""
+        for value in ("abc", "1.5", "-1", -1, [1]):
+            with self.assertRaises(ValueError):
+                range_filters({"maxCalories": value})
+        self.assertNotEqual(
+            canonical_criteria({"maxCalories": "0"}), canonical_criteria({})
+        )
+        self.assertEqual(
+            canonical_criteria({"maxCalories": "10"}),
+            canonical_criteria({"maxCalories": 10}),
+        )
+
+
+class RecipeSearchCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        """Setup app context and database"""
+        self.app = create_app("testing")
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        """Ends session and drops database"""
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_canonical_criteria(self):
+        """Ensures equivalent criteria normalize to the same key"""
+        self.assertEqual(
+            canonical_criteria(
+                {"query": " dip ", "ingredients": "olive oil, garlic", "tags": []}
+            ),
+            canonical_criteria(
+                {"ingredients": ["garlic", "olive oil"], "query": "dip", "maxFats": ""}
+            ),
+        )
+
+    @mock.patch.object(Recipe, "get_index_generation")
+    @mock.patch.object(Recipe, "_execute_many")
+    def test_search_results_are_cached(self, execute_many, generation):
+        """Ensures repeat searches are served from the cache until the index
+        generation changes"""
+        execute_many.return_value = [{"hits": {"hits": [], "total": {"value": 0}}}, {}]
+
+        generation.return_value = "1"
+        Recipe.search_recipes(query="dip", tags=["vegan", "vegetarian"])
+        Recipe.search_recipes(query="dip ", tags=["vegetarian", "vegan"])
+        self.assertEqual(execute_many.call_count, 1)
+
+        Recipe.search_recipes(query="dip", page=1)
+        self.assertEqual(execute_many.call_count, 2)
+
+        generation.return_value = "2"
+        Recipe.search_recipes(query="dip", tags=["vegan", "vegetarian"])
+        self.assertEqual(execute_many.call_count, 3)
+
+    @mock.patch.object(Recipe, "get_index_generation")
+    @mock.patch.object(Recipe, "_execute_many")
+    def test_search_listing_rows(self, execute_many, generation):
+        """Ensures listings only fetch the listing fields and return RecipeRows"""
+        generation.return_value = None
+        hit = {"_id": "1", "_source": {"name": "Dip", "image": "a.jpg"}, "sort": []}
+        execute_many.return_value = [
+            {"hits": {"hits": [hit], "total": {"value": 1}}},
+            {},
+            {},
+        ]
+        recipes, total = Recipe.search_recipes(query="dip")[:2]
+
+        search = execute_many.call_args[0][0][0]
+        self.assertEqual(search.to_dict()["_source"], Recipe.LISTING_FIELDS)
+        self.assertEqual(total, 1)
+        self.assertEqual(recipes, [RecipeRow("1", "Dip", image="a.jpg")])
+        self.assertFalse(hasattr(recipes[0], "__dict__"))
+
+    def test_cursor_round_trip(self):
+        """Ensures cursors decode to what they were encoded from"""
+        cursor = encode_cursor(3, [1.5, "abc"], reverse=True)
+        self.assertEqual(
+            decode_cursor(cursor), {"page": 3, "after": [1.5, "abc"], "reverse": True}
+        )
+        with self.assertRaises(ValueError):
+            decode_cursor("not-a-cursor")
+
+    @mock.patch.object(Recipe, "get_index_generation")
+    @mock.patch.object(Recipe, "_execute_many")
+    def test_search_cursors(self, execute_many, generation):
+        """Ensures pages link to each other with search_after cursors"""
+        generation.return_value = None
+        hits = [
+            {"_id": str(i), "_source": {"name": str(i)}, "sort": [1.0, str(i)]}
+            for i in range(2)
+        ]
+        execute_many.return_value = [
+            {"hits": {"hits": hits, "total": {"value": 5}}},
+            {},
+        ]
+
+        first = Recipe.search_recipes(per_page=2)
+        self.assertIsNone(first.prev_cursor)
+        self.assertEqual(
+            decode_cursor(first.next_cursor),
+            {"page": 1, "after": [1.0, "1"], "reverse": False},
+        )
+
+        execute_many.return_value = [
+            {"hits": {"hits": list(reversed(hits)), "total": {"value": 5}}},
+            {},
+        ]
+        previous = Recipe.search_recipes(
+            per_page=2, cursor=encode_cursor(1, [1.0, "2"], reverse=True)
+        )
+        search = execute_many.call_args[0][0][0].to_dict()
+        self.assertEqual(search["search_after"], [1.0, "2"])
+        self.assertEqual(search["sort"], [{"_score": "asc"}, {"recipeId": "desc"}])
+        # Results of a backwards cursor come back in display order
+        self.assertEqual([r.id for r in previous.recipes], ["0", "1"])
+        self.assertEqual(decode_cursor(previous.prev_cursor)["page"], 0)
+        self.assertEqual(decode_cursor(previous.next_cursor)["page"], 2)
+
+    @mock.patch.object(Recipe, "get_index_generation")
+    @mock.patch.object(Recipe, "_execute_many")
+    def test_search_cursors_past_total_cap(self, execute_many, generation):
+        """Ensures pages past Elasticsearch's 10000 hit count still link to
+        the next page"""
+        generation.return_value = None
+        hits = [
+            {"_id": str(i), "_source": {"name": str(i)}, "sort": [1.0, str(i)]}
+            for i in range(2)
+        ]
+        total = {"value": 10000, "relation": "gte"}
+        execute_many.return_value = [{"hits": {"hits": hits, "total": total}}, {}]
+
+        page = Recipe.search_recipes(per_page=2, cursor=encode_cursor(5000, [1.0, "a"]))
+        self.assertEqual(decode_cursor(page.next_cursor)["page"], 5001)
+
+        # A short page is the last one, whatever the count says
+        execute_many.return_value = [{"hits": {"hits": hits[:1], "total": total}}, {}]
+        page = Recipe.search_recipes(per_page=2, cursor=encode_cursor(5001, [1.0, "1"]))
+        self.assertIsNone(page.next_cursor)
+
+    def test_search_cursors_walk_all_pages(self):
+        """Ensures following cursors both ways visits every recipe once, in
+        the recipeId tiebreak order"""
+        page = Recipe.search_recipes(per_page=10)
+        total, ids = page.total, []
+        while True:
+            ids += [r.id for r in page.recipes]
+            if not page.next_cursor:
+                break
+            self.assertEqual(decode_cursor(page.next_cursor)["after"][-1], ids[-1])
+            page = Recipe.search_recipes(per_page=10, cursor=page.next_cursor)
+        self.assertEqual(ids, sorted(ids))
+        self.assertEqual(len(ids), total)
+
+        previous = ids[: -len(page.recipes)]
+        back = []
+        while page.prev_cursor:
+            page = Recipe.search_recipes(per_page=10, cursor=page.prev_cursor)
+            back = [r.id for r in page.recipes] + back
+        self.assertEqual(back, previous)
+
+    @mock.patch.object(Recipe, "get_index_generation")
+    @mock.patch.object(Recipe, "mget")
+    def test_get_recipes_by_ids_uses_cache(self, mget, generation):
+        """Ensures batched fetches preserve order, report missing IDs, and
+        only fetch recipes that aren't cached"""
+        generation.return_value = None
+        a, c = Recipe(meta={"id": "a"}), Recipe(meta={"id": "c"})
+        mget.return_value = [a, None, c]
+
+        recipes, missing = Recipe.get_recipes_by_ids(["a", "b", "c", "a"])
+        self.assertEqual(recipes, [a, c, a])
+        self.assertEqual(missing, ["b"])
+        self.assertEqual(mget.call_args[0][0], ["a", "b", "c"])
+
+        mget.return_value = [None]
+        recipes, missing = Recipe.get_recipes_by_ids(["c", "b"])
+        self.assertEqual(recipes, [c])
+        self.assertEqual(missing, ["b"])
+        self.assertEqual(mget.call_args[0][0], ["b"])
+        self.assertIs(Recipe.get_recipe_by_id("a"), a)
+
+    @mock.patch.object(Recipe, "get_index_generation")
+    @mock.patch.object(Recipe, "_execute_many")
+    def test_search_bundles_facets_and_suggestions(self, execute_many, generation):
+        """Ensures the listing, facets and "did you mean" come from one msearch"""
+        generation.return_value = None
+        execute_many.return_value = [
+            {"hits": {"hits": [], "total": {"value": 0}}},
+            {
+                "aggregations": {
+                    "tags": {"buckets": [{"key": "vegan", "doc_count": 3}]},
+                    "calories": {
+                        "buckets": [
+                            {"key": 0.0, "doc_count": 2},
+                            {"key": 200.0, "doc_count": 0},
+                            {"key": 400.0, "doc_count": 1},
+                        ]
+                    },
+                }
+            },
+            {"suggest": {"query": [{"options": [{"text": "chicken"}]}]}},
+        ]
+        results = Recipe.search_recipes(query="chikcen")
+
+        self.assertEqual(execute_many.call_count, 1)
+        listing, facets, suggestions = execute_many.call_args[0][0]
+        self.assertEqual(facets.to_dict()["size"], 0)
+        self.assertEqual(
+            set(facets.to_dict()["aggs"]),
+            {"tags", "calories", "carbohydrate", "protein", "fat"},
+        )
+        self.assertIn("query", suggestions.to_dict()["suggest"])
+        self.assertEqual(
+            results.facets, {"tags": {"vegan": 3}, "calories": {0: 2, 400: 1}}
+        )
+        self.assertEqual(results.did_you_mean, "chicken")
+
+    @mock.patch.object(Recipe, "get_index_generation")
+    @mock.patch.object(Recipe, "_execute_many")
+    def test_search_listing_error_raises(self, execute_many, generation):
+        """Ensures a failed listing isn't cached as an empty result"""
+        generation.return_value = None
+        execute_many.return_value = [{"error": {"type": "oops"}, "status": 400}, {}]
+        with self.assertRaises(Exception):
+            Recipe.search_recipes(query="dip")
+        with self.assertRaises(Exception):
+            Recipe.search_recipes(query="dip")
+        self.assertEqual(execute_many.call_count, 2)
+
+
+class PrefixIndexTestCase(unittest.TestCase):
+    def setUp(self):
+        self.index = PrefixIndex(
+            ["Chicken Salad", "Grilled Chicken", "Chickpea Curry", "Egg Salad"]
+        )
+
+    def test_matches_any_word(self):
+        """Ensures a prefix matches the start of any word, most popular first"""
+        self.assertEqual(
+            self.index.suggest("chick"),
+            ["Chicken Salad", "Grilled Chicken", "Chickpea Curry"],
+        )
+        self.assertEqual(self.index.suggest("SALAD"), ["Chicken Salad", "Egg Salad"])
+
+    def test_multi_word_prefix(self):
+        """Ensures multi-word prefixes match across word boundaries"""
+        self.assertEqual(self.index.suggest("grilled  chi"), ["Grilled Chicken"])
+
+    def test_size_and_no_match(self):
+        """Ensures results are capped and non-matches return nothing"""
+        self.assertEqual(len(self.index.suggest("c", size=2)), 2)
+        self.assertEqual(self.index.suggest("zzz"), [])
+        self.assertEqual(self.index.suggest(" "), [])
@@ -0,0 +1,89 @@
+import ast
+import importlib.util
+import os
+import unittest
+
+from app import ingredients
+from app.ingredients import ingredient_name, ingredient_names, singularize
+
+# The loader's copy of app/ingredients.py, which isn't in the app's image
+LOADER_INGREDIENTS = os.path.join(
+    os.path.dirname(__file__), "..", "..", "recipe-db", "loading-scripts",
+    "ingredients.py",
+)  # fmt: skip
+
+
+def without_type_hints(path):
+    """Returns a dump of a module's AST, leaving out type hints (and imports
+    only needed for them)."""
+    with open(path) as f:
+        tree = ast.parse(f.read())
+    tree.body = [
+        node
+        for node in tree.body
+        if not (isinstance(node, ast.ImportFrom) and node.module == "typing")
+    ]
+    for node in ast.walk(tree):
+        if isinstance(node, ast.FunctionDef):
+            node.returns = None
+            for arg in node.args.args + node.args.kwonlyargs:
+                arg.annotation = None
+    return ast.dump(tree)
+
+
+class IngredientNamesTestCase(unittest.TestCase):
+    def test_strips_quantities_units_and_notes(self):
+        """Ensures ingredient lines are reduced to the ingredient's name"""
+        self.assertEqual(ingredient_name("1/2 cup extra-virgin Olive Oil"), "olive oil")
+        self.assertEqual(ingredient_name("3 cloves garlic, minced"), "garlic")
+        self.assertEqual(ingredient_name("1 (15 ounce) can chickpeas"), "chickpea")
+        self.assertEqual(ingredient_name("2 cups"), "")
+
+    def test_singularize(self):
+        """Ensures plural ingredient names are singularized"""
+        self.assertEqual(singularize("eggs"), "egg")
+        self.assertEqual(singularize("berries"), "berry")
+        self.assertEqual(singularize("tomatoes"), "tomato")
+        self.assertEqual(singularize("peaches"), "peach")
+        self.assertEqual(singularize("leaves"), "leaf")
+        self.assertEqual(singularize("hummus"), "hummus")
+        self.assertEqual(singularize("asparagus"), "asparagus")
+
+    def test_ingredient_names(self):
+        """Ensures lines are split into distinct names, in order"""
+        self.assertEqual(
+            ingredient_names(["Salt and pepper, to taste", "2 Eggs", "1 egg", ""]),
+            ["salt", "pepper", "egg"],
+        )
+
+
+@unittest.skipUnless(
+    os.path.exists(LOADER_INGREDIENTS), "the recipe loader isn't in this checkout"
+)
+class LoaderIngredientsTestCase(unittest.TestCase):
+    """The loader indexes ingredientNames with its own copy of this module, and
+    searches only match if both normalize ingredients the same way."""
+
+    def test_loader_copy_is_identical(self):
+        self.assertEqual(
+            without_type_hints(ingredients.__file__),
+            without_type_hints(LOADER_INGREDIENTS),
+            "app/ingredients.py and recipe-db/loading-scripts/ingredients.py"
+            " have drifted apart",
+        )
+
+    def test_loader_copy_normalizes_the_same(self):
+        spec = importlib.util.spec_from_file_location(
+            "loader_ingredients", LOADER_INGREDIENTS
+        )
+        loader = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(loader)
+
+        lines = [
+            "1/2 cup extra-virgin Olive Oil",
+            "1 (15 ounce) can chickpeas",
+            "Salt and pepper, to taste",
+            "4 ripe peaches, sliced",
+            "2 cups",
+        ]
+        self.assertEqual(loader.ingredient_names(lines), ingredient_names(lines))
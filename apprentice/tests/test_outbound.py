@@ -0,0 +1,65 @@
+import unittest
+from unittest import mock
+
+from app.outbound import OutboundClient, OutboundTimeout
+
+
+def fake_response(status_code, url, location=None):
+    """Builds a mock requests.Response, optionally redirecting to location"""
+    response = mock.Mock(status_code=status_code, url=url, is_redirect=bool(location))
+    response.headers = {"location": location} if location else {}
+    return response
+
+
+class OutboundClientTestCase(unittest.TestCase):
+    def setUp(self):
+        self.now = 0
+        self.client = OutboundClient(
+            connect_timeout=1.0,
+            read_timeout=2.0,
+            total_timeout=3.0,
+            max_redirects=2,
+            timer=lambda: self.now,
+        )
+        self.client.session.request = mock.Mock()
+
+    def test_timeouts_are_passed(self):
+        """Ensures every request gets connect/read timeouts"""
+        self.client.session.request.return_value = fake_response(200, "http://a/")
+        self.assertEqual(self.client.head("http://a/").status_code, 200)
+        _, kwargs = self.client.session.request.call_args
+        self.assertEqual(kwargs["timeout"], (1.0, 2.0))
+        self.assertFalse(kwargs["allow_redirects"])
+
+    def test_follows_redirects(self):
+        """Ensures relative redirects are followed to the final response"""
+        self.client.session.request.side_effect = [
+            fake_response(302, "http://a/x", location="/y"),
+            fake_response(200, "http://a/y"),
+        ]
+        self.assertEqual(self.client.head("http://a/x").url, "http://a/y")
+        args, _ = self.client.session.request.call_args
+        self.assertEqual(args, ("HEAD", "http://a/y"))
+
+    def test_too_many_redirects(self):
+        """Ensures redirect loops are cut off"""
+        self.client.session.request.return_value = fake_response(
+            302, "http://a/x", location="/x"
+        )
+        with self.assertRaises(Exception):
+            self.client.head("http://a/x")
+        self.assertEqual(self.client.session.request.call_count, 3)
+
+    def test_budget(self):
+        """Ensures the total budget bounds the redirect chain and timeouts"""
+
+        def slow_redirect(*args, **kwargs):
+            self.now += 2.5
+            return fake_response(302, "http://a/x", location="/y")
+
+        self.client.session.request.side_effect = slow_redirect
+        with self.assertRaises(OutboundTimeout):
+            self.client.head("http://a/x")
+        # The second hop only gets what's left of the budget
+        _, kwargs = self.client.session.request.call_args
+        self.assertEqual(kwargs["timeout"], (0.5, 0.5))
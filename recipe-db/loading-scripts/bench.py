@@ -0,0 +1,420 @@
+"""Benchmarks each stage of the loader in isolation, on synthetic recipes.
+
+No S3 dump or Elasticsearch cluster is needed: recipes are generated in the
+shape of the openRecipes dump, the dump is served from a local HTTP server,
+and bulk requests go to a local stub which accepts everything.
+
+Each stage runs in a fresh process, so its peak RSS is its own:
+
+- generate: generating the synthetic recipes (the baseline cost of the input)
+- download: streaming and decoding the gzipped dump over HTTP (download_file)
+- read: decoding the gzipped dump from disk (read_dump)
+- process: processing recipes (process_recipes, or process_recipes_parallel)
+- index: serializing and sending processed recipes (BulkIndexer)
+
+Usage:
+
+    python bench.py --records 100000
+    python bench.py --records 1000000 --stages process index --workers 4
+    python bench.py --records 100000 --output before.json
+"""
+
+import argparse
+import gzip
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import resource
+import shutil
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+from functools import partial
+from http.server import BaseHTTPRequestHandler, HTTPServer, SimpleHTTPRequestHandler
+from typing import Callable, Iterable, Iterator
+
+from elasticsearch import Elasticsearch
+
+import load
+
+MAPPING_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "recipe-mapping.json"
+)
+
+# How many distinct recipes the process and index stages cycle through, so their
+# input costs (almost) nothing to produce and memory doesn't grow with --records
+POOL_SIZE = 10000
+
+# SYNTHETIC RECIPE CONSTANTS
+NAME_PREFIXES = ["Easy", "Classic", "Spicy", "Grilled", "Roasted", "Creamy", ""]
+NAME_MAINS = [
+    "Chicken",
+    "Tofu",
+    "Lentil",
+    "Salmon",
+    "Mushroom",
+    "Beef",
+    "Chickpea",
+    "Pasta",
+    "Rice",
+    "Egg",
+    "Pumpkin",
+    "Pork",
+]
+NAME_DISHES = ["Salad", "Soup", "Curry", "Stew", "Tacos", "Bread", "Cake", "Stir-Fry"]
+QUANTITIES = ["1", "2", "3", "1/2", "1/4", "1 1/2", "4", "6"]
+UNITS = ["cup", "cups", "tablespoons", "teaspoon", "ounces", "pound", "cloves", ""]
+INGREDIENTS = [
+    "all-purpose flour",
+    "olive oil",
+    "garlic, minced",
+    "boneless chicken breasts",
+    "graham cracker crumbs",
+    "eggplant, sliced",
+    "heavy cream",
+    "large eggs",
+    "kosher salt",
+    "chickpeas, drained",
+    "vegetable stock",
+    "fresh basil",
+    "sliced ham",
+    "brown rice",
+    "unsalted butter",
+    "ground cumin",
+    "red onion, diced",
+    "canned tomatoes",
+]
+SOURCES = ["allrecipes", "bbcgoodfood", "epicurious", "foodnetwork", "thepioneerwoman"]
+
+
+def generate_recipes(count: int, seed: int = 0) -> Iterator[dict]:
+    """Generates recipes shaped like the ones in the openRecipes dump.
+
+    A few recipes have the poorly parsed ingredients process_recipe drops, and
+    some have missing or null fields, like the real dump.
+
+    Args:
+        count: The number of recipes to generate.
+        seed: The random seed, so runs generate the same recipes.
+
+    Yields:
+        The recipes (python dictionaries), as json.loads would read them.
+    """
+    rng = random.Random(seed)
+    for i in range(count):
+        name = " ".join(
+            w
+            for w in (
+                rng.choice(NAME_PREFIXES),
+                rng.choice(NAME_MAINS),
+                rng.choice(NAME_DISHES),
+            )
+            if w
+        )
+        ingredients = [
+            f"{rng.choice(QUANTITIES)} {rng.choice(UNITS)} {ingredient}"
+            for ingredient in rng.sample(INGREDIENTS, rng.randint(3, 12))
+        ]
+        if rng.random() < 0.02:
+            ingredients = [f"{line} {line}" for line in ingredients]
+
+        recipe = {
+            "_id": {"$oid": f"{i:024x}"},
+            "name": name,
+            "ingredients": "\n".join(ingredients),
+            "url": f"http://example.com/recipes/{i}",
+            "image": f"http://example.com/images/{i}.jpg",
+            "ts": {"$date": 1365276011104 + i},
+            "cookTime": f"PT{rng.randint(5, 180)}M",
+            "source": rng.choice(SOURCES),
+            "recipeYield": f"Serves {rng.randint(1, 8)}",
+            "datePublished": f"20{rng.randint(10, 16)}-0{rng.randint(1, 9)}-1{i % 10}",
+            "prepTime": f"PT{rng.randint(5, 60)}M",
+            "description": (
+                None
+                if rng.random() < 0.2
+                else f"A {name.lower()} the whole family will love."
+            ),
+        }
+        if rng.random() < 0.5:
+            recipe["totalTime"] = f"PT{rng.randint(10, 240)}M"
+        yield recipe
+
+
+def write_dump(path: str, count: int):
+    """Writes synthetic recipes to a gzipped dump file, one json object per line."""
+    with gzip.open(path, "wt", encoding="utf-8", compresslevel=6) as f:
+        for recipe in generate_recipes(count):
+            f.write(json.dumps(recipe) + "\n")
+
+
+def cycle_copies(pool: list, count: int) -> Iterator[dict]:
+    """Yields count shallow copies of the dicts in pool, cycling through it.
+
+    process_recipe and index_action modify their input in place (top level
+    keys only), so each needs a fresh copy.
+    """
+    return map(dict, itertools.islice(itertools.cycle(pool), count))
+
+
+def consume(items: Iterable) -> int:
+    """Exhausts an iterable, returning how many items it had."""
+    count = 0
+    for count, _ in enumerate(items, start=1):
+        pass
+    return count
+
+
+class StubBulkHandler(BaseHTTPRequestHandler):
+    """Accepts every _bulk request like an Elasticsearch cluster would,
+    without storing anything. Subclasses can reject documents by overriding
+    item_result."""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        if not self.path.split("?")[0].endswith("/_bulk"):
+            return self.reply(404, {"error": f"stub can't handle {self.path}"})
+        self.reply(200, self.bulk(body))
+
+    def bulk(self, body: bytes) -> dict:
+        """Returns the response to a _bulk request body."""
+        items = []
+        lines = iter(body.splitlines())
+        for line in lines:
+            ((op_type, meta),) = json.loads(line).items()
+            if op_type != "delete":
+                next(lines)  # skip the source
+            items.append({op_type: self.item_result(op_type, meta)})
+        errors = any(not 200 <= next(iter(i.values()))["status"] < 300 for i in items)
+        return {"took": 1, "errors": errors, "items": items}
+
+    def item_result(self, op_type: str, meta: dict) -> dict:
+        """Returns the bulk response item for one action."""
+        return {"_id": meta.get("_id"), "status": 201}
+
+    def reply(self, status: int, body: dict):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class QuietFileHandler(SimpleHTTPRequestHandler):
+    """Serves files from a directory without logging every request.
+
+    (SimpleHTTPRequestHandler only takes a directory itself from Python 3.7,
+    and the loader image has Python 3.6.)
+    """
+
+    def __init__(self, *args, directory: str, **kwargs):
+        self.root = directory
+        super().__init__(*args, **kwargs)
+
+    def translate_path(self, path: str) -> str:
+        relative = os.path.relpath(super().translate_path(path), os.getcwd())
+        return os.path.join(self.root, relative)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ThreadingHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    """http.server.ThreadingHTTPServer, which only exists from Python 3.7."""
+
+    daemon_threads = True
+
+
+def serve(handler) -> ThreadingHTTPServer:
+    """Starts an HTTP server on a free local port in a background thread."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# STAGES
+# Each stage does its setup and returns a function which runs (and is timed),
+# returning the number of records it handled
+
+
+def setup_generate(options: argparse.Namespace) -> Callable[[], int]:
+    return lambda: consume(generate_recipes(options.records))
+
+
+def setup_download(options: argparse.Namespace) -> Callable[[], int]:
+    return lambda: consume(load.download_file(options.dump_url))
+
+
+def setup_read(options: argparse.Namespace) -> Callable[[], int]:
+    return lambda: consume(load.read_dump(options.dump_path))
+
+
+def setup_process(options: argparse.Namespace) -> Callable[[], int]:
+    pool = list(generate_recipes(min(options.records, POOL_SIZE)))
+    recipes = cycle_copies(pool, options.records)
+    if options.workers > 1:
+        return lambda: consume(load.process_recipes_parallel(recipes, options.workers))
+    return lambda: consume(load.process_recipes(recipes))
+
+
+def setup_index(options: argparse.Namespace) -> Callable[[], int]:
+    pool = list(load.process_recipes(generate_recipes(min(options.records, POOL_SIZE))))
+    docs = cycle_copies(pool, options.records)
+    host, port = options.bulk_address
+    client = Elasticsearch([{"host": host, "port": port}], maxsize=options.bulk_senders)
+    indexer = load.BulkIndexer(
+        client,
+        senders=options.bulk_senders,
+        chunk_docs=options.bulk_docs,
+        chunk_bytes=options.bulk_bytes,
+    )
+
+    def run():
+        successes, failures = indexer.index(
+            load.index_action("recipes-bench", doc) for doc in docs
+        )
+        return successes + failures
+
+    return run
+
+
+STAGES = {
+    "generate": setup_generate,
+    "download": setup_download,
+    "read": setup_read,
+    "process": setup_process,
+    "index": setup_index,
+}
+
+
+def peak_rss_mb() -> float:
+    """Returns the peak RSS (in MB) of this process or its largest child so far."""
+    peak = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+    # ru_maxrss is in kilobytes on Linux, but bytes on macOS
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def _run_stage(stage: str, options: argparse.Namespace, conn):
+    """Runs a stage in a (fresh) child process, sending back its results."""
+    with open(MAPPING_PATH) as f:
+        load._init_worker(json.load(f))
+
+    run = STAGES[stage](options)
+    start = time.perf_counter()
+    count = run()
+    elapsed = time.perf_counter() - start
+    conn.send({"records": count, "seconds": elapsed, "peak_rss_mb": peak_rss_mb()})
+    conn.close()
+
+
+def run_stage(stage: str, options: argparse.Namespace) -> dict:
+    """Runs a stage in a fresh process and returns its results."""
+    context = multiprocessing.get_context("spawn")
+    parent_conn, child_conn = context.Pipe(duplex=False)
+    process = context.Process(target=_run_stage, args=(stage, options, child_conn))
+    process.start()
+    child_conn.close()
+    try:
+        result = parent_conn.recv()
+    except EOFError:
+        raise RuntimeError(f"The {stage} stage failed (exit code {process.exitcode})")
+    finally:
+        process.join()
+
+    result["stage"] = stage
+    result["records_per_sec"] = (
+        result["records"] / result["seconds"] if result["seconds"] else 0
+    )
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--records",
+        type=int,
+        default=10000,
+        help="number of synthetic recipes (e.g. 10000 to 10000000)",
+    )
+    parser.add_argument(
+        "--stages",
+        nargs="+",
+        choices=list(STAGES),
+        default=list(STAGES),
+        help="stages to benchmark",
+    )
+    parser.add_argument(
+        "--work-dir",
+        help="directory to keep the synthetic dump in (reused between runs)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="number of processes for the process stage",
+    )
+    parser.add_argument("--bulk-senders", type=int, default=4)
+    parser.add_argument("--bulk-docs", type=int, default=5000)
+    parser.add_argument("--bulk-bytes", type=int, default=10 * 1024 * 1024)
+    parser.add_argument(
+        "--output",
+        help="file to write the results to as json, for comparing runs",
+    )
+    options = parser.parse_args()
+
+    work_dir = options.work_dir or tempfile.mkdtemp(prefix="recipe-bench-")
+    os.makedirs(work_dir, exist_ok=True)
+    options.dump_path = os.path.join(work_dir, f"synthetic-{options.records}.json.gz")
+    if {"download", "read"} & set(options.stages) and not os.path.exists(
+        options.dump_path
+    ):
+        print(f"Writing {options.records} synthetic recipes to {options.dump_path}...")
+        write_dump(options.dump_path, options.records)
+
+    # The servers run in this process, so they don't count against the stages
+    file_server = serve(partial(QuietFileHandler, directory=work_dir))
+    options.dump_url = (
+        f"http://127.0.0.1:{file_server.server_port}/"
+        f"{os.path.basename(options.dump_path)}"
+    )
+    bulk_server = serve(StubBulkHandler)
+    options.bulk_address = bulk_server.server_address
+
+    results = []
+    print(
+        f"{'stage':<10}{'records':>12}{'seconds':>10}{'records/s':>12}{'peak RSS':>12}"
+    )
+    for stage in options.stages:
+        result = run_stage(stage, options)
+        results.append(result)
+        print(
+            f"{stage:<10}{result['records']:>12,}{result['seconds']:>10.2f}"
+            f"{result['records_per_sec']:>12,.0f}{result['peak_rss_mb']:>9.0f} MB"
+        )
+
+    file_server.shutdown()
+    bulk_server.shutdown()
+
+    if not options.work_dir:
+        shutil.rmtree(work_dir)
+
+    if options.output:
+        with open(options.output, "w") as f:
+            json.dump({"options": vars(options), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""Micro-benchmark of the dietary tagger against the regex scans it replaced.
+
+Usage:
+
+    python bench_dietary.py                      # synthetic recipes
+    python bench_dietary.py --input recipes.json.gz --limit 100000
+"""
+
+import argparse
+import itertools
+import os
+import random
+import re
+import time
+from typing import List
+
+from dietary import DietaryTagger
+
+TAGS_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "dietary-tags.json"
+)
+
+# The regexes process_recipe used to run over each recipe's name + ingredients.
+# They match keywords anywhere, e.g. "ham" in "graham" and "egg" in "eggplant".
+RE_GLUTEN_FREE = re.compile(
+    "|".join(
+        [
+            "bagel",
+            "barley",
+            "bread",
+            "cake",
+            "flour",
+            "gluten",
+            "loaf",
+            "muffin",
+            "rye",
+            "wheat",
+        ]
+    ),
+    re.IGNORECASE,
+)
+RE_VEGETARIAN = re.compile(
+    "|".join(
+        [
+            "alligator",
+            "beef",
+            "bison",
+            "buffalo",
+            "caribou",
+            "chicken",
+            "duck",
+            "elk",
+            "fish",
+            "goat",
+            "ham",
+            "lamb",
+            "pheasant",
+            "pepperoni",
+            "pork",
+            "prawn",
+            "quail",
+            "rabbit",
+            "salami",
+            "shrimp",
+            "salmon",
+            "steak",
+            "turkey",
+            "tuna",
+            "veal",
+            "venison",
+            "yak",
+        ]
+    ),
+    re.IGNORECASE,
+)
+RE_VEGAN = re.compile("|".join(["milk", "cream", "cheese", "egg"]), re.IGNORECASE)
+
+SYNTHETIC_INGREDIENTS = [
+    "2 cups all-purpose flour",
+    "1 tablespoon olive oil",
+    "3 cloves garlic, minced",
+    "1 pound boneless chicken breasts",
+    "1 cup graham cracker crumbs",
+    "1 medium eggplant, sliced",
+    "1/2 cup heavy cream",
+    "2 large eggs",
+    "1 teaspoon kosher salt",
+    "1 can chickpeas, drained",
+    "4 cups vegetable stock",
+    "1 bunch fresh basil",
+    "8 ounces sliced ham",
+    "1 cup brown rice",
+    "2 tablespoons butter",
+]
+
+
+def regex_tags(name: str, ingredients: str) -> List[str]:
+    """Tags a recipe the way process_recipe used to."""
+    content_blob = name + ingredients
+    tags = []
+    if not RE_GLUTEN_FREE.search(content_blob):
+        tags.append("gluten-free")
+    if not RE_VEGETARIAN.search(content_blob):
+        tags.append("vegetarian")
+        if not RE_VEGAN.search(content_blob):
+            tags.append("vegan")
+    return tags
+
+
+def synthetic_recipes(count: int) -> List[dict]:
+    """Generates recipes with 5-15 ingredient lines drawn from a fixed list."""
+    rng = random.Random(0)
+    return [
+        {
+            "name": f"Recipe {i}",
+            "ingredients": "\n".join(
+                rng.sample(SYNTHETIC_INGREDIENTS, rng.randint(5, 15))
+            ),
+        }
+        for i in range(count)
+    ]
+
+
+def dump_recipes(path: str, limit: int) -> List[dict]:
+    """Reads up to limit recipes with a name and ingredients from a recipe dump."""
+    from load import read_dump
+
+    recipes = (r for r in read_dump(path) if r.get("name") and r.get("ingredients"))
+    return list(itertools.islice(recipes, limit))
+
+
+def bench(label: str, func, recipes: List[dict]) -> List[List[str]]:
+    """Tags every recipe with func, prints the throughput and returns the tags."""
+    start = time.perf_counter()
+    tags = [func(recipe["name"], recipe["ingredients"]) for recipe in recipes]
+    elapsed = time.perf_counter() - start
+    print(
+        f"{label:>8}: {elapsed:.3f}s, {len(recipes) / elapsed:,.0f} recipes/s, "
+        f"{elapsed / len(recipes) * 1e6:.1f}us/recipe"
+    )
+    return tags
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--input", help="A recipe dump to sample, else synthetic")
+    parser.add_argument("--limit", type=int, default=100000)
+    args = parser.parse_args(argv)
+
+    if args.input:
+        recipes = dump_recipes(args.input, args.limit)
+    else:
+        recipes = synthetic_recipes(args.limit)
+
+    tagger = DietaryTagger.from_file(TAGS_PATH)
+    before = bench("regex", regex_tags, recipes)
+    after = bench(
+        "tagger",
+        lambda name, ingredients: tagger.tag(name, *ingredients.split("\n")),
+        recipes,
+    )
+
+    changed = [i for i, (old, new) in enumerate(zip(before, after)) if old != new]
+    print(f"{len(changed):,} of {len(recipes):,} recipes tagged differently")
+    for i in changed[:10]:
+        print(f"  {recipes[i]['name']!r}: {before[i]} -> {after[i]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+import json
+import re
+from typing import Iterable, List
+
+WORD_RE = re.compile(r"[a-z]+")
+
+
+def plural_forms(word: str) -> List[str]:
+    """Returns a word and its likely English plurals, e.g. loaf -> loafs, loafes."""
+    forms = [word, word + "s", word + "es"]
+    if word.endswith("y"):
+        forms.append(word[:-1] + "ies")
+    return forms
+
+
+class DietaryTagger:
+    """Tags recipes with dietary labels (e.g. "vegetarian") in a single pass.
+
+    Each tag has a list of keywords which rule it out (e.g. "chicken" rules out
+    "vegetarian"), and optionally other tags it requires (e.g. "vegan" requires
+    "vegetarian"). Keywords are matched against whole words, including simple
+    plurals, so "ham" matches "hams" but not "graham". Keywords can also be
+    several words long (e.g. "ice cream").
+
+    All the keyword lists are merged into one lookup table, so tagging a recipe
+    is one dictionary lookup per word (per keyword length), however many tags
+    and keywords there are.
+
+    Usage:
+
+        >>> tagger = DietaryTagger.from_file("./dietary-tags.json")
+        >>> tagger.tag("Graham cracker crust", "butter\\nsugar")
+        ['gluten-free', 'vegetarian', 'vegan']
+
+    Args:
+        rules: An (ordered) dict mapping each tag to a dict with "excludes", a
+            list of keywords which rule the tag out, and optionally "requires",
+            a list of tags (defined before it) which must also apply.
+    """
+
+    def __init__(self, rules: dict):
+        self.tags = list(rules)
+        self.requires = {tag: rule.get("requires", []) for tag, rule in rules.items()}
+
+        # (word, ...) -> the tags those words rule out
+        self.keywords = {}
+        for tag, rule in rules.items():
+            for keyword in rule.get("excludes", []):
+                *first, last = keyword.lower().split()
+                for form in plural_forms(last):
+                    self.keywords.setdefault((*first, form), set()).add(tag)
+        self.max_words = max((len(k) for k in self.keywords), default=1)
+
+    @classmethod
+    def from_file(cls, path: str) -> "DietaryTagger":
+        """Builds a DietaryTagger from a JSON file of rules (see dietary-tags.json)."""
+        with open(path) as f:
+            return cls(json.load(f))
+
+    def excluded(self, texts: Iterable[str]) -> set:
+        """Returns the set of tags ruled out by keywords in any of the texts."""
+        excluded = set()
+        for text in texts:
+            words = WORD_RE.findall(text.lower())
+            for i in range(len(words)):
+                for n in range(1, self.max_words + 1):
+                    tags = self.keywords.get(tuple(words[i : i + n]))
+                    if tags:
+                        excluded |= tags
+        return excluded
+
+    def tag(self, *texts: str) -> List[str]:
+        """Returns the tags which apply to a recipe, in the order they're defined.
+
+        Args:
+            texts: The recipe's text to check, e.g. its name and ingredients.
+        """
+        excluded = self.excluded(texts)
+        tags = []
+        for tag in self.tags:
+            if tag not in excluded and all(r in tags for r in self.requires[tag]):
+                tags.append(tag)
+        return tags
@@ -1,94 +1,406 @@
 import gzip
+import hashlib
 import json
+import logging
+import multiprocessing
+import os
 import random
 import re
-from io import BytesIO
-from typing import List
-from urllib.request import urlopen
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Callable, Iterable, Iterator
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlsplit
+from urllib.request import Request, urlopen
 
-from elasticsearch import Elasticsearch, helpers
+from elasticsearch import Elasticsearch, TransportError, helpers
+
+from dietary import DietaryTagger
+from ingredients import ingredient_names
 
 # INPUT CONSTANTS
 RECIPES_URL = "https://s3.amazonaws.com/openrecipes/20170107-061401-recipeitems.json.gz"
+DOWNLOAD_BLOCK_SIZE = 1024 * 1024
 
 # PROCESSING CONSTANTS
-# These constants are just for demo purposes, in reality we would have to manually
-# check each and every recipe to ensure their correctness.
-RE_GLUTEN_FREE = re.compile(
-    "|".join(
-        [
-            "bagel",
-            "barley",
-            "bread",
-            "cake",
-            "flour",
-            "gluten",
-            "loaf",
-            "muffin",
-            "rye",
-            "wheat",
-        ]
-    ),
-    re.IGNORECASE,
+# The keywords behind each dietary tag live in dietary-tags.json. They're just for
+# demo purposes, in reality we would have to manually check each and every recipe
+# to ensure their correctness.
+DIETARY_TAGGER = DietaryTagger.from_file(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "dietary-tags.json")
 )
-# Inspired by https://github.com/imsky/wordlists/blob/master/nouns/meat.txt
-RE_VEGETARIAN = re.compile(
-    "|".join(
-        [
-            "alligator",
-            "beef",
-            "bison",
-            "buffalo",
-            "caribou",
-            "chicken",
-            "duck",
-            "elk",
-            "fish",
-            "goat",
-            "ham",
-            "lamb",
-            "pheasant",
-            "pepperoni",
-            "pork",
-            "prawn",
-            "quail",
-            "rabbit",
-            "salami",
-            "shrimp",
-            "salmon",
-            "steak",
-            "turkey",
-            "tuna",
-            "veal",
-            "venison",
-            "yak",
-        ]
-    ),
-    re.IGNORECASE,
+
+# ISO-8601 durations, as used for prep/cook/total times (e.g. PT1H30M, P1DT2H)
+RE_DURATION = re.compile(
+    r"^P(?:(?P<days>\d+)D)?"
+    r"(?:T(?:(?P<hours>\d+)H)?(?:(?P<minutes>\d+)M)?(?:(?P<seconds>\d+)S)?)?$"
 )
-RE_VEGAN = re.compile("|".join(["milk", "cream", "cheese", "egg"]), re.IGNORECASE)
+MAX_DURATION_MINUTES = 365 * 24 * 60  # anything longer is bad data
+
+# IMAGE VALIDATION CONSTANTS
+# Values for the imageStatus field, which the web app trusts instead of probing
+IMAGE_OK = "ok"
+IMAGE_BROKEN = "broken"
+IMAGE_MISSING = "missing"
+IMAGE_USER_AGENT = "apprentice-recipe-loader"
+# The responses which mean an image is gone for good. Anything else (timeouts,
+# 5xx, 429 throttling...) could be temporary, so the web app is left to check
+IMAGE_GONE_STATUSES = {404, 410}
+
+# AUTOCOMPLETE CONSTANTS
+# Completion suggesters only match from the start of an input, so we also index
+# the name starting from each of its first few words (e.g. "chicken salad" for
+# "Grilled chicken salad")
+SUGGEST_MAX_WORDS = 5
 
 # OUTPUT CONSTANTS
+# The index alias the app searches, which points at the current versioned index
+# (e.g. recipes-20201118120000)
 ES_INDEX = "recipes"
 ES_MAPPING = {}  # will load from ./recipe-mapping.json
 
+# The fraction of docs which may fail to index before a load is abandoned
+MAX_FAILURE_RATE = 0.01
+
 
-def download_file(url: str) -> List[dict]:
-    """Reads the openRecipes json and converts it to a list of recipes (python dicts)
+def download_file(url: str) -> Iterator[dict]:
+    """Streams the openRecipes json, yielding one recipe (python dict) at a time.
+
+    The gzipped dump is decompressed and decoded line by line as it downloads,
+    so memory use doesn't depend on the size of the dump.
 
     Args:
         url: A string with the url of the openRecipes json.
 
-    Returns:
-        A list of recipes (python  dictionaries) read from the json.
+    Yields:
+        The recipes (python dictionaries) read from the json.
     """
-    recipes = []
     with urlopen(url) as f:
-        with gzip.GzipFile(fileobj=BytesIO(f.read())) as g:
+        with gzip.GzipFile(fileobj=f) as g:
             for line in g:
-                recipes.append(json.loads(line))
+                if line.strip():
+                    yield json.loads(line)
+
+
+def read_dump(path: str) -> Iterator[dict]:
+    """Streams recipes from a local copy of the openRecipes json (gzipped or not).
+
+    Args:
+        path: The path of the dump file.
+
+    Yields:
+        The recipes (python dictionaries) read from the json.
+    """
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rb") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def _sha256_file(path: str) -> str:
+    """Returns the hex sha256 checksum of a file."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(DOWNLOAD_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def fetch_dump(url: str, cache_dir: str, sha256: str = None) -> str:
+    """Downloads a file into a local cache directory, unless it's already there.
+
+    - A cached copy is revalidated with a conditional request (ETag/Last-Modified),
+      and used as is if the server says it hasn't changed, can't be reached or
+      responds with an error.
+    - An interrupted download is resumed with a range request (restarting if the
+      file changed on the server in the meantime, or can't be resumed).
+    - Downloads are checked against the expected sha256 if one is given, and
+      cached copies against the sha256 recorded when they were downloaded.
+
+    Args:
+        url: The URL of the file.
+        cache_dir: The directory to cache the file in.
+        sha256: The expected hex sha256 checksum of the file, if known.
+
+    Returns:
+        The path of the local copy of the file.
+
+    Raises:
+        ValueError: If the file doesn't match its checksum.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, os.path.basename(urlsplit(url).path))
+    part_path = path + ".part"
+
+    def read_meta(file_path):
+        if os.path.exists(file_path) and os.path.exists(file_path + ".meta.json"):
+            with open(file_path + ".meta.json") as f:
+                return json.load(f)
+        return {}
+
+    def write_meta(file_path, meta):
+        with open(file_path + ".meta.json", "w") as f:
+            json.dump(meta, f)
+
+    def check(file_path, expected):
+        digest = _sha256_file(file_path)
+        for checksum in filter(None, (sha256, expected)):
+            if digest != checksum:
+                raise ValueError(
+                    f"{file_path} has sha256 {digest}, expected {checksum}"
+                )
+        return digest
+
+    cached = read_meta(path)
+    partial = read_meta(part_path)
+
+    headers = {}
+    if cached:
+        # Revalidate the cached copy
+        if cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached.get("last_modified"):
+            headers["If-Modified-Since"] = cached["last_modified"]
+    elif partial:
+        # Resume the partial download, unless the file has changed since
+        headers["Range"] = f"bytes={os.path.getsize(part_path)}-"
+        validator = partial.get("etag") or partial.get("last_modified")
+        if validator:
+            headers["If-Range"] = validator
+
+    try:
+        response = urlopen(Request(url, headers=headers))
+    except URLError as e:
+        if isinstance(e, HTTPError) and e.code == 304:
+            logging.info(f"{path} is up to date")
+            check(path, cached.get("sha256"))
+            return path
+        if isinstance(e, HTTPError) and e.code == 416 and "Range" in headers:
+            # The part file is already as long as the file (e.g. the last run
+            # stopped just before renaming it), or longer, so start over
+            logging.warning(f"Can't resume {part_path}, downloading it again")
+            os.remove(part_path)
+            os.remove(part_path + ".meta.json")
+            return fetch_dump(url, cache_dir, sha256)
+        if cached:
+            # e.g. offline, or the server is having problems (5xx)
+            logging.warning(f"Couldn't revalidate {path} ({e}), using it anyway")
+            check(path, cached.get("sha256"))
+            return path
+        raise
+
+    with response:
+        meta = {
+            "url": url,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+        }
+        if response.status == 206:
+            resume_from = os.path.getsize(part_path)
+            logging.info(f"Resuming download of {url} from byte {resume_from}")
+            mode = "ab"
+        else:
+            logging.info(f"Downloading {url}...")
+            mode = "wb"
+            write_meta(part_path, meta)
+
+        received = 0
+        with open(part_path, mode) as f:
+            for block in iter(lambda: response.read(DOWNLOAD_BLOCK_SIZE), b""):
+                f.write(block)
+                received += len(block)
+
+        expected = response.headers.get("Content-Length")
+        if expected and received < int(expected):
+            # Keep the part file, so the next run resumes from here
+            raise ConnectionError(
+                f"Download of {url} was interrupted after {received} of"
+                f" {expected} bytes, run again to resume it"
+            )
+
+    try:
+        meta["sha256"] = check(part_path, None)
+    except ValueError:
+        os.remove(part_path)
+        os.remove(part_path + ".meta.json")
+        raise
+    os.replace(part_path, path)
+    os.remove(part_path + ".meta.json")
+    write_meta(path, meta)
+
+    return path
+
+
+def progress(items: Iterable, stage: str, every: int = 10000) -> Iterator:
+    """Passes items through unchanged, logging how many have gone past and how fast.
+
+    Args:
+        items: The items flowing out of a pipeline stage.
+        stage: The name of the stage, for the log messages.
+        every: How many items to pass between log messages.
+
+    Yields:
+        The same items.
+    """
+    start = time.monotonic()
+    count = 0
+
+    def report():
+        elapsed = time.monotonic() - start
+        rate = count / elapsed if elapsed else 0
+        logging.info(f"[{stage}] {count} records in {elapsed:.1f}s ({rate:.0f}/s)")
+
+    for count, item in enumerate(items, start=1):
+        yield item
+        if count % every == 0:
+            report()
+    report()
+
+
+def process_recipes(recipes: Iterable[dict]) -> Iterator[dict]:
+    """Processes a stream of recipes with process_recipe, dropping bad ones.
+
+    Args:
+        recipes: The raw recipes to process.
+
+    Yields:
+        The processed recipes.
+    """
+    for recipe in recipes:
+        recipe = process_recipe(recipe)
+        if recipe is not None:
+            yield recipe
+
+
+def recipe_id(recipe: dict) -> str:
+    """Returns a stable Elasticsearch ID for a recipe, derived from its URL
+    (or its name, if it has no URL), so IDs don't change between loads."""
+    key = recipe.get("url") or recipe["name"]
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
 
-    return recipes
+
+def content_hash(recipe: dict) -> str:
+    """Returns a hash of a processed recipe's content, for spotting changed
+    recipes between loads. Fields which change on every load, or are just the
+    ID again, are left out."""
+    content = {
+        k: v
+        for k, v in recipe.items()
+        if k not in ("contentHash", "imageCheckedAt", "recipeId")
+    }
+    content = json.dumps(content, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+
+def index_action(index: str, recipe: dict) -> dict:
+    """Returns the bulk action for indexing a processed recipe under its
+    stable ID, with its content hash stored alongside it. The ID is also stored
+    as recipeId, a keyword field searches can sort on (sorting on _id needs
+    fielddata)."""
+    recipe["recipeId"] = recipe_id(recipe)
+    recipe["contentHash"] = content_hash(recipe)
+    return {"_index": index, "_id": recipe["recipeId"], "_source": recipe}
+
+
+def chunked(items: Iterable, size: int) -> Iterator[list]:
+    """Groups a stream of items into lists of (at most) size items."""
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _init_worker(mapping: dict):
+    """Sets up the globals process_recipe needs in a pool worker process."""
+    ES_MAPPING.update(mapping)
+
+
+def _process_chunk(chunk: list) -> tuple:
+    """Processes a chunk of recipes in a pool worker process.
+
+    Returns:
+        A tuple of (worker pid, number of recipes in, seconds taken, processed recipes)
+    """
+    start = time.monotonic()
+    processed = [r for r in map(process_recipe, chunk) if r is not None]
+    return os.getpid(), len(chunk), time.monotonic() - start, processed
+
+
+def process_recipes_parallel(
+    recipes: Iterable[dict], workers: int, chunk_size: int = 1000
+) -> Iterator[dict]:
+    """Processes a stream of recipes across a pool of worker processes.
+
+    The stream is split into ordered chunks, and only a couple of chunks per
+    worker are in flight at once, so the output is in input order and memory
+    stays bounded. Since process_recipe doesn't depend on processing order,
+    the output is identical to process_recipes for any number of workers.
+
+    Args:
+        recipes: The raw recipes to process.
+        workers: The number of worker processes.
+        chunk_size: The number of recipes sent to a worker at a time.
+
+    Yields:
+        The processed recipes.
+    """
+    stats = defaultdict(lambda: [0, 0.0])  # pid -> [recipes, seconds]
+
+    with multiprocessing.Pool(
+        workers, initializer=_init_worker, initargs=(ES_MAPPING,)
+    ) as pool:
+        pending = deque()
+
+        def finish(result):
+            pid, count, elapsed, processed = result.get()
+            stats[pid][0] += count
+            stats[pid][1] += elapsed
+            return processed
+
+        for chunk in chunked(recipes, chunk_size):
+            pending.append(pool.apply_async(_process_chunk, (chunk,)))
+            if len(pending) >= 2 * workers:
+                yield from finish(pending.popleft())
+
+        while pending:
+            yield from finish(pending.popleft())
+
+    for pid, (count, elapsed) in sorted(stats.items()):
+        rate = count / elapsed if elapsed else 0
+        logging.info(
+            f"[process worker {pid}] {count} records in {elapsed:.1f}s ({rate:.0f}/s)"
+        )
+
+
+def parse_duration(value: str) -> int:
+    """Parses an ISO-8601 duration (e.g. "PT1H30M") into a whole number of minutes.
+
+    Args:
+        value: The duration string, or None.
+
+    Returns:
+        The number of minutes (rounded), or None if it's missing or not a
+        (plausible) duration.
+    """
+    match = RE_DURATION.match(value.strip().upper()) if value else None
+    if not match or not any(match.groups()):
+        return None
+    parts = {k: int(v or 0) for k, v in match.groupdict().items()}
+    minutes = (
+        parts["days"] * 24 * 60
+        + parts["hours"] * 60
+        + parts["minutes"]
+        + (parts["seconds"] + 30) // 60  # rounding half up
+    )
+    return minutes if minutes <= MAX_DURATION_MINUTES else None
 
 
 def process_recipe(recipe: dict) -> dict:
@@ -96,6 +408,9 @@ def process_recipe(recipe: dict) -> dict:
     - Removes unwanted fields
     - Adds tags for dietary restrictions
     - Converts ingredients into an array
+    - Adds the normalized ingredient names (e.g. "olive oil"), for filtering
+    - Adds autocomplete inputs for the name
+    - Adds prep/cook/total times in minutes, for range filters
     - Adds Nutritional Information data
 
     Args:
@@ -108,8 +423,7 @@ def process_recipe(recipe: dict) -> dict:
         if key not in ES_MAPPING["properties"] or value is None:
             del recipe[key]
 
-    # Split ingredients into an array, but also keep the original blob for string search purposes
-    content_blob = recipe["name"] + recipe["ingredients"]
+    # Split ingredients into an array
     recipe["ingredients"] = recipe["ingredients"].split("\n")
 
     # Remove poorly parsed recipes (e.g. ingredients like ["1 cup 1 cup"] or ["1","cup","flour"] or [])
@@ -125,22 +439,39 @@ def process_recipe(recipe: dict) -> dict:
     if has_bad_ingredients:
         return None
 
+    # Add the normalized ingredient names, which searches filter on exactly
+    recipe["ingredientNames"] = ingredient_names(recipe["ingredients"])
+
     # Apply tags depending on recipe content
-    tags = []
-    if not RE_GLUTEN_FREE.search(content_blob):
-        tags.append("gluten-free")
-    if not RE_VEGETARIAN.search(content_blob):
-        tags.append("vegetarian")
-        if not RE_VEGAN.search(content_blob):
-            tags.append("vegan")  # treat as subset of vegetarian
+    tags = DIETARY_TAGGER.tag(recipe["name"], *recipe["ingredients"])
     if tags:
         recipe["tags"] = tags
 
+    # Add autocomplete inputs for the recipe name
+    words = recipe["name"].split()
+    recipe["nameSuggest"] = [
+        " ".join(words[i:]) for i in range(min(len(words), SUGGEST_MAX_WORDS))
+    ]
+
+    # Add prep/cook/total times in minutes. If there's no total time, it's
+    # the prep time plus the cook time (when we know both)
+    minutes = {
+        field: parse_duration(recipe.get(f"{field}Time"))
+        for field in ("prep", "cook", "total")
+    }
+    if minutes["total"] is None and None not in (minutes["prep"], minutes["cook"]):
+        minutes["total"] = minutes["prep"] + minutes["cook"]
+    for field, value in minutes.items():
+        if value is not None:
+            recipe[f"{field}Minutes"] = value
+
     # Add nutritional information; random data for now ¯\_(ツ)_/¯
+    # Seeded from the recipe itself, so it doesn't depend on processing order
+    rng = random.Random(f"{recipe.get('url')}|{recipe['name']}")
     recipe.update(
-        carbohydrate=random.randint(0, 75),
-        fat=random.randint(0, 100),
-        protein=random.randint(0, 50),
+        carbohydrate=rng.randint(0, 75),
+        fat=rng.randint(0, 100),
+        protein=rng.randint(0, 50),
     )
 
     # https://www.nal.usda.gov/fnic/how-many-calories-are-one-gram-fat-carbohydrate-or-protein
@@ -151,56 +482,692 @@ def process_recipe(recipe: dict) -> dict:
     return recipe
 
 
-def load_elastic(index: str, mapping: dict, docs: List[dict]):
-    """Loads a list of python dicts into elastic search.
+class HostLimiter:
+    """Runs jobs on a thread pool with at most per_host of them in flight
+    against any one host.
+
+    Jobs for a host which is at its limit wait in line here, not on a pool
+    thread, so one slow host can't tie up every worker.
+
+    Args:
+        pool: The thread pool to run jobs on.
+        per_host: The maximum number of concurrent jobs against any one host.
+    """
+
+    def __init__(self, pool: ThreadPoolExecutor, per_host: int):
+        self._pool = pool
+        self._per_host = per_host
+        self._lock = threading.Lock()
+        self._running = defaultdict(int)  # host -> jobs on the pool
+        self._waiting = defaultdict(deque)  # host -> (future, fn, args) in line
+
+    def submit(self, host: str, fn: Callable, *args) -> Future:
+        """Schedules fn(*args) as a job against host.
+
+        Returns:
+            A Future of the job's result.
+        """
+        future = Future()
+        with self._lock:
+            if self._running[host] >= self._per_host:
+                self._waiting[host].append((future, fn, args))
+                return future
+            self._running[host] += 1
+        self._start(host, future, fn, args)
+        return future
+
+    def _start(self, host: str, future: Future, fn: Callable, args: tuple):
+        def run():
+            try:
+                result, error = fn(*args), None
+            except Exception as e:
+                result, error = None, e
+            # Hand the host's slot on before reporting, so nothing is left
+            # to start once every future is done
+            self._finish(host)
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+        self._pool.submit(run)
+
+    def _finish(self, host: str):
+        """Starts the next job in line for host, or frees its slot."""
+        with self._lock:
+            if not self._waiting[host]:
+                self._running[host] -= 1
+                if not self._running[host]:
+                    del self._running[host], self._waiting[host]
+                return
+            job = self._waiting[host].popleft()
+        self._start(host, *job)
+
+
+def check_image(url: str, timeout: float) -> str:
+    """Checks whether an image URL is reachable with a HEAD request.
+
+    Args:
+        url: The image URL to check.
+        timeout: The number of seconds to wait for the host to respond.
+
+    Returns:
+        IMAGE_OK if the image responded with a 2xx, IMAGE_BROKEN if it's gone
+        for good (see IMAGE_GONE_STATUSES) or the URL is invalid, else None
+        (e.g. timeout, 5xx), which leaves the web app to check it itself.
+    """
+    try:
+        request = Request(url, method="HEAD", headers={"User-Agent": IMAGE_USER_AGENT})
+    except ValueError:
+        # Not a URL
+        return IMAGE_BROKEN
+
+    try:
+        with urlopen(request, timeout=timeout) as response:
+            return IMAGE_OK if 200 <= response.status < 300 else None
+    except HTTPError as e:
+        return IMAGE_BROKEN if e.code in IMAGE_GONE_STATUSES else None
+    except Exception:
+        # e.g. timeout, connection reset, DNS failure
+        return None
+
+
+def check_images(
+    recipes: Iterable[dict],
+    workers: int = 32,
+    per_host: int = 4,
+    timeout: float = 5.0,
+) -> Iterator[dict]:
+    """Adds imageStatus and imageCheckedAt fields to each recipe by checking
+    its image concurrently. Recipes are yielded in their original order, and
+    at most a few batches' worth are held in memory at once.
+
+    Recipes whose image couldn't be checked for sure (see check_image) are
+    left without the fields, so the web app checks them itself.
 
     Args:
-        index: The elasticsearch index to load into ("recipes" in our case)
+        recipes: The (processed) recipes to check.
+        workers: The number of image checks to run at once.
+        per_host: The maximum number of concurrent checks against any one host.
+        timeout: The number of seconds to wait for each image host to respond.
+
+    Yields:
+        The same recipes, updated with imageStatus and imageCheckedAt.
+    """
+
+    def finish(recipe, future):
+        status = future.result() if future else IMAGE_MISSING
+        if status is not None:
+            recipe["imageStatus"] = status
+            recipe["imageCheckedAt"] = datetime.now(timezone.utc).isoformat()
+        return recipe
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        host_limiter = HostLimiter(pool, per_host)
+        pending = deque()
+        for recipe in recipes:
+            future = None
+            if recipe.get("image"):
+                future = host_limiter.submit(
+                    urlsplit(recipe["image"]).netloc,
+                    check_image,
+                    recipe["image"],
+                    timeout,
+                )
+            pending.append((recipe, future))
+
+            if len(pending) >= 4 * workers:
+                yield finish(*pending.popleft())
+
+        while pending:
+            yield finish(*pending.popleft())
+
+
+class BulkIndexer:
+    """Sends a stream of bulk actions to Elasticsearch over several concurrent
+    connections.
+
+    Actions are grouped into requests of at most chunk_docs documents and
+    chunk_bytes bytes. At most two requests per sender are queued at once, so
+    a slow cluster slows down the producer instead of filling up memory
+    (backpressure). Documents rejected with a 429 (too many requests) are
+    retried on their own with exponential backoff. Anything that still fails
+    is written to a dead-letter file as JSON lines, which can be replayed with
+    replay_dead_letters.
+
+    Args:
+        client: The Elasticsearch client (with a connection pool of at least senders).
+        senders: The number of bulk requests to send concurrently.
+        chunk_docs: The maximum number of documents per bulk request.
+        chunk_bytes: The maximum number of bytes per bulk request.
+        max_retries: How many times to retry documents rejected with a 429.
+        initial_backoff: Seconds to wait before the first retry, doubling each time.
+        max_backoff: The maximum number of seconds to wait between retries.
+        dead_letter_path: The file to append failed documents to, or None.
+    """
+
+    def __init__(
+        self,
+        client: Elasticsearch,
+        senders: int = 4,
+        chunk_docs: int = 5000,
+        chunk_bytes: int = 10 * 1024 * 1024,
+        max_retries: int = 5,
+        initial_backoff: float = 2.0,
+        max_backoff: float = 60.0,
+        dead_letter_path: str = None,
+    ):
+        self.client = client
+        self.senders = senders
+        self.chunk_docs = chunk_docs
+        self.chunk_bytes = chunk_bytes
+        self.max_retries = max_retries
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.dead_letter_path = dead_letter_path
+
+        self.successes = 0
+        self.failures = 0
+        self._lock = threading.Lock()
+
+    def index(self, actions: Iterable[dict]) -> tuple:
+        """Sends all the given bulk actions (as accepted by elasticsearch.helpers.bulk).
+
+        Returns:
+            A tuple of (number of successful documents, number of failed documents)
+        """
+        in_flight = threading.BoundedSemaphore(2 * self.senders)
+        errors = []
+
+        def done(future):
+            in_flight.release()
+            if future.exception():
+                errors.append(future.exception())
+
+        with ThreadPoolExecutor(max_workers=self.senders) as pool:
+            for chunk in self._chunks(actions):
+                in_flight.acquire()
+                pool.submit(self._send, chunk).add_done_callback(done)
+
+        if errors:
+            raise errors[0]
+        return self.successes, self.failures
+
+    def _chunks(self, actions: Iterable[dict]) -> Iterator[list]:
+        """Serializes actions into lists of (action, source, bulk lines) which
+        fit within chunk_docs and chunk_bytes."""
+        serializer = self.client.transport.serializer
+        chunk, size = [], 0
+        for data in actions:
+            action, source = helpers.expand_action(data)
+            lines = serializer.dumps(action) + "\n"
+            if source is not None:
+                lines += serializer.dumps(source) + "\n"
+            lines = lines.encode("utf-8")
+
+            if chunk and (
+                len(chunk) >= self.chunk_docs or size + len(lines) > self.chunk_bytes
+            ):
+                yield chunk
+                chunk, size = [], 0
+            chunk.append((action, source, lines))
+            size += len(lines)
+        if chunk:
+            yield chunk
+
+    def _send(self, chunk: list):
+        """Sends one chunk, retrying documents rejected with a 429."""
+        for attempt in range(self.max_retries + 1):
+            retry = []
+            try:
+                response = self.client.bulk(body=b"".join(c[2] for c in chunk))
+                items = response["items"]
+            except TransportError as e:
+                if e.status_code != 429:
+                    self._dead_letter(chunk, [str(e)] * len(chunk))
+                    return
+                retry = chunk
+            else:
+                failed, reasons = [], []
+                for entry, item in zip(chunk, items):
+                    result = next(iter(item.values()))
+                    if 200 <= result.get("status", 500) < 300:
+                        self._count(successes=1)
+                    elif result["status"] == 429:
+                        retry.append(entry)
+                    else:
+                        failed.append(entry)
+                        reasons.append(result.get("error"))
+                self._dead_letter(failed, reasons)
+
+            if not retry:
+                return
+            if attempt < self.max_retries:
+                backoff = min(self.initial_backoff * 2**attempt, self.max_backoff)
+                logging.warning(f"Retrying {len(retry)} rejected docs in {backoff}s")
+                time.sleep(backoff)
+            chunk = retry
+
+        self._dead_letter(
+            chunk, ["too many requests (429), out of retries"] * len(chunk)
+        )
+
+    def _count(self, successes: int = 0, failures: int = 0):
+        with self._lock:
+            self.successes += successes
+            self.failures += failures
+
+    def _dead_letter(self, chunk: list, reasons: list):
+        """Records failed documents, appending them to the dead-letter file."""
+        if not chunk:
+            return
+        self._count(failures=len(chunk))
+        if not self.dead_letter_path:
+            return
+        with self._lock, open(self.dead_letter_path, "a") as f:
+            for (action, source, _), reason in zip(chunk, reasons):
+                entry = {"action": action, "source": source, "error": reason}
+                f.write(json.dumps(entry) + "\n")
+
+
+def read_dead_letters(path: str) -> Iterator[dict]:
+    """Reads a BulkIndexer dead-letter file back into bulk actions.
+
+    Args:
+        path: The dead-letter file to read.
+
+    Yields:
+        Bulk actions (as accepted by BulkIndexer.index).
+    """
+    with open(path) as f:
+        for line in f:
+            entry = json.loads(line)
+            ((op_type, meta),) = entry["action"].items()
+            action = {"_op_type": op_type, **meta}
+            if entry["source"] is not None:
+                action["_source"] = entry["source"]
+            yield action
+
+
+def connect_elastic(maxsize: int = 10) -> Elasticsearch:
+    """Connects to the local Elasticsearch instance.
+
+    Args:
+        maxsize: The number of connections to keep open to it.
+    """
+    return Elasticsearch(
+        [{"host": "localhost", "port": "9200"}],
+        max_retries=10,
+        retry_on_timeout=True,
+        maxsize=maxsize,
+    )
+
+
+def load_elastic(
+    index: str,
+    mapping: dict,
+    docs: Iterable[dict],
+    keep: int = 2,
+    force_merge: bool = False,
+    max_failure_rate: float = MAX_FAILURE_RATE,
+    **bulk_options,
+):
+    """Loads a stream of python dicts into elastic search, without downtime.
+
+    The docs are loaded into a new, timestamped index (e.g. recipes-20201118120000)
+    with refreshes and replicas turned off for speed. Once loaded, its settings are
+    restored and the index alias (e.g. recipes) is atomically moved over to it, so
+    searches keep hitting the previous index until the new one is ready. If the
+    load fails (or too many docs fail to index), the new index is deleted and the
+    alias is left where it was.
+
+    Args:
+        index: The elasticsearch index alias to load into ("recipes" in our case)
         mapping: The elasticsearch mapping to use (in our case this will load from ./recipe-mapping.json)
-        docs: The data (list of dictionaries) to load into elastic search. In our case, this is the processed recipe information.
+        docs: The data (iterable of dictionaries) to load into elastic search. In our case, this is the processed recipe information.
+        keep: How many of the newest versioned indices to keep (including the new one)
+        force_merge: If true, force merges the new index into one segment before using it
+        max_failure_rate: The fraction of docs allowed to fail to index (e.g. 0.01)
+            before the new index is abandoned instead of used
+        bulk_options: Options for the BulkIndexer (e.g. senders, chunk_bytes)
     """
-    # Connect to Elastic and (re)create index
-    elastic_client = Elasticsearch(
-        [{"host": "localhost", "port": "9200"}], max_retries=10, retry_on_timeout=True
+    elastic_client = connect_elastic(maxsize=bulk_options.get("senders", 4))
+
+    # Create the new versioned index. Its name doubles as the generation marker,
+    # which tells the web app that any search results it has cached are out of date
+    new_index = f"{index}-{datetime.now(timezone.utc):%Y%m%d%H%M%S}"
+    elastic_client.indices.create(
+        new_index,
+        body={
+            "settings": {"index": {"refresh_interval": "-1", "number_of_replicas": 0}},
+            "mappings": {**mapping, "_meta": {"generation": new_index}},
+        },
     )
 
-    if elastic_client.indices.exists(ES_INDEX):
-        elastic_client.indices.delete(ES_INDEX)
-    elastic_client.indices.create(ES_INDEX, body={"mappings": ES_MAPPING})
+    try:
+        # Push docs to Elastic
+        indexer = BulkIndexer(elastic_client, **bulk_options)
+        successes, failures = indexer.index(
+            index_action(new_index, doc) for doc in docs
+        )
+        if failures:
+            logging.error(
+                f"Sent {successes} docs to {new_index} with {failures} failures"
+            )
+        else:
+            logging.info(f"Sent {successes} docs to {new_index} with no failures")
+
+        if not successes:
+            raise RuntimeError(
+                f"No docs were loaded, keeping the current {index} index"
+            )
+        if failures > max_failure_rate * (successes + failures):
+            raise RuntimeError(
+                f"{failures} of {successes + failures} docs failed to load (more"
+                f" than {max_failure_rate:.1%}), keeping the current {index} index"
+            )
+
+        # Restore the default refresh interval and replicas (null resets a setting)
+        elastic_client.indices.put_settings(
+            index=new_index,
+            body={"index": {"refresh_interval": None, "number_of_replicas": None}},
+        )
+        elastic_client.indices.refresh(index=new_index)
+        if force_merge:
+            logging.info(f"Force merging {new_index}...")
+            elastic_client.indices.forcemerge(
+                index=new_index, max_num_segments=1, request_timeout=60 * 60
+            )
+
+        # Atomically point the alias at the new index
+        actions = [{"add": {"index": new_index, "alias": index}}]
+        if elastic_client.indices.exists_alias(name=index):
+            for old_index in elastic_client.indices.get_alias(name=index):
+                actions.append({"remove": {"index": old_index, "alias": index}})
+        elif elastic_client.indices.exists(index):
+            # A concrete index from before we used aliases is in the way
+            actions.append({"remove_index": {"index": index}})
+        elastic_client.indices.update_aliases(body={"actions": actions})
+    except BaseException:
+        # Don't leave a half-built index behind, where prune_indices would
+        # count it as one of the versions to keep
+        logging.error(f"Deleting unfinished index {new_index}")
+        try:
+            elastic_client.indices.delete(new_index)
+        except Exception:
+            logging.exception(f"Couldn't delete {new_index}, delete it by hand")
+        raise
+    logging.info(f"Pointed {index} at {new_index}")
 
-    # Push docs to Elastic
-    successes, failures = helpers.bulk(
-        elastic_client,
-        ({"_index": ES_INDEX, "_source": doc} for doc in docs),
-        chunk_size=10000,
-        stats_only=True,
-        raise_on_exception=False,
-        raise_on_error=False,
+    prune_indices(elastic_client, index, keep)
+
+
+def delta_actions(index: str, docs: Iterable[dict], indexed: dict, counts: dict):
+    """Yields the bulk actions which bring an index up to date with a stream of
+    docs: new and changed docs (by content hash) are indexed, and docs which
+    are no longer in the stream are deleted.
+
+    Args:
+        index: The (concrete) index to update.
+        docs: The full set of processed recipes.
+        indexed: The content hash of each doc in the index, by ID. Emptied as
+            the docs are read.
+        counts: A defaultdict(int), counting new, changed, unchanged and
+            deleted docs as they go.
+
+    Yields:
+        Bulk actions (as accepted by BulkIndexer.index).
+
+    Raises:
+        RuntimeError: If there are no docs at all (e.g. an empty dump), rather
+            than deleting everything.
+    """
+    seen = set()
+    for doc in docs:
+        action = index_action(index, doc)
+        if action["_id"] in seen:
+            continue
+        seen.add(action["_id"])
+
+        old_hash = indexed.pop(action["_id"], None)
+        if old_hash == doc["contentHash"]:
+            counts["unchanged"] += 1
+            continue
+        counts["changed" if old_hash else "new"] += 1
+        yield action
+
+    if not seen and indexed:
+        raise RuntimeError(f"No docs were read, not deleting everything in {index}")
+
+    # Whatever's left wasn't in the stream any more
+    for deleted_id in indexed:
+        counts["deleted"] += 1
+        yield {"_op_type": "delete", "_index": index, "_id": deleted_id}
+
+
+def load_elastic_delta(index: str, docs: Iterable[dict], **bulk_options):
+    """Updates the index an alias points at with only the changes in a stream
+    of docs (see delta_actions).
+
+    Args:
+        index: The elasticsearch index alias to update ("recipes" in our case)
+        docs: The full set of processed recipes, as for load_elastic.
+        bulk_options: Options for the BulkIndexer (e.g. senders, chunk_bytes)
+    """
+    elastic_client = connect_elastic(maxsize=bulk_options.get("senders", 4))
+    (current_index,) = elastic_client.indices.get_alias(name=index)
+
+    logging.info(f"Reading content hashes from {current_index}...")
+    indexed = {
+        hit["_id"]: hit["_source"].get("contentHash")
+        for hit in helpers.scan(
+            elastic_client, index=current_index, _source=["contentHash"], size=5000
+        )
+    }
+    counts = defaultdict(int)
+
+    indexer = BulkIndexer(elastic_client, **bulk_options)
+    successes, failures = indexer.index(
+        delta_actions(current_index, docs, indexed, counts)
     )
-    if failures:
-        logging.error(f"Sent {successes} docs to {ES_INDEX} with {failures} failures")
-    else:
-        logging.info(f"Sent {successes} docs to {ES_INDEX} with no failures")
+    logging.info(
+        f"Delta for {current_index}: {counts['new']} new, {counts['changed']} changed,"
+        f" {counts['deleted']} deleted, {counts['unchanged']} unchanged"
+        f" ({successes} sent, {failures} failures)"
+    )
+
+    # Bump the generation marker so the web app drops its cached results
+    elastic_client.indices.refresh(index=current_index)
+    generation = f"{current_index}@{datetime.now(timezone.utc):%Y%m%d%H%M%S}"
+    elastic_client.indices.put_mapping(
+        index=current_index, body={"_meta": {"generation": generation}}
+    )
+
+
+def prune_indices(elastic_client: Elasticsearch, alias: str, keep: int):
+    """Deletes all but the newest versioned indices of an alias.
+
+    Indices the alias currently points at are never deleted.
+
+    Args:
+        elastic_client: The Elasticsearch client.
+        alias: The alias whose versioned indices (alias-<timestamp>) to prune.
+        keep: How many of the newest versioned indices to keep.
+    """
+    current = set(elastic_client.indices.get_alias(name=alias))
+    versions = sorted(elastic_client.indices.get(f"{alias}-*"), reverse=True)
+    for old_index in versions[keep:]:
+        if old_index not in current:
+            logging.info(f"Deleting old index {old_index}")
+            elastic_client.indices.delete(old_index)
 
 
 if __name__ == "__main__":
-    import logging
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="Load OpenRecipes into Elasticsearch")
+    parser.add_argument(
+        "--input",
+        default=RECIPES_URL,
+        help="URL or local path of the openRecipes dump",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        help="directory to cache the downloaded dump in (resumable, revalidated)",
+    )
+    parser.add_argument(
+        "--sha256",
+        help="expected sha256 checksum of the dump",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="number of processes to process recipes with",
+    )
+    parser.add_argument(
+        "--check-images",
+        action="store_true",
+        help="HEAD each recipe image and record imageStatus/imageCheckedAt",
+    )
+    parser.add_argument(
+        "--image-workers",
+        type=int,
+        default=32,
+        help="number of concurrent image checks",
+    )
+    parser.add_argument(
+        "--image-per-host",
+        type=int,
+        default=4,
+        help="maximum concurrent image checks against a single host",
+    )
+    parser.add_argument(
+        "--image-timeout",
+        type=float,
+        default=5.0,
+        help="seconds to wait for each image host",
+    )
+    parser.add_argument(
+        "--bulk-senders",
+        type=int,
+        default=4,
+        help="number of concurrent bulk requests",
+    )
+    parser.add_argument(
+        "--bulk-docs",
+        type=int,
+        default=5000,
+        help="maximum number of docs per bulk request",
+    )
+    parser.add_argument(
+        "--bulk-bytes",
+        type=int,
+        default=10 * 1024 * 1024,
+        help="maximum size of a bulk request in bytes",
+    )
+    parser.add_argument(
+        "--bulk-retries",
+        type=int,
+        default=5,
+        help="how many times to retry docs rejected with a 429",
+    )
+    parser.add_argument(
+        "--dead-letter",
+        default="dead-letter.jsonl",
+        help="file to write docs which failed to index to",
+    )
+    parser.add_argument(
+        "--delta",
+        action="store_true",
+        help="only send new, changed and deleted recipes to the current index",
+    )
+    parser.add_argument(
+        "--keep",
+        type=int,
+        default=2,
+        help="number of versioned recipe indices to keep",
+    )
+    parser.add_argument(
+        "--force-merge",
+        action="store_true",
+        help="force merge the new index into one segment before using it",
+    )
+    parser.add_argument(
+        "--max-failure-rate",
+        type=float,
+        default=MAX_FAILURE_RATE,
+        help="fraction of docs allowed to fail before the new index is abandoned",
+    )
+    parser.add_argument(
+        "--replay",
+        metavar="DEAD_LETTER_FILE",
+        help="only re-send the docs in a dead-letter file, then exit",
+    )
+    args = parser.parse_args()
+    bulk_options = dict(
+        senders=args.bulk_senders,
+        chunk_docs=args.bulk_docs,
+        chunk_bytes=args.bulk_bytes,
+        max_retries=args.bulk_retries,
+        dead_letter_path=args.dead_letter,
+    )
 
     logging.basicConfig(level=logging.INFO)
 
     logging.info("Loading configuration...")
 
-    random.seed(0)  # for the nutritional info we're generating
     with open("./recipe-mapping.json") as f:
         ES_MAPPING.update(json.load(f))
 
-    logging.info("Downloading recipe dump...")
-    recipes = download_file(RECIPES_URL)
+    if args.replay:
+        logging.info(f"Replaying {args.replay}...")
+        if os.path.abspath(args.replay) == os.path.abspath(args.dead_letter):
+            bulk_options["dead_letter_path"] = args.replay + ".retry"
+        indexer = BulkIndexer(connect_elastic(args.bulk_senders), **bulk_options)
+        successes, failures = indexer.index(read_dead_letters(args.replay))
+        logging.info(f"Replayed {successes} docs with {failures} failures")
+        sys.exit(1 if failures else 0)
+
+    # Each stage is a generator, so recipes stream through the whole pipeline
+    # (download -> decode -> process -> index) without being held in memory
+    if os.path.exists(args.input):
+        recipes = read_dump(args.input)
+    elif args.cache_dir:
+        recipes = read_dump(fetch_dump(args.input, args.cache_dir, args.sha256))
+    else:
+        recipes = download_file(args.input)
+
+    logging.info("Streaming recipe dump into Elastic...")
+    recipes = progress(recipes, "download")
+    if args.workers > 1:
+        recipes = progress(process_recipes_parallel(recipes, args.workers), "process")
+    else:
+        recipes = progress(process_recipes(recipes), "process")
 
-    logging.info(f"Processing {len(recipes)} recipes...")
-    recipes = list(filter(None, (process_recipe(r) for r in recipes)))
+    if args.check_images:
+        recipes = progress(
+            check_images(
+                recipes,
+                workers=args.image_workers,
+                per_host=args.image_per_host,
+                timeout=args.image_timeout,
+            ),
+            "check images",
+        )
 
-    logging.info(f"Sending {len(recipes)} docs to Elastic...")
-    load_elastic(index=ES_INDEX, mapping=ES_MAPPING, docs=recipes)
+    if args.delta:
+        load_elastic_delta(index=ES_INDEX, docs=recipes, **bulk_options)
+    else:
+        load_elastic(
+            index=ES_INDEX,
+            mapping=ES_MAPPING,
+            docs=recipes,
+            keep=args.keep,
+            force_merge=args.force_merge,
+            max_failure_rate=args.max_failure_rate,
+            **bulk_options,
+        )
 
     logging.info("Finished.")
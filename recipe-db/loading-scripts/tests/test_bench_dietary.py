@@ -0,0 +1,40 @@
+import contextlib
+import gzip
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import bench_dietary
+
+
+class BenchDietaryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_dump_benchmark_runs(self):
+        """Ensures the old-vs-new comparison runs against a (tiny) recipe dump"""
+        path = os.path.join(self.dir, "recipes.json.gz")
+        with gzip.open(path, "wt") as f:
+            for recipe in (
+                {"name": "Graham Cracker Crust", "ingredients": "1 cup graham crumbs"},
+                {"name": "Omelette", "ingredients": "2 eggs\n1 cup milk"},
+                {"name": "No ingredients", "ingredients": ""},
+            ):
+                f.write(json.dumps(recipe) + "\n")
+
+        self.assertEqual(len(bench_dietary.dump_recipes(path, 10)), 2)
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            bench_dietary.main(["--input", path, "--limit", "10"])
+        self.assertIn("1 of 2 recipes tagged differently", output.getvalue())
+        self.assertIn("'Graham Cracker Crust'", output.getvalue())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,138 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from elasticsearch import Elasticsearch
+
+import load
+from bench import StubBulkHandler, serve
+
+
+class FlakyBulkHandler(StubBulkHandler):
+    """Records every _bulk request, rejecting the document "busy" with a 429
+    the first time it's sent, and the documents in bad_ids for good."""
+
+    lock = threading.Lock()
+    requests = []  # the IDs sent in each request
+    bad_ids = set()
+
+    def bulk(self, body):
+        ids = [
+            meta.get("_id")
+            for line in body.splitlines()
+            for op_type, meta in json.loads(line).items()
+            if op_type in ("index", "delete")
+        ]
+        with self.lock:
+            self.requests.append(ids)
+        return super().bulk(body)
+
+    def item_result(self, op_type, meta):
+        with self.lock:
+            sent = sum(ids.count(meta["_id"]) for ids in self.requests)
+        if meta["_id"] == "busy" and sent == 1:
+            error = {"type": "es_rejected_execution_exception"}
+            return {"_id": meta["_id"], "status": 429, "error": error}
+        if meta["_id"] in self.bad_ids:
+            error = {"type": "mapper_parsing_exception", "reason": "bad calories"}
+            return {"_id": meta["_id"], "status": 400, "error": error}
+        return super().item_result(op_type, meta)
+
+
+def actions(*ids):
+    return [
+        {"_index": "recipes-1", "_id": i, "_source": {"name": f"Recipe {i}"}}
+        for i in ids
+    ]
+
+
+class BulkIndexerTestCase(unittest.TestCase):
+    def setUp(self):
+        FlakyBulkHandler.requests = []
+        FlakyBulkHandler.bad_ids = set()
+        self.server = serve(FlakyBulkHandler)
+        self.client = Elasticsearch([f"http://127.0.0.1:{self.server.server_port}"])
+        self.dir = tempfile.mkdtemp()
+        self.dead_letters = os.path.join(self.dir, "dead-letter.jsonl")
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.dir)
+
+    def indexer(self, **options):
+        options = {"senders": 1, "initial_backoff": 0, **options}
+        return load.BulkIndexer(
+            self.client, dead_letter_path=self.dead_letters, **options
+        )
+
+    def test_requests_are_split_by_docs(self):
+        indexer = self.indexer(chunk_docs=4)
+        ids = [str(i) for i in range(10)]
+        self.assertEqual(indexer.index(actions(*ids)), (10, 0))
+        self.assertEqual(
+            [len(request) for request in FlakyBulkHandler.requests], [4, 4, 2]
+        )
+
+    def test_requests_are_split_by_bytes(self):
+        """Ensures requests stay under chunk_bytes, but always hold a document"""
+        size = len(b"".join(c[2] for c in next(self.indexer()._chunks(actions("0")))))
+        indexer = self.indexer(chunk_bytes=2 * size)
+        self.assertEqual(indexer.index(actions(*"01234")), (5, 0))
+        self.assertEqual(
+            [len(request) for request in FlakyBulkHandler.requests], [2, 2, 1]
+        )
+
+        FlakyBulkHandler.requests = []
+        self.indexer(chunk_bytes=1).index(actions("a", "b"))
+        self.assertEqual(FlakyBulkHandler.requests, [["a"], ["b"]])
+
+    def test_rejected_docs_are_retried(self):
+        """Ensures only the documents rejected with a 429 are sent again"""
+        indexer = self.indexer()
+        self.assertEqual(indexer.index(actions("a", "busy", "b")), (3, 0))
+        self.assertEqual(FlakyBulkHandler.requests, [["a", "busy", "b"], ["busy"]])
+        self.assertFalse(os.path.exists(self.dead_letters))
+
+    def test_failed_docs_are_dead_lettered_and_replayed(self):
+        """Ensures permanent failures aren't retried, but are written to the
+        dead-letter file, which can be replayed once they're fixed"""
+        FlakyBulkHandler.bad_ids = {"bad"}
+        indexer = self.indexer()
+        self.assertEqual(indexer.index(actions("a", "bad")), (1, 1))
+        self.assertEqual(FlakyBulkHandler.requests, [["a", "bad"]])
+
+        with open(self.dead_letters) as f:
+            (entry,) = [json.loads(line) for line in f]
+        self.assertEqual(entry["error"]["type"], "mapper_parsing_exception")
+
+        replayed = list(load.read_dead_letters(self.dead_letters))
+        self.assertEqual(
+            replayed,
+            [{"_op_type": "index", **actions("bad")[0]}],
+        )
+
+        FlakyBulkHandler.bad_ids = set()
+        FlakyBulkHandler.requests = []
+        self.assertEqual(self.indexer().index(replayed), (1, 0))
+        self.assertEqual(FlakyBulkHandler.requests, [["bad"]])
+
+    def test_deletes_are_replayed_without_a_source(self):
+        FlakyBulkHandler.bad_ids = {"gone"}
+        delete = {"_op_type": "delete", "_index": "recipes-1", "_id": "gone"}
+        self.indexer().index([delete])
+        self.assertEqual(list(load.read_dead_letters(self.dead_letters)), [delete])
+
+    def test_out_of_retries(self):
+        """Ensures documents still rejected after max_retries are dead-lettered"""
+        indexer = self.indexer(max_retries=0)
+        self.assertEqual(indexer.index(actions("busy")), (0, 1))
+        with open(self.dead_letters) as f:
+            self.assertIn("429", json.loads(f.readline())["error"])
+
+
+if __name__ == "__main__":
+    unittest.main()
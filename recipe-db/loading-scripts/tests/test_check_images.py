@@ -0,0 +1,81 @@
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler
+
+import load
+from bench import serve
+
+# Image paths on the test server, and the status each one responds with
+STATUSES = {"/ok.jpg": 200, "/gone.jpg": 404, "/down.jpg": 503, "/busy.jpg": 429}
+
+
+class ImageHandler(BaseHTTPRequestHandler):
+    def do_HEAD(self):
+        self.send_response(STATUSES.get(self.path, 404))
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class CheckImagesTestCase(unittest.TestCase):
+    def setUp(self):
+        self.server = serve(ImageHandler)
+        self.base = f"http://127.0.0.1:{self.server.server_port}"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_check_image(self):
+        """Ensures only definite failures mark an image broken"""
+        self.assertEqual(load.check_image(f"{self.base}/ok.jpg", 5), load.IMAGE_OK)
+        self.assertEqual(
+            load.check_image(f"{self.base}/gone.jpg", 5), load.IMAGE_BROKEN
+        )
+        self.assertEqual(load.check_image("not a url", 5), load.IMAGE_BROKEN)
+        for path in ("/down.jpg", "/busy.jpg"):
+            self.assertIsNone(load.check_image(self.base + path, 5))
+
+    def test_unknown_status_is_left_unset(self):
+        """Ensures images which couldn't be checked are left for the app to probe"""
+        recipes = [
+            {"name": "a", "image": f"{self.base}/ok.jpg"},
+            {"name": "b", "image": f"{self.base}/down.jpg"},
+            {"name": "c"},
+        ]
+        a, b, c = load.check_images(recipes, workers=2)
+        self.assertEqual(a["imageStatus"], load.IMAGE_OK)
+        self.assertIn("imageCheckedAt", a)
+        self.assertNotIn("imageStatus", b)
+        self.assertNotIn("imageCheckedAt", b)
+        self.assertEqual(c["imageStatus"], load.IMAGE_MISSING)
+
+
+class HostLimiterTestCase(unittest.TestCase):
+    def test_slow_host_leaves_workers_free(self):
+        """Ensures jobs queued for a busy host don't take up pool threads"""
+        release = threading.Event()
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            limiter = load.HostLimiter(pool, per_host=1)
+            slow = [limiter.submit("slow", release.wait, 10) for _ in range(3)]
+            fast = limiter.submit("fast", lambda: "done")
+
+            self.assertEqual(fast.result(timeout=5), "done")
+            self.assertFalse(any(future.done() for future in slow))
+            release.set()
+            self.assertTrue(all(future.result(timeout=5) for future in slow))
+
+    def test_errors_free_the_slot(self):
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            limiter = load.HostLimiter(pool, per_host=1)
+            failed = limiter.submit("host", int, "nope")
+            after = limiter.submit("host", int, "1")
+            with self.assertRaises(ValueError):
+                failed.result(timeout=5)
+            self.assertEqual(after.result(timeout=5), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
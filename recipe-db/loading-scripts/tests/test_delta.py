@@ -0,0 +1,77 @@
+import unittest
+from collections import defaultdict
+
+import load
+
+
+def recipe(url, name):
+    return {"url": url, "name": name, "ingredients": ["1 egg"]}
+
+
+class DeltaTestCase(unittest.TestCase):
+    def test_recipe_ids_are_stable(self):
+        """Ensures IDs depend on the URL only, so edits keep their ID"""
+        self.assertEqual(
+            load.recipe_id(recipe("http://a", "Dip")),
+            load.recipe_id(recipe("http://a", "Better Dip")),
+        )
+        self.assertNotEqual(
+            load.recipe_id(recipe("http://a", "Dip")),
+            load.recipe_id(recipe("http://b", "Dip")),
+        )
+
+    def test_index_action_stores_id(self):
+        """Ensures the ID is also in the source, as the keyword searches sort on"""
+        action = load.index_action("recipes-1", recipe("http://a", "Dip"))
+        self.assertEqual(action["_id"], load.recipe_id(recipe("http://a", "Dip")))
+        self.assertEqual(action["_source"]["recipeId"], action["_id"])
+        self.assertEqual(
+            action["_source"]["contentHash"],
+            load.content_hash(recipe("http://a", "Dip")),
+        )
+
+    def test_content_hash_ignores_check_time(self):
+        a = {**recipe("http://a", "Dip"), "imageCheckedAt": "2020-11-18T00:00:00"}
+        b = {**recipe("http://a", "Dip"), "imageCheckedAt": "2020-11-19T00:00:00"}
+        self.assertEqual(load.content_hash(a), load.content_hash(b))
+
+    def test_delta_actions(self):
+        """Ensures only new and changed docs are indexed, and docs which are
+        gone from the dump are deleted"""
+        unchanged = recipe("http://a", "Dip")
+        changed = recipe("http://b", "Soup")
+        indexed = {
+            load.recipe_id(unchanged): load.content_hash(dict(unchanged)),
+            load.recipe_id(changed): load.content_hash(dict(changed)),
+            "gone": "somehash",
+        }
+        docs = [
+            dict(unchanged),
+            {**changed, "ingredients": ["2 eggs"]},
+            recipe("http://c", "Salad"),
+            recipe("http://c", "Salad"),  # duplicates are only sent once
+        ]
+        counts = defaultdict(int)
+        actions = list(load.delta_actions("recipes-1", docs, indexed, counts))
+
+        self.assertEqual(
+            [(a.get("_op_type", "index"), a["_id"]) for a in actions],
+            [
+                ("index", load.recipe_id(changed)),
+                ("index", load.recipe_id(recipe("http://c", "Salad"))),
+                ("delete", "gone"),
+            ],
+        )
+        self.assertEqual(actions[0]["_source"]["ingredients"], ["2 eggs"])
+        self.assertTrue(all(a["_index"] == "recipes-1" for a in actions))
+        self.assertEqual(counts, {"unchanged": 1, "changed": 1, "new": 1, "deleted": 1})
+
+    def test_empty_dump_deletes_nothing(self):
+        """Ensures an empty dump is an error rather than a delete of every doc"""
+        actions = load.delta_actions("recipes-1", [], {"a": "x"}, defaultdict(int))
+        with self.assertRaises(RuntimeError):
+            next(actions)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+import unittest
+
+import load
+from dietary import DietaryTagger, plural_forms
+
+RULES = {
+    "gluten-free": {"excludes": ["flour", "loaf"]},
+    "vegetarian": {"excludes": ["ham", "chicken", "chicken stock"]},
+    "vegan": {"requires": ["vegetarian"], "excludes": ["egg", "ice cream"]},
+}
+
+
+class DietaryTaggerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tagger = DietaryTagger(RULES)
+
+    def test_whole_words(self):
+        """Ensures keywords only match whole words, e.g. "ham" but not "graham"
+        and "egg" but not "eggplant\" """
+        self.assertEqual(
+            self.tagger.tag("Graham cracker crust", "1 eggplant"),
+            ["gluten-free", "vegetarian", "vegan"],
+        )
+        self.assertEqual(
+            self.tagger.tag("Ham and cheese", "2 slices HAM"), ["gluten-free"]
+        )
+        self.assertEqual(self.tagger.tag("Egg salad"), ["gluten-free", "vegetarian"])
+
+    def test_plurals(self):
+        self.assertEqual(
+            plural_forms("berry"), ["berry", "berrys", "berryes", "berries"]
+        )
+        self.assertEqual(self.tagger.tag("2 eggs"), ["gluten-free", "vegetarian"])
+        self.assertEqual(self.tagger.tag("Honey glazed hams"), ["gluten-free"])
+        self.assertEqual(self.tagger.tag("Mini loafs"), ["vegetarian", "vegan"])
+
+    def test_multi_word_keywords(self):
+        """Ensures multi-word keywords match as a phrase, with a plural last word"""
+        self.assertEqual(
+            self.tagger.tag("Vanilla ice creams"), ["gluten-free", "vegetarian"]
+        )
+        self.assertEqual(
+            self.tagger.tag("Iced cream soda", "ice cubes", "sour cream"),
+            ["gluten-free", "vegetarian", "vegan"],
+        )
+
+    def test_requires(self):
+        """Ensures a tag only applies if the tags it requires do too"""
+        self.assertEqual(self.tagger.tag("Roast chicken"), ["gluten-free"])
+        tagger = DietaryTagger({"vegan": {"requires": ["vegetarian"]}})
+        self.assertEqual(tagger.tag("Anything"), [])
+
+
+class DietaryTagsTestCase(unittest.TestCase):
+    """Tests for the rules the loader actually uses (dietary-tags.json)"""
+
+    def test_compound_words(self):
+        """Ensures compound words the old substring scan caught still rule
+        tags out"""
+        tag = load.DIETARY_TAGGER.tag
+        self.assertNotIn("vegetarian", tag("Bacon cheeseburgers"))
+        self.assertNotIn("vegan", tag("Cheeseburger soup"))
+        self.assertNotIn("vegan", tag("Holiday eggnog"))
+        self.assertEqual(tag("Mom's meatloaf"), [])
+        self.assertNotIn("vegetarian", tag("Swedish meatballs"))
+        self.assertNotIn("vegetarian", tag("Blackened catfish"))
+
+    def test_word_boundaries(self):
+        tag = load.DIETARY_TAGGER.tag
+        self.assertIn("vegetarian", tag("Graham cracker pie crust"))
+        self.assertIn("vegan", tag("Roasted eggplant", "1 cup chickpeas"))
+
+
+if __name__ == "__main__":
+    unittest.main()
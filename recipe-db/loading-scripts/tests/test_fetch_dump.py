@@ -0,0 +1,160 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+from http.server import BaseHTTPRequestHandler
+from urllib.error import HTTPError, URLError
+
+import load
+from bench import serve
+
+
+class DumpHandler(BaseHTTPRequestHandler):
+    """Serves DumpHandler.content at any path, with an ETag, conditional and
+    range requests, like S3 does. Settings are reset by each test."""
+
+    content = b""
+    etag = '"1"'
+    status = None  # respond with this error status instead, if set
+    truncate = False  # stop halfway through the next full response
+    requests = []  # the headers of each request
+
+    def do_GET(self):
+        type(self).requests.append(dict(self.headers))
+        if self.status:
+            return self.send_error(self.status)
+        if self.headers.get("If-None-Match") == self.etag:
+            return self.reply(304)
+
+        start = 0
+        range_ = self.headers.get("Range")
+        if range_ and self.headers.get("If-Range", self.etag) == self.etag:
+            start = int(range_[len("bytes=") : -1])
+            if start >= len(self.content):
+                return self.reply(416)
+
+        body = self.content[start:]
+        self.reply(206 if start else 200, len(body))
+        if self.truncate:
+            type(self).truncate = False
+            body = body[: len(body) // 2]
+        self.wfile.write(body)
+
+    def reply(self, status, length=0):
+        self.send_response(status)
+        self.send_header("ETag", self.etag)
+        self.send_header("Content-Length", str(length))
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FetchDumpTestCase(unittest.TestCase):
+    def setUp(self):
+        DumpHandler.content = os.urandom(3000)
+        DumpHandler.etag = '"1"'
+        DumpHandler.status = None
+        DumpHandler.truncate = False
+        DumpHandler.requests = []
+        self.server = serve(DumpHandler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/dump.json.gz"
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "dump.json.gz")
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.dir)
+
+    def fetch(self, sha256=None):
+        path = load.fetch_dump(self.url, self.dir, sha256)
+        with open(path, "rb") as f:
+            return path, f.read()
+
+    def test_download_and_revalidate(self):
+        """Ensures a cached dump is only downloaded again once it changes"""
+        self.assertEqual(self.fetch(), (self.path, DumpHandler.content))
+        self.assertEqual(self.fetch(), (self.path, DumpHandler.content))
+        self.assertEqual(DumpHandler.requests[-1]["If-None-Match"], '"1"')
+        self.assertEqual(
+            sorted(os.listdir(self.dir)), ["dump.json.gz", "dump.json.gz.meta.json"]
+        )
+
+        DumpHandler.content, DumpHandler.etag = b"new dump", '"2"'
+        self.assertEqual(self.fetch(), (self.path, b"new dump"))
+
+    def test_resume(self):
+        """Ensures an interrupted download picks up where it left off"""
+        DumpHandler.truncate = True
+        with self.assertRaises(ConnectionError):
+            self.fetch()
+        self.assertFalse(os.path.exists(self.path))
+
+        self.assertEqual(self.fetch(), (self.path, DumpHandler.content))
+        self.assertEqual(DumpHandler.requests[-1]["Range"], "bytes=1500-")
+        self.assertEqual(DumpHandler.requests[-1]["If-Range"], '"1"')
+
+    def test_resume_after_change(self):
+        """Ensures a part file of an old version of the dump isn't resumed"""
+        DumpHandler.truncate = True
+        with self.assertRaises(ConnectionError):
+            self.fetch()
+        DumpHandler.content, DumpHandler.etag = os.urandom(3000), '"2"'
+        self.assertEqual(self.fetch(), (self.path, DumpHandler.content))
+
+    def test_complete_part_file(self):
+        """Ensures a complete part file (e.g. the last run died before renaming
+        it) is downloaded again, not resumed forever"""
+        with open(self.path + ".part", "wb") as f:
+            f.write(DumpHandler.content)
+        with open(self.path + ".part.meta.json", "w") as f:
+            f.write('{"etag": "\\"1\\""}')
+
+        self.assertEqual(self.fetch(), (self.path, DumpHandler.content))
+        self.assertEqual(DumpHandler.requests[0]["Range"], "bytes=3000-")
+        self.assertNotIn("Range", DumpHandler.requests[1])
+
+    def test_checksum(self):
+        """Ensures a download which doesn't match its checksum isn't kept"""
+        with self.assertRaises(ValueError):
+            self.fetch(sha256="0" * 64)
+        self.assertEqual(os.listdir(self.dir), [])
+
+        sha256 = hashlib.sha256(DumpHandler.content).hexdigest()
+        self.assertEqual(self.fetch(sha256=sha256)[1], DumpHandler.content)
+
+    def test_corrupted_cache(self):
+        """Ensures a cached dump which has changed on disk isn't used"""
+        self.fetch()
+        with open(self.path, "ab") as f:
+            f.write(b"junk")
+        with self.assertRaises(ValueError):
+            self.fetch()
+
+    def test_server_errors_use_cache(self):
+        """Ensures the cached dump is used if the server has problems, and that
+        there's an error if nothing's cached"""
+        DumpHandler.status = 503
+        with self.assertRaises(HTTPError):
+            self.fetch()
+
+        DumpHandler.status = None
+        self.fetch()
+        DumpHandler.status = 503
+        self.assertEqual(self.fetch(), (self.path, DumpHandler.content))
+
+    def test_offline_uses_cache(self):
+        self.fetch()
+        self.server.shutdown()
+        self.server.server_close()
+        self.assertEqual(self.fetch(), (self.path, DumpHandler.content))
+
+        shutil.rmtree(self.dir)
+        with self.assertRaises(URLError):
+            self.fetch()
+
+
+if __name__ == "__main__":
+    unittest.main()
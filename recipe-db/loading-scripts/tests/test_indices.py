@@ -0,0 +1,118 @@
+import unittest
+from unittest import mock
+
+import load
+
+
+def mock_client(indices, aliased):
+    """Returns a mock Elasticsearch client with the given versioned recipe
+    indices, of which aliased are behind the recipes alias."""
+    client = mock.Mock()
+    client.indices.get.return_value = {index: {} for index in indices}
+    client.indices.get_alias.return_value = {index: {} for index in aliased}
+    client.indices.exists_alias.return_value = bool(aliased)
+    return client
+
+
+class PruneIndicesTestCase(unittest.TestCase):
+    def deleted(self, client):
+        return [c[0][0] for c in client.indices.delete.call_args_list]
+
+    def test_keeps_newest(self):
+        indices = [f"recipes-2020111{i}000000" for i in range(5)]
+        client = mock_client(indices, aliased=indices[-1:])
+        load.prune_indices(client, "recipes", keep=2)
+        self.assertEqual(self.deleted(client), indices[2::-1])
+
+    def test_never_deletes_aliased_index(self):
+        """Ensures the index the alias points at survives, even if it isn't one
+        of the newest (e.g. after rolling the alias back)"""
+        indices = [f"recipes-2020111{i}000000" for i in range(5)]
+        client = mock_client(indices, aliased=[indices[0]])
+        load.prune_indices(client, "recipes", keep=1)
+        self.assertEqual(self.deleted(client), indices[3:0:-1])
+
+
+class LoadElasticTestCase(unittest.TestCase):
+    @mock.patch.object(load, "BulkIndexer")
+    @mock.patch.object(load, "connect_elastic")
+    def test_alias_moves_to_new_index(self, connect_elastic, bulk_indexer):
+        """Ensures the alias moves to the new index in a single update, which
+        also takes it off the old one"""
+        client = connect_elastic.return_value = mock_client(
+            ["recipes-20201110000000"], aliased=["recipes-20201110000000"]
+        )
+        bulk_indexer.return_value.index.return_value = (1, 0)
+        load.load_elastic("recipes", {}, [{"name": "Dip"}], keep=2)
+
+        new_index = client.indices.create.call_args[0][0]
+        self.assertRegex(new_index, r"^recipes-\d{14}$")
+        client.indices.update_aliases.assert_called_once_with(
+            body={
+                "actions": [
+                    {"add": {"index": new_index, "alias": "recipes"}},
+                    {"remove": {"index": "recipes-20201110000000", "alias": "recipes"}},
+                ]
+            }
+        )
+
+    @mock.patch.object(load, "BulkIndexer")
+    @mock.patch.object(load, "connect_elastic")
+    def test_failed_load_keeps_alias(self, connect_elastic, bulk_indexer):
+        """Ensures a load where nothing was indexed leaves the alias alone"""
+        client = connect_elastic.return_value = mock_client(
+            ["recipes-20201110000000"], aliased=["recipes-20201110000000"]
+        )
+        bulk_indexer.return_value.index.return_value = (0, 1)
+        with self.assertRaises(RuntimeError):
+            load.load_elastic("recipes", {}, [{"name": "Dip"}])
+
+        new_index = client.indices.create.call_args[0][0]
+        client.indices.delete.assert_called_once_with(new_index)
+        client.indices.update_aliases.assert_not_called()
+
+    @mock.patch.object(load, "BulkIndexer")
+    @mock.patch.object(load, "connect_elastic")
+    def test_too_many_failures_keeps_alias(self, connect_elastic, bulk_indexer):
+        """Ensures a load where more than max_failure_rate of the docs failed
+        is abandoned, rather than replacing a complete index"""
+        client = connect_elastic.return_value = mock_client(
+            ["recipes-20201110000000"], aliased=["recipes-20201110000000"]
+        )
+        bulk_indexer.return_value.index.return_value = (98, 2)
+        with self.assertRaises(RuntimeError):
+            load.load_elastic("recipes", {}, [{"name": "Dip"}], max_failure_rate=0.01)
+
+        new_index = client.indices.create.call_args[0][0]
+        client.indices.delete.assert_called_once_with(new_index)
+        client.indices.update_aliases.assert_not_called()
+
+        client.reset_mock()
+        load.load_elastic("recipes", {}, [{"name": "Dip"}], max_failure_rate=0.05)
+        client.indices.update_aliases.assert_called_once()
+
+    @mock.patch.object(load, "BulkIndexer")
+    @mock.patch.object(load, "connect_elastic")
+    def test_error_deletes_new_index(self, connect_elastic, bulk_indexer):
+        """Ensures an error part way through a load (e.g. reading the dump)
+        deletes the half-built index, and the error isn't swallowed"""
+        client = connect_elastic.return_value = mock_client(
+            ["recipes-20201110000000"], aliased=["recipes-20201110000000"]
+        )
+
+        def docs():
+            yield {"name": "Dip"}
+            raise OSError("Truncated dump")
+
+        bulk_indexer.return_value.index.side_effect = lambda actions: list(actions)
+        client.indices.delete.side_effect = ConnectionError("Elasticsearch is down")
+        with self.assertRaisesRegex(OSError, "Truncated dump"):
+            load.load_elastic("recipes", {}, docs())
+
+        new_index = client.indices.create.call_args[0][0]
+        client.indices.delete.assert_called_once_with(new_index)
+        client.indices.update_aliases.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
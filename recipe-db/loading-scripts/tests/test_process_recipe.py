@@ -0,0 +1,118 @@
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import load
+
+MAPPING_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "recipe-mapping.json"
+)
+
+
+def setUpModule():
+    """Loads the mapping process_recipe keeps fields from, as load.py's main does"""
+    with open(MAPPING_PATH) as f:
+        load.ES_MAPPING.update(json.load(f))
+
+
+def raw_recipe(**fields):
+    """Returns a recipe as read from the openRecipes dump"""
+    return {
+        "name": "Lentil Soup",
+        "url": "http://example.com/lentil-soup",
+        "ingredients": "1 cup lentils\n4 cups vegetable stock",
+        **fields,
+    }
+
+
+class ParseDurationTestCase(unittest.TestCase):
+    def test_durations(self):
+        self.assertEqual(load.parse_duration("PT1H30M"), 90)
+        self.assertEqual(load.parse_duration("P1DT2H"), 26 * 60)
+        self.assertEqual(load.parse_duration("PT15M"), 15)
+        self.assertEqual(load.parse_duration(" pt5m "), 5)
+
+    def test_empty_durations(self):
+        for value in ("PT", "P", "", None):
+            self.assertIsNone(load.parse_duration(value), value)
+
+    def test_seconds_are_rounded(self):
+        """Ensures seconds are rounded to the nearest minute, halves up"""
+        self.assertEqual(load.parse_duration("PT20S"), 0)
+        self.assertEqual(load.parse_duration("PT30S"), 1)
+        self.assertEqual(load.parse_duration("PT2M30S"), 3)
+        self.assertEqual(load.parse_duration("PT1M89S"), 2)
+
+    def test_malformed_durations(self):
+        for value in ("1 hour", "PT1.5H", "PT-5M", "T1H", "PT1H30", "P1H"):
+            self.assertIsNone(load.parse_duration(value), value)
+
+    def test_out_of_range_durations(self):
+        """Ensures implausibly long durations (bad data) are dropped"""
+        self.assertEqual(load.parse_duration("P365D"), load.MAX_DURATION_MINUTES)
+        self.assertIsNone(load.parse_duration("P366D"))
+        self.assertIsNone(load.parse_duration("PT99999999H"))
+
+
+class ProcessRecipeTestCase(unittest.TestCase):
+    def test_minute_fields(self):
+        recipe = load.process_recipe(
+            raw_recipe(prepTime="PT10M", cookTime="PT1H", totalTime="PT1H30M")
+        )
+        self.assertEqual(recipe["prepMinutes"], 10)
+        self.assertEqual(recipe["cookMinutes"], 60)
+        self.assertEqual(recipe["totalMinutes"], 90)
+
+    def test_total_from_prep_and_cook(self):
+        """Ensures a missing total time is the prep time plus the cook time"""
+        recipe = load.process_recipe(raw_recipe(prepTime="PT10M", cookTime="PT1H"))
+        self.assertEqual(recipe["totalMinutes"], 70)
+
+        recipe = load.process_recipe(
+            raw_recipe(prepTime="PT10M", cookTime="PT1H", totalTime="garbage")
+        )
+        self.assertEqual(recipe["totalMinutes"], 70)
+
+    def test_no_total_without_both_parts(self):
+        recipe = load.process_recipe(raw_recipe(prepTime="PT10M", cookTime=""))
+        self.assertEqual(recipe["prepMinutes"], 10)
+        self.assertNotIn("cookMinutes", recipe)
+        self.assertNotIn("totalMinutes", recipe)
+
+
+class ProcessRecipesParallelTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "recipes.json.gz")
+        with gzip.open(self.path, "wt") as f:
+            for i in range(25):
+                recipe = raw_recipe(
+                    name=f"Recipe {i}",
+                    url=f"http://example.com/recipe-{i}",
+                    ingredients=f"{i + 1} cups flour\n2 eggs\n{i} slices ham",
+                    prepTime=f"PT{i}M",
+                    cookTime="PT1H",
+                )
+                if i % 7 == 0:
+                    recipe["ingredients"] = "1 cup 1 cup"  # dropped as badly parsed
+                f.write(json.dumps(recipe) + "\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_same_as_serial(self):
+        """Ensures the worker pool processes a dump exactly as process_recipes does"""
+        expected = list(load.process_recipes(load.read_dump(self.path)))
+        self.assertEqual(len(expected), 21)
+
+        for workers in (1, 3):
+            recipes = load.read_dump(self.path)
+            processed = load.process_recipes_parallel(recipes, workers, chunk_size=4)
+            self.assertEqual(list(processed), expected, f"{workers} workers")
+
+
+if __name__ == "__main__":
+    unittest.main()